@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+default_app_config = 'album_creator.apps.AlbumCreatorConfig'
@@ -3,7 +3,9 @@ from __future__ import unicode_literals
 
 from django.contrib import admin
 
-from .models import Album, Image, AlbumImageRelation
+from .counters import repair_album_counters
+from .jobs import enqueue_import
+from .models import Album, Image, AlbumImageRelation, ImportJob, ImportNotification
 
 
 class AlbumImageInline(admin.StackedInline):
@@ -23,15 +25,43 @@ class AlbumImageInline(admin.StackedInline):
 
 @admin.register(Album)
 class AlbumAdmin(admin.ModelAdmin):
-    list_display = ('name', 'images_count', )
+    list_display = ('name', 'image_count', 'last_imported_at', )
+    # the import state is not saved by the admin, see Album.denormalized_fields
+    readonly_fields = ('image_count', 'last_tweet_id', 'last_imported_at', 'cover_image',
+                       'backfill_max_id', 'backfill_completed_at', )
     inlines = (AlbumImageInline, )
+    actions = ('schedule_backfill', 'repair_counters', )
 
-    def images_count(self, obj):
-        return obj.images.count()
-    images_count.short_description = 'Images count'
+    def schedule_backfill(self, request, queryset):
+        for album in queryset:
+            enqueue_import(album, mode=ImportJob.MODE_BACKFILL)
+        self.message_user(request, 'Import of older tweets has been scheduled.')
+    schedule_backfill.short_description = 'Import older tweets'
+
+    def repair_counters(self, request, queryset):
+        repaired_count = repair_album_counters(queryset)
+        self.message_user(request, 'Counters of {} album(s) were repaired.'.format(
+            repaired_count))
+    repair_counters.short_description = 'Repair images counters'
 
 
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
     inlines = (AlbumImageInline, )
     fields = ('image_file', 'original_image_url', )
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('album', 'mode', 'status', 'attempts', 'run_after', 'leased_by',
+                    'imported_count', 'created_at', 'finished_at', )
+    list_filter = ('status', 'mode', )
+    list_select_related = ('album', )
+
+
+@admin.register(ImportNotification)
+class ImportNotificationAdmin(admin.ModelAdmin):
+    list_display = ('album', 'status', 'attempts', 'send_after', 'created_at', 'sent_at', )
+    list_filter = ('status', )
+    list_select_related = ('album', )
+    raw_id_fields = ('images', )
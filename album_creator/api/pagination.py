@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, _positive_int
+
+
+class SizedCursorPagination(CursorPagination):
+    """
+    Cursor pagination with the page size controlled by the client, the same
+    way as in the page number pagination.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+
+class AlbumCursorPagination(SizedCursorPagination):
+    ordering = 'name'
+    page_size = getattr(settings, 'API_ALBUMS_PAGE_SIZE', 20)
+
+
+class AlbumImagesCursorPagination(SizedCursorPagination):
+    # the newest images first, a tweet has a single image in the album
+    ordering = '-tweet_id'
+    page_size = getattr(settings, 'API_ALBUM_IMAGES_PAGE_SIZE', 50)
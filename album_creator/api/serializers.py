@@ -2,14 +2,25 @@
 from __future__ import unicode_literals
 
 from rest_framework import serializers
-from ..models import Album, Image, AlbumImageRelation
+from rest_framework.reverse import reverse
+from ..models import Album, Image, AlbumImageRelation, Rendition
+
+
+class RenditionSerializer(serializers.ModelSerializer):
+    url = serializers.ImageField(source='rendition_file')
+
+    class Meta:
+        model = Rendition
+        fields = ('url', 'format', 'width', 'height',)
 
 
 class ImageInfoSerializer(serializers.ModelSerializer):
+    # should be prefetched, see ..renditions
+    renditions = RenditionSerializer(many=True)
 
     class Meta:
         model = Image
-        fields = ('image_file', 'original_image_url',)
+        fields = ('image_file', 'original_image_url', 'renditions',)
 
 
 class ImageRelationInfoSerializer(serializers.ModelSerializer):
@@ -21,8 +32,19 @@ class ImageRelationInfoSerializer(serializers.ModelSerializer):
 
 
 class AlbumInfoSerializer(serializers.ModelSerializer):
-    images = ImageInfoSerializer(many=True)
+    # the newest images of the album, read by the view, see
+    # AlbumListApiView.paginate_queryset, all of them are listed at images_url
+    images = serializers.SerializerMethodField()
+    images_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Album
-        fields = ('name', 'images',)
+        fields = ('name', 'images', 'images_url',)
+
+    def get_images(self, album_instance):
+        images = [relation.image for relation in album_instance.recent_image_relations]
+        return ImageInfoSerializer(images, many=True, context=self.context).data
+
+    def get_images_url(self, album_instance):
+        return reverse('album-api:album-images', kwargs={'album_name': album_instance.name},
+                       request=self.context.get('request'))
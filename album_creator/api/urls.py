@@ -3,9 +3,11 @@ from __future__ import unicode_literals
 
 from django.conf.urls import url
 
-from .views import AlbumListApiView
+from .views import AlbumListApiView, AlbumImagesApiView
 
 
 urlpatterns = [
     url(r'^$', AlbumListApiView.as_view(), name='album-list'),
-]
\ No newline at end of file
+    url(r'^(?P<album_name>[a-zA-Z]+)/images/$', AlbumImagesApiView.as_view(),
+        name='album-images'),
+]
@@ -1,13 +1,157 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.db.models.query import prefetch_related_objects
+from django.shortcuts import get_object_or_404
 from rest_framework.generics import ListAPIView
+from rest_framework.pagination import _positive_int
+from rest_framework.response import Response
 
-from ..models import Album
-from .serializers import AlbumInfoSerializer
+from ..caching import get_or_build
+from ..models import Album, AlbumImageRelation
+from ..profiling import profile_section
+from ..versioning import ConditionalGetMixin, get_album_version, get_albums_version
+from .pagination import AlbumCursorPagination, AlbumImagesCursorPagination
+from .serializers import AlbumInfoSerializer, ImageRelationInfoSerializer
 
 
-class AlbumListApiView(ListAPIView):
-    queryset = Album.objects.all()
+class RawSubquery(RawSQL):
+    """
+    Raw SQL subquery for the __in lookups, which put it in parentheses
+    themselves: a compound select in double parentheses would be read as a
+    single value.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def get_recent_image_relations_sql(album_pks, images_limit):
+    """
+    Builds the query of the pks of the newest images_limit image relations of
+    every album: a UNION ALL of a limited query per album, each of them is an
+    index range scan of the album timeline (album, tweet_id), so the cost does
+    not depend on the size of the albums. Django 1.9 has no union() nor window
+    functions, hence the raw SQL.
+    :param album_pks: list of int album pks
+    :param images_limit: int maximum number of relations per album
+    :return: tuple (str sql, list params)
+    """
+    qn = connection.ops.quote_name
+    album_query = (
+        'SELECT {pk} FROM (SELECT {pk} FROM {table} WHERE {album} = %s '
+        'ORDER BY {tweet_id} DESC, {pk} DESC LIMIT %s) recent_{{index}}'.format(
+            pk=qn(AlbumImageRelation._meta.pk.column),
+            table=qn(AlbumImageRelation._meta.db_table),
+            album=qn(AlbumImageRelation._meta.get_field('album').column),
+            tweet_id=qn(AlbumImageRelation._meta.get_field('tweet_id').column)))
+    sql = ' UNION ALL '.join(album_query.format(index=index)
+                             for index in range(len(album_pks)))
+    params = []
+    for album_pk in album_pks:
+        params.extend((album_pk, images_limit))
+    return sql, params
+
+
+def attach_recent_image_relations(albums, images_limit):
+    """
+    Sets recent_image_relations of every album to its newest images_limit image
+    relations, read for all the albums with a single query, see
+    get_recent_image_relations_sql, the renditions of all the images are read
+    with one more query.
+    :param albums: list of Album, a page of albums
+    :param images_limit: int maximum number of relations per album
+    :return: None
+    """
+    recent_image_relations = {album_instance.pk: [] for album_instance in albums}
+    relations = []
+    if albums and images_limit > 0:
+        relations = list(
+            AlbumImageRelation.objects
+                              .filter(pk__in=RawSubquery(*get_recent_image_relations_sql(
+                                  list(recent_image_relations), images_limit)))
+                              .select_related('image')
+                              .order_by('-tweet_id', '-pk'))
+        prefetch_related_objects([relation.image for relation in relations],
+                                 ['renditions'])
+    for relation in relations:
+        recent_image_relations[relation.album_id].append(relation)
+    for album_instance in albums:
+        album_instance.recent_image_relations = recent_image_relations[album_instance.pk]
+
+
+class CachedListMixin(ConditionalGetMixin):
+    """
+    Serializes every page once for every version of the content, see .caching.
+    The pages are cached by their absolute url, that covers the query
+    parameters and the links to the other pages.
+    """
+
+    def list(self, request, *args, **kwargs):
+        data = get_or_build(
+            'api-{}'.format(type(self).__name__), self.get_content_version(),
+            (request.build_absolute_uri(),),
+            lambda: self.build_list_data(request, *args, **kwargs))
+        return Response(data)
+
+    def build_list_data(self, request, *args, **kwargs):
+        # the page queries are run while the page is serialized
+        with profile_section('serializer'):
+            return super(CachedListMixin, self).list(request, *args, **kwargs).data
+
+
+class AlbumListApiView(CachedListMixin, ListAPIView):
+    """
+    Albums with their newest images, ?images_limit= sets the number of images
+    per album.
+    """
     serializer_class = AlbumInfoSerializer
+    pagination_class = AlbumCursorPagination
+    images_limit_query_param = 'images_limit'
+
+    def get_images_limit(self):
+        default_limit = getattr(settings, 'API_ALBUM_IMAGES_LIMIT', 10)
+        max_limit = getattr(settings, 'API_ALBUM_IMAGES_MAX_LIMIT', 100)
+        try:
+            return _positive_int(
+                self.request.query_params[self.images_limit_query_param],
+                cutoff=max_limit,
+            )
+        except (KeyError, ValueError):
+            return default_limit
+
+    def get_version(self):
+        return get_albums_version()
+
+    def get_queryset(self):
+        return Album.objects.all()
+
+    def paginate_queryset(self, queryset):
+        albums = super(AlbumListApiView, self).paginate_queryset(queryset)
+        attach_recent_image_relations(albums, self.get_images_limit())
+        return albums
+
+
+class AlbumImagesApiView(CachedListMixin, ListAPIView):
+    """
+    All the images of the album, the newest first.
+    """
+    serializer_class = ImageRelationInfoSerializer
+    pagination_class = AlbumImagesCursorPagination
+    album = None
+
+    def get_album(self):
+        if self.album is None:
+            self.album = get_object_or_404(Album, name=self.kwargs['album_name'])
+        return self.album
+
+    def get_version(self):
+        return get_album_version(self.get_album())
 
+    def get_queryset(self):
+        return (self.get_album().image_relations
+                                .select_related('image')
+                                .prefetch_related('image__renditions'))
@@ -5,3 +5,7 @@ from django.apps import AppConfig
 
 class AlbumCreatorConfig(AppConfig):
     name = 'album_creator'
+
+    def ready(self):
+        # connect the album counters signals
+        from . import signals  # noqa
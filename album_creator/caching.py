@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# how often the requests waiting for another one to build the value look it up
+LOCK_POLL_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches[getattr(settings, 'ALBUM_CACHE', 'default')]
+
+
+def make_cache_key(name, version, parts):
+    """
+    :param name: str kind of the cached value, e.g. 'album-grid'
+    :param version: .versioning.Version of the content the value is built from
+    :param parts: iterable of the other values the cached value depends on,
+    e.g. the page cursor
+    :return: str cache key, any new version gets new keys, so the old values are
+    never read again and simply expire
+    """
+    digest = hashlib.sha1('|'.join('{}'.format(part) for part in parts).encode('utf-8'))
+    return 'album_creator:{}:{}:{}'.format(name, version.tag, digest.hexdigest())
+
+
+def get_or_build(name, version, parts, build):
+    """
+    Read-through cache of the values built from the album content. After an
+    import a single request builds the value of the new version while the
+    concurrent requests for it wait for the value (up to
+    settings.ALBUM_CACHE_LOCK_WAIT seconds), so the popular pages are not
+    rebuilt by every request at once. The requests that waited in vain build
+    the value themselves.
+    :param name: str kind of the cached value
+    :param version: .versioning.Version of the content, the value is built
+    without the cache if None
+    :param parts: iterable of the other values the cached value depends on
+    :param build: callable without arguments returning the picklable value
+    :return: the cached or the built value
+    """
+    if version is None:
+        return build()
+    cache = get_cache()
+    key = make_cache_key(name, version, parts)
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = '{}:lock'.format(key)
+    lock_timeout = getattr(settings, 'ALBUM_CACHE_LOCK_TIMEOUT', 30)
+    if not cache.add(lock_key, 1, lock_timeout):
+        wait_until = time.time() + getattr(settings, 'ALBUM_CACHE_LOCK_WAIT', 5)
+        while time.time() < wait_until:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        logger.warning('Gave up waiting for {} to be cached'.format(key))
+        return build()
+    try:
+        value = build()
+        cache.set(key, value, getattr(settings, 'ALBUM_CACHE_TIMEOUT', 24 * 60 * 60))
+    finally:
+        cache.delete(lock_key)
+    return value
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import os
+import random
+import time
+from glob import glob
+
+from django.conf import settings
+
+from .ratelimit import RateLimitExceeded, RateLimitedTwitterApi, SearchRateLimiter
+from .utils import get_credentials_from_file, get_twitter_api
+
+logger = logging.getLogger(__name__)
+
+# {(pid, credentials file path): (file modification time, client)}
+_clients_cache = {}
+
+
+def get_credentials_file_paths():
+    """
+    Returns paths of all the configured twitter credentials files:
+    settings.TWITTER_CREDENTIALS_JSON_FILES list and all *.json files in
+    settings.TWITTER_CREDENTIALS_DIR. Falls back to the single
+    settings.TWITTER_CREDENTIALS_JSON_FILE if none of them are set.
+    :return: list of str absolute paths
+    """
+    file_paths = list(getattr(settings, 'TWITTER_CREDENTIALS_JSON_FILES', None) or [])
+    credentials_dir = getattr(settings, 'TWITTER_CREDENTIALS_DIR', None)
+    if credentials_dir:
+        file_paths.extend(sorted(glob(os.path.join(credentials_dir, '*.json'))))
+    if not file_paths:
+        # if this setting is not set - fail right away
+        file_paths = [settings.TWITTER_CREDENTIALS_JSON_FILE]
+    return file_paths
+
+
+class TwitterClientPool(object):
+    """
+    Pool of rate limited twitter clients, one per twitter app. Every search goes
+    to the client with the most requests left in its rate limit window, clients
+    with exhausted windows are skipped until the window resets.
+    """
+
+    def __init__(self, clients, max_wait=None):
+        """
+        :param clients: list of RateLimitedTwitterApi, their limiters should not
+        wait for the window reset themselves (max_wait=0)
+        :param max_wait: int how many seconds the search may sleep when all the
+        clients are exhausted, defaults to settings.TWITTER_RATE_LIMIT_MAX_WAIT
+        """
+        if not clients:
+            raise ValueError('Twitter client pool requires at least one client')
+        if max_wait is None:
+            max_wait = getattr(settings, 'TWITTER_RATE_LIMIT_MAX_WAIT', 0)
+        self.clients = list(clients)
+        self.max_wait = max_wait
+
+    def get_headroom(self, client):
+        """
+        :param client: RateLimitedTwitterApi
+        :return: tuple (float remaining requests, int reset timestamp or None),
+        the remaining requests are infinite for clients with unknown state
+        """
+        remaining, reset_at = client.limiter.get_state()
+        if remaining is None:
+            return float('inf'), None
+        return remaining, reset_at
+
+    def choose_client(self, exclude=()):
+        """
+        :param exclude: clients that should not be chosen
+        :return: tuple (RateLimitedTwitterApi or None if all the clients are
+        exhausted, int the earliest window reset of the exhausted clients)
+        """
+        available = []
+        earliest_reset_at = None
+        for client in self.clients:
+            if client in exclude:
+                continue
+            remaining, reset_at = self.get_headroom(client)
+            if remaining > 0:
+                available.append((remaining, client))
+            elif earliest_reset_at is None or reset_at < earliest_reset_at:
+                earliest_reset_at = reset_at
+        if not available:
+            return None, earliest_reset_at
+        max_remaining = max(remaining for remaining, __ in available)
+        # spread the load between the equally good clients
+        return random.choice([client for remaining, client in available
+                              if remaining == max_remaining]), None
+
+    def search(self, **kwargs):
+        exhausted = set()
+        reset_times = []
+        while True:
+            client, reset_at = self.choose_client(exclude=exhausted)
+            if client is None:
+                reset_at = min(reset_times + ([reset_at] if reset_at else []))
+                if reset_at - time.time() > self.max_wait:
+                    raise RateLimitExceeded(
+                        'All twitter credentials are exhausted until {}'.format(
+                            reset_at), reset_at)
+                time.sleep(max(reset_at - time.time(), 0))
+                exhausted = set()
+                reset_times = []
+                continue
+            try:
+                return client.search(**kwargs)
+            except RateLimitExceeded as e:
+                logger.debug('Twitter client {} is exhausted'.format(client.api.app_key))
+                exhausted.add(client)
+                reset_times.append(e.reset_at)
+
+
+def get_twitter_client(file_path):
+    """
+    Returns the rate limited twitter client for the credentials file. Clients
+    are cached in the process, so the authenticated Twython instance and its
+    keep-alive HTTP session are reused, until the file modification time changes.
+    :param file_path: str absolute path to credentials file
+    :return: RateLimitedTwitterApi
+    """
+    # forked processes must not share the HTTP sessions of the parent
+    cache_key = (os.getpid(), file_path)
+    mtime = os.path.getmtime(file_path)
+    cached = _clients_cache.get(cache_key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    api = get_twitter_api(get_credentials_from_file(file_path))
+    # the pool waits for the reset itself, when all the clients are exhausted
+    limiter = SearchRateLimiter(api.app_key, max_wait=0)
+    client = RateLimitedTwitterApi(api, limiter=limiter)
+    _clients_cache[cache_key] = (mtime, client)
+    logger.debug('Twitter client created for {}'.format(file_path))
+    return client
+
+
+def build_twitter_client_pool(file_paths=None):
+    """
+    Builds the pool of twitter clients for all the configured credentials.
+    It is cheap to call it before every job, the clients are cached, see
+    get_twitter_client.
+    :param file_paths: list of credentials files paths, see
+    get_credentials_file_paths
+    :return: TwitterClientPool
+    """
+    if file_paths is None:
+        file_paths = get_credentials_file_paths()
+    clients = [get_twitter_client(file_path) for file_path in file_paths]
+    logger.debug('Twitter client pool with {} client(s)'.format(len(clients)))
+    return TwitterClientPool(clients)
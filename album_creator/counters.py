@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import models
+from django.db.models import Case, Count, F, Max, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Album, AlbumImageRelation
+
+logger = logging.getLogger(__name__)
+
+
+def bump_album_versions(albums_qs):
+    """
+    Marks the pages of the albums as changed, e.g. after an admin edit or after
+    their images thumbnails were generated. The counters updates below bump the
+    version themselves.
+    :param albums_qs: queryset of Album
+    :return: None
+    """
+    albums_qs.update(version=F('version') + 1, modified_at=timezone.now())
+
+
+def add_album_images(album_pk, relations):
+    """
+    Updates the album counters after new image relations were created, with a
+    single UPDATE statement, so concurrent imports don't lose each other's
+    increments. Call it in the transaction that created the relations.
+    :param album_pk: int album pk
+    :param relations: list of created AlbumImageRelation instances (only
+    tweet_id, image_id and imported_at are used)
+    :return: None
+    """
+    if not relations:
+        return
+    newest_relation = max(relations, key=lambda relation: relation.tweet_id)
+    # the same value the repair computes from the relations, set on the
+    # instances by their auto_now_add field when they were saved
+    imported_at = Value(max(relation.imported_at for relation in relations),
+                        output_field=models.DateTimeField())
+    # the cover is only replaced by an image of a newer tweet, all the
+    # expressions below see the album row as it was before the update
+    is_newer = (Q(last_tweet_id__isnull=True) |
+                Q(last_tweet_id__lt=newest_relation.tweet_id))
+    Album.objects.filter(pk=album_pk).update(
+        image_count=F('image_count') + len(relations),
+        version=F('version') + 1,
+        modified_at=timezone.now(),
+        # greatest() is null if any argument is null on some databases
+        last_tweet_id=Greatest(Coalesce('last_tweet_id', Value(0)),
+                               Value(newest_relation.tweet_id)),
+        last_imported_at=Greatest(Coalesce('last_imported_at', imported_at),
+                                  imported_at),
+        cover_image=Case(
+            When(is_newer, then=Value(newest_relation.image_id)),
+            default=F('cover_image'),
+            output_field=models.IntegerField(),
+        ),
+    )
+
+
+def remove_album_image(album_pk):
+    """
+    Updates the album counters after one of its image relations was deleted.
+    The last tweet and the cover are taken from the newest remaining relation,
+    the last import time from the most recently imported one.
+    :param album_pk: int album pk
+    :return: None
+    """
+    newest_relation = (AlbumImageRelation.objects
+                                         .filter(album_id=album_pk)
+                                         .order_by('-tweet_id')
+                                         .values_list('tweet_id', 'image_id')
+                                         .first())
+    last_tweet_id, cover_image_id = newest_relation or (None, None)
+    last_imported_at = (AlbumImageRelation.objects
+                                          .filter(album_id=album_pk)
+                                          .aggregate(Max('imported_at'))['imported_at__max'])
+    Album.objects.filter(pk=album_pk).update(
+        image_count=Greatest(F('image_count') - 1, Value(0)),
+        version=F('version') + 1,
+        modified_at=timezone.now(),
+        last_tweet_id=last_tweet_id,
+        last_imported_at=last_imported_at,
+        cover_image=cover_image_id,
+    )
+
+
+def repair_album_counters(albums_qs=None):
+    """
+    Recomputes the counters of the albums from their image relations, e.g. after
+    relations were changed with queryset updates or raw SQL, which bypass the
+    importer and the signals.
+    :param albums_qs: queryset of Album, all the albums if None
+    :return: int number of repaired albums
+    """
+    if albums_qs is None:
+        albums_qs = Album.objects.all()
+    albums = albums_qs.annotate(
+        actual_image_count=Count('image_relations'),
+        actual_last_tweet_id=Max('image_relations__tweet_id'),
+        actual_last_imported_at=Max('image_relations__imported_at'),
+    )
+    repaired_count = 0
+    for album in albums.iterator():
+        cover_image_id = None
+        if album.actual_last_tweet_id is not None:
+            cover_image_id = (AlbumImageRelation.objects
+                                                .filter(album_id=album.pk,
+                                                        tweet_id=album.actual_last_tweet_id)
+                                                .values_list('image_id', flat=True)
+                                                .first())
+        actual_values = {
+            'image_count': album.actual_image_count,
+            'last_tweet_id': album.actual_last_tweet_id,
+            'last_imported_at': album.actual_last_imported_at,
+            'cover_image_id': cover_image_id,
+        }
+        if all(getattr(album, field) == value for field, value in actual_values.items()):
+            continue
+        logger.info('Repairing counters of album {}'.format(album.name))
+        Album.objects.filter(pk=album.pk).update(version=F('version') + 1,
+                                                 modified_at=timezone.now(),
+                                                 **actual_values)
+        repaired_count += 1
+    return repaired_count
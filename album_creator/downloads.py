@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes
+from django.utils.six.moves.urllib.parse import urlsplit
+
+from .metrics import FAILURES
+from .utils import ImageDownloadError, get_image_from_url
+
+logger = logging.getLogger(__name__)
+
+
+def get_host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def is_transient_error(error):
+    """
+    :param error: exception raised while fetching an image
+    :return: bool the download may succeed if it is retried
+    """
+    if isinstance(error, ImageDownloadError):
+        return error.transient
+    return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError))
+
+
+class HostFailures(object):
+    """
+    Recent failures of an image host: its failed urls with their expiration
+    times, the times of its transient errors and the state of its circuit.
+    """
+
+    def __init__(self, failed_urls=None, failure_times=None, open_until=0,
+                 reopen_until=0):
+        # {str url sha1: tuple (str error, float expiration time)}
+        self.failed_urls = failed_urls or {}
+        self.failure_times = failure_times or []
+        # the circuit is open until open_until, then a single failure until
+        # reopen_until opens it again
+        self.open_until = open_until
+        self.reopen_until = reopen_until
+
+    def to_dict(self):
+        return {
+            'failed_urls': self.failed_urls,
+            'failure_times': self.failure_times,
+            'open_until': self.open_until,
+            'reopen_until': self.reopen_until,
+        }
+
+    def expire(self, now, max_failed_urls):
+        self.failed_urls = dict(sorted(
+            ((digest, value) for digest, value in self.failed_urls.items() if value[1] > now),
+            key=lambda item: item[1][1])[-max_failed_urls:])
+
+    def merge(self, other):
+        """
+        Adds the failures of another import of the host.
+        """
+        self.failed_urls.update(other.failed_urls)
+        self.failure_times = sorted(set(self.failure_times) | set(other.failure_times))
+        self.open_until = max(self.open_until, other.open_until)
+        self.reopen_until = max(self.reopen_until, other.reopen_until)
+
+
+class DownloadFailures(object):
+    """
+    Remembers the failed image urls and the failing image hosts in the cache
+    shared by all the workers (settings.IMPORT_DOWNLOAD_FAILURE_CACHE), so the
+    imports don't spend their time on them again.
+    Failed urls are skipped until their entry expires: for
+    settings.IMPORT_FAILED_URL_TIMEOUT seconds after a permanent error (404,
+    not an image) and for settings.IMPORT_FAILED_URL_TRANSIENT_TIMEOUT seconds
+    after a transient one, up to settings.IMPORT_FAILED_URLS_PER_HOST urls of
+    every host are kept.
+    Every host has a circuit breaker: settings.IMPORT_HOST_FAILURE_THRESHOLD
+    transient errors within settings.IMPORT_HOST_FAILURE_WINDOW seconds open it
+    and the host is skipped for settings.IMPORT_HOST_COOLDOWN seconds. Then the
+    downloads are tried again, a single failure opens the circuit again.
+    The failures of a host are kept in a single cache entry, read by load and
+    written by save, the download threads work with the state in memory.
+    Concurrent imports may overwrite each other's failures, which only costs
+    another download attempt.
+    """
+
+    def __init__(self, cache_alias=None):
+        if cache_alias is None:
+            cache_alias = getattr(settings, 'IMPORT_DOWNLOAD_FAILURE_CACHE', 'shared')
+        self.cache = caches[cache_alias]
+        self.failure_threshold = getattr(settings, 'IMPORT_HOST_FAILURE_THRESHOLD', 5)
+        self.failure_window = getattr(settings, 'IMPORT_HOST_FAILURE_WINDOW', 60)
+        self.cooldown = getattr(settings, 'IMPORT_HOST_COOLDOWN', 300)
+        self.hosts = {}
+        self._new_failures = {}
+        self._lock = threading.Lock()
+
+    def get_cache_key(self, host):
+        return 'album_creator:download:host:{}'.format(host)
+
+    def get_url_digest(self, url):
+        return hashlib.sha1(force_bytes(url)).hexdigest()
+
+    def load(self, urls):
+        """
+        Reads the failures of the hosts of the urls.
+        :param urls: list of str image urls
+        """
+        hosts = set(get_host(url) for url in urls)
+        values = self.cache.get_many([self.get_cache_key(host) for host in hosts])
+        for host in hosts:
+            self.hosts[host] = HostFailures(**values.get(self.get_cache_key(host), {}))
+
+    def get_host_failures(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostFailures()
+        return self.hosts[host]
+
+    def get_url_error(self, url):
+        """
+        :param url: str image url
+        :return: str error of the url if it failed recently, None otherwise
+        """
+        with self._lock:
+            failed_url = self.get_host_failures(get_host(url)).failed_urls.get(
+                self.get_url_digest(url))
+        if failed_url is not None and failed_url[1] > time.time():
+            return failed_url[0]
+        return None
+
+    def is_host_available(self, host):
+        """
+        :param host: str image host
+        :return: bool False while the circuit of the host is open
+        """
+        with self._lock:
+            return self.get_host_failures(host).open_until <= time.time()
+
+    def add_failed_url(self, url, error, transient):
+        """
+        :param url: str image url
+        :param error: str error description
+        :param transient: bool the error may go away
+        """
+        if transient:
+            timeout = getattr(settings, 'IMPORT_FAILED_URL_TRANSIENT_TIMEOUT', 10 * 60)
+        else:
+            timeout = getattr(settings, 'IMPORT_FAILED_URL_TIMEOUT', 24 * 60 * 60)
+        host = get_host(url)
+        failed_url = (error, time.time() + timeout)
+        with self._lock:
+            for host_failures in (self.get_host_failures(host), self.get_new_failures(host)):
+                host_failures.failed_urls[self.get_url_digest(url)] = failed_url
+
+    def get_new_failures(self, host):
+        if host not in self._new_failures:
+            self._new_failures[host] = HostFailures()
+        return self._new_failures[host]
+
+    def add_host_failure(self, host):
+        """
+        Counts a transient error of the host, opens its circuit when there were
+        too many of them.
+        :param host: str image host
+        :return: bool the circuit was opened
+        """
+        now = time.time()
+        with self._lock:
+            host_failures = self.get_host_failures(host)
+            new_failures = self.get_new_failures(host)
+            host_failures.failure_times = [
+                failed_at for failed_at in host_failures.failure_times
+                if failed_at > now - self.failure_window] + [now]
+            new_failures.failure_times.append(now)
+            if host_failures.open_until > now:
+                return False
+            if (len(host_failures.failure_times) < self.failure_threshold and
+                    host_failures.reopen_until <= now):
+                return False
+            logger.warning('Image host {} is failing, skipping it for {}s'.format(
+                host, self.cooldown))
+            for host_failures in (host_failures, new_failures):
+                host_failures.open_until = now + self.cooldown
+                host_failures.reopen_until = now + self.cooldown + self.failure_window
+            return True
+
+    def save(self):
+        """
+        Adds the new failures to the cache entries of their hosts.
+        """
+        with self._lock:
+            new_failures = self._new_failures
+            self._new_failures = {}
+        if not new_failures:
+            return
+        now = time.time()
+        max_failed_urls = getattr(settings, 'IMPORT_FAILED_URLS_PER_HOST', 1000)
+        cached = self.cache.get_many([self.get_cache_key(host) for host in new_failures])
+        for host, host_failures in new_failures.items():
+            # the entry may have been updated by another import since load
+            cached_failures = HostFailures(**cached.get(self.get_cache_key(host), {}))
+            cached_failures.merge(host_failures)
+            cached_failures.expire(now, max_failed_urls)
+            cached_failures.failure_times = [
+                failed_at for failed_at in cached_failures.failure_times
+                if failed_at > now - self.failure_window]
+            if len(cached_failures.failure_times) >= self.failure_threshold:
+                # the failures of the imports add up
+                cached_failures.open_until = max(cached_failures.open_until,
+                                                 now + self.cooldown)
+                cached_failures.reopen_until = max(
+                    cached_failures.reopen_until, now + self.cooldown + self.failure_window)
+            expires_at = max([cached_failures.reopen_until, now + self.failure_window] +
+                             [value[1] for value in cached_failures.failed_urls.values()])
+            self.cache.set(self.get_cache_key(host), cached_failures.to_dict(),
+                           int(expires_at - now) + 1)
+
+
+class HostLimiter(object):
+    """
+    Limits the number of simultaneous requests to a single host.
+    Semaphores are created on demand, one per host name.
+    """
+
+    def __init__(self, max_per_host):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def get_semaphore(self, url):
+        host = get_host(url)
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_per_host)
+                self._semaphores[host] = semaphore
+            return semaphore
+
+
+def download_images(image_urls, max_workers=None, max_per_host=None,
+                    fetch=get_image_from_url, failures=None, max_retries=None,
+                    backoff=None):
+    """
+    Fetch images concurrently. The number of simultaneous downloads is limited by
+    max_workers in total and by max_per_host for every single host.
+    Transient errors are retried with a jittered exponential backoff. Failed
+    downloads are logged and reported as None, the urls that failed recently
+    and the hosts that keep failing are skipped, see DownloadFailures.
+    :param image_urls: list of str absolute urls to images
+    :param max_workers: int global limit of simultaneous downloads, defaults to
+    settings.IMPORT_DOWNLOAD_CONCURRENCY
+    :param max_per_host: int limit of simultaneous downloads from a single host,
+    defaults to settings.IMPORT_DOWNLOAD_CONCURRENCY_PER_HOST
+    :param fetch: callable that fetches a single url
+    :param failures: DownloadFailures keeping the failed urls and hosts
+    :param max_retries: int number of retries of a transient error, defaults to
+    settings.IMPORT_DOWNLOAD_RETRIES
+    :param backoff: float base delay of the retries in seconds, defaults to
+    settings.IMPORT_DOWNLOAD_RETRY_BACKOFF
+    :return: dict {image_url: django.core.files.File or None}
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'IMPORT_DOWNLOAD_CONCURRENCY', 8)
+    if max_per_host is None:
+        max_per_host = getattr(settings, 'IMPORT_DOWNLOAD_CONCURRENCY_PER_HOST', 4)
+    if failures is None:
+        failures = DownloadFailures()
+    if max_retries is None:
+        max_retries = getattr(settings, 'IMPORT_DOWNLOAD_RETRIES', 2)
+    if backoff is None:
+        backoff = getattr(settings, 'IMPORT_DOWNLOAD_RETRY_BACKOFF', 0.5)
+    # the same url is downloaded only once
+    unique_urls = list(OrderedDict.fromkeys(image_urls))
+    if not unique_urls:
+        return {}
+    failures.load(unique_urls)
+    results = {}
+    for image_url in unique_urls:
+        error = failures.get_url_error(image_url)
+        if error is not None:
+            logger.debug('Skipping {}, it failed recently: {}'.format(image_url, error))
+            FAILURES.inc(reason='known_bad_url')
+            results[image_url] = None
+    pending_urls = [url for url in unique_urls if url not in results]
+    if not pending_urls:
+        return results
+    host_limiter = HostLimiter(max_per_host)
+
+    def download(image_url):
+        host = get_host(image_url)
+        attempt = 0
+        while True:
+            if not failures.is_host_available(host):
+                logger.debug('Skipping {}, the host is failing'.format(image_url))
+                FAILURES.inc(reason='host_unavailable')
+                return None
+            with host_limiter.get_semaphore(image_url):
+                try:
+                    return fetch(image_url)
+                except Exception as e:
+                    error = e
+                    transient = is_transient_error(e)
+                    if not transient and not isinstance(e, ImageDownloadError):
+                        # unexpected errors are not remembered, they may be ours
+                        logger.exception('Failed to fetch the image from url {}'.format(
+                            image_url))
+                        FAILURES.inc(reason='download_error')
+                        return None
+            if transient:
+                failures.add_host_failure(host)
+            if not transient or attempt >= max_retries:
+                break
+            # the host slot is free while waiting
+            delay = random.uniform(0, backoff * (2 ** attempt))
+            logger.debug('Retrying {} in {:.1f}s: {}'.format(image_url, delay, error))
+            time.sleep(delay)
+            attempt += 1
+        if isinstance(error, ImageDownloadError):
+            logger.warning('Image rejected: {}'.format(error))
+            FAILURES.inc(reason='download_rejected')
+        else:
+            logger.warning('Failed to fetch the image from url {}: {}'.format(
+                image_url, error))
+            FAILURES.inc(reason='download_error')
+        failures.add_failed_url(image_url, '{}: {}'.format(type(error).__name__, error),
+                                transient)
+        return None
+
+    pool = ThreadPool(min(max_workers, len(pending_urls)))
+    try:
+        image_files = pool.map(download, pending_urls, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    failures.save()
+    results.update(zip(pending_urls, image_files))
+    return results
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import struct
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import AlbumImageRelation
+from .pagination import paginate_timeline
+
+logger = logging.getLogger(__name__)
+
+# size of the chunks the stored image files are read with
+FILE_CHUNK_SIZE = 64 * 1024
+
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# the sizes and the crc follow the data, the names are utf-8
+ZIP_FLAGS = 0x08 | 0x800
+ZIP_STORED = 0
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP_ENTRIES_LIMIT = 0xFFFF
+
+
+def get_export_chunk_size():
+    return getattr(settings, 'ALBUM_EXPORT_CHUNK_SIZE', 500)
+
+
+def iter_album_relations(album_pk, chunk_size=None):
+    """
+    Walks the album timeline from the newest tweets a chunk at a time with the
+    keyset pagination, every chunk is a short query, no cursor is kept open
+    while the chunk is sent to the client.
+    :param album_pk: int album pk
+    :param chunk_size: int number of relations per query, defaults to
+    settings.ALBUM_EXPORT_CHUNK_SIZE
+    :return: generator of AlbumImageRelation with the images
+    """
+    if chunk_size is None:
+        chunk_size = get_export_chunk_size()
+    relations_qs = AlbumImageRelation.objects.filter(album_id=album_pk).select_related('image')
+    cursor = None
+    while True:
+        relations, cursor = paginate_timeline(relations_qs, cursor=cursor,
+                                              page_size=chunk_size)
+        for relation in relations:
+            yield relation
+        if cursor is None:
+            return
+
+
+def iter_album_json_lines(album_pk, build_absolute_uri, chunk_size=None):
+    """
+    :param album_pk: int album pk
+    :param build_absolute_uri: callable building an absolute url from a path
+    :param chunk_size: int number of relations per query
+    :return: generator of bytes JSON lines, one for every image relation
+    """
+    for relation in iter_album_relations(album_pk, chunk_size=chunk_size):
+        image = relation.image
+        yield (json.dumps({
+            'tweet_id': relation.tweet_id,
+            'tweet_url': relation.tweet_url,
+            'imported_at': relation.imported_at,
+            'image_url': build_absolute_uri(image.image_file.url),
+            'original_image_url': image.original_image_url,
+            'checksum': image.checksum,
+        }, cls=DjangoJSONEncoder) + '\n').encode('utf-8')
+
+
+def get_dos_datetime(value):
+    """
+    :param value: aware datetime
+    :return: tuple (int dos time, int dos date) in UTC
+    """
+    value = timezone.localtime(value, timezone.utc)
+    dos_time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    dos_date = ((max(value.year, 1980) - 1980) << 9) | (value.month << 5) | value.day
+    return dos_time, dos_date
+
+
+class ZipStream(object):
+    """
+    Writes a ZIP archive to a stream that can't seek back: the crc and the sizes
+    of every file follow its data in a data descriptor, and the central
+    directory is kept in memory as the only state, a hundred bytes per file.
+    The files are stored uncompressed, the photos are compressed already.
+    Archives over 4GB or with more than 65535 files get the ZIP64 records.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.central_directory = []
+
+    def _data(self, data):
+        self.offset += len(data)
+        return data
+
+    def iter_file(self, name, chunks, modified_at):
+        """
+        :param name: str file name in the archive
+        :param chunks: iterable of bytes, the file content
+        :param modified_at: aware datetime of the file modification
+        :return: generator of bytes of the archive
+        """
+        name = name.encode('utf-8')
+        dos_time, dos_date = get_dos_datetime(modified_at)
+        header_offset = self.offset
+        yield self._data(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, ZIP_VERSION, ZIP_FLAGS, ZIP_STORED,
+            dos_time, dos_date, 0, 0, 0, len(name), 0) + name)
+        crc = 0
+        size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            yield self._data(chunk)
+        crc &= 0xFFFFFFFF
+        yield self._data(struct.pack('<IIII', 0x08074b50, crc, size, size))
+        self.central_directory.append((name, dos_time, dos_date, crc, size, header_offset))
+
+    def iter_central_directory(self):
+        """
+        :return: generator of bytes of the end of the archive
+        """
+        directory_offset = self.offset
+        for name, dos_time, dos_date, crc, size, header_offset in self.central_directory:
+            extra = b''
+            version = ZIP_VERSION
+            if header_offset > ZIP32_LIMIT:
+                extra = struct.pack('<HHQ', 0x0001, 8, header_offset)
+                header_offset = ZIP32_LIMIT
+                version = ZIP64_VERSION
+            yield self._data(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, ZIP_FLAGS,
+                ZIP_STORED, dos_time, dos_date, crc, size, size, len(name),
+                len(extra), 0, 0, 0, 0o644 << 16, header_offset) + name + extra)
+        directory_size = self.offset - directory_offset
+        entries_count = len(self.central_directory)
+        if (entries_count > ZIP_ENTRIES_LIMIT or directory_size > ZIP32_LIMIT or
+                directory_offset > ZIP32_LIMIT):
+            zip64_end_offset = self.offset
+            yield self._data(struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                entries_count, entries_count, directory_size, directory_offset))
+            yield self._data(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+            entries_count = min(entries_count, ZIP_ENTRIES_LIMIT)
+            directory_size = min(directory_size, ZIP32_LIMIT)
+            directory_offset = min(directory_offset, ZIP32_LIMIT)
+        yield self._data(struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, entries_count, entries_count,
+            directory_size, directory_offset, 0))
+
+
+def iter_file_chunks(file_obj):
+    try:
+        while True:
+            chunk = file_obj.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def iter_album_zip(album_pk, album_name, chunk_size=None):
+    """
+    Streams a ZIP archive of the stored image files of the album, a file at a
+    time, without temporary files. Missing files are logged and left out.
+    :param album_pk: int album pk
+    :param album_name: str album name, the directory of the files in the archive
+    :param chunk_size: int number of relations per query
+    :return: generator of bytes of the archive
+    """
+    zip_stream = ZipStream()
+    for relation in iter_album_relations(album_pk, chunk_size=chunk_size):
+        image_file = relation.image.image_file
+        try:
+            file_obj = image_file.storage.open(image_file.name, 'rb')
+        except (IOError, OSError):
+            logger.warning('Image file {} is missing, not exported'.format(image_file.name))
+            continue
+        name = '{}/{}_{}{}'.format(album_name, relation.tweet_id, relation.image_id,
+                                   os.path.splitext(image_file.name)[1].lower())
+        for data in zip_stream.iter_file(name, iter_file_chunks(file_obj),
+                                         relation.imported_at):
+            yield data
+    for data in zip_stream.iter_central_directory():
+        yield data
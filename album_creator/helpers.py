@@ -2,26 +2,42 @@
 from __future__ import unicode_literals
 
 import logging
+import time
+from collections import OrderedDict
 
-from django.core.mail import send_mass_mail
+from django.conf import settings
 from django.template.loader import render_to_string
 from django.contrib.sites.models import Site
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 
+from .counters import add_album_images
+from .downloads import download_images
+from .metrics import (
+    FAILURES, IMPORT_STAGE_SECONDS, IMPORTED_IMAGES, IMPORTED_TWEETS,
+    LAST_SUCCESSFUL_IMPORT, SKIPPED_TWEETS,
+)
 from .models import Album, AlbumImageRelation, Image
+from .thumbnails import pregenerate_thumbnails
 from .utils import (
-    search_tweets_by_hashtag, get_original_image_url_from_tweet,
-    get_tweet_id, get_tweet_url, get_image_from_url,
+    build_search_query, build_hash_tags_query, group_hash_tags, iter_search_pages,
+    get_original_image_url_from_tweet, get_tweet_hash_tags, get_tweet_id,
+    get_tweet_url, get_image_from_url,
 )
 
 # todo: consider helpful logger naming
 logger = logging.getLogger(__name__)
 
 
-def import_photo_from_tweet(tweet, album_instance):
+def import_photo_from_tweet(tweet, album_instance, prefetched_image_files=None):
     """
     Import a single photo from a single tweet data (received with twitter api).
     :param tweet: dict tweet data.
     :param album_instance: .models.Album instance
+    :param prefetched_image_files: dict {original_image_url: django file, stored file
+    name or None} with already downloaded images, see .downloads.download_images.
+    None values stand for failed downloads.
     :return: int or None, None if nothing was imported, image_instance.pk in case of
     successful import
     """
@@ -32,12 +48,14 @@ def import_photo_from_tweet(tweet, album_instance):
     # check that we have image url
     if original_image_url is None:
         logger.debug('Skipping: No original_image_url found for tweet {}'.format(tweet_url))
+        SKIPPED_TWEETS.inc(reason='no_photo')
         return None
 
     # validate uniqueness
     album_image_relation = AlbumImageRelation.objects.filter(album=album_instance, image__original_image_url=original_image_url)
     if album_image_relation.exists():
         logger.debug('Skipping duplicate image entry for tweet {}'.format(tweet_url))
+        SKIPPED_TWEETS.inc(reason='duplicate')
         return None
     # check if we need to fetch an image
     try:
@@ -49,28 +67,201 @@ def import_photo_from_tweet(tweet, album_instance):
         image_instance = None
     # if there is no previously imported image - create one
     if image_instance is None:
-        logger.debug('Fetching the image file from url {}'.format(original_image_url))
-        image_django_file = get_image_from_url(original_image_url)
+        if prefetched_image_files and original_image_url in prefetched_image_files:
+            image_django_file = prefetched_image_files[original_image_url]
+            if image_django_file is None:
+                logger.debug('Skipping: failed to fetch the image for tweet {}'.format(
+                    tweet_url))
+                SKIPPED_TWEETS.inc(reason='download_failed')
+                return None
+        else:
+            logger.debug('Fetching the image file from url {}'.format(original_image_url))
+            image_django_file = get_image_from_url(original_image_url)
         logger.debug('Creating new Image entry for url {}'.format(original_image_url))
-        image_instance = Image.objects.create(image_file=image_django_file,
-                                              original_image_url=original_image_url)
+        # the file is stored by the model save
+        with IMPORT_STAGE_SECONDS.time(stage='db_images'):
+            image_instance = Image.objects.create(
+                image_file=image_django_file,
+                original_image_url=original_image_url,
+                checksum=getattr(image_django_file, 'checksum', ''))
     logger.debug('Creating new Album to Image relation for tweet: {}'.format(tweet_url))
-    album_instance.image_relations.create(
-        image=image_instance,
-        tweet_id=tweet_id,
-        tweet_url=tweet_url)
+    with IMPORT_STAGE_SECONDS.time(stage='db_relations'):
+        album_instance.image_relations.create(
+            image=image_instance,
+            tweet_id=tweet_id,
+            tweet_url=tweet_url)
+    IMPORTED_IMAGES.inc()
     return image_instance.pk
 
 
-def import_photos_for_album(api, album_name, limit=100):
+def import_photos_from_tweets(tweets, album_instance):
+    """
+    Import photos from a whole page of tweets at once. Duplicates are resolved with
+    a single query against the album relations and a single query against the
+    images, new images are downloaded concurrently and all new rows are inserted
+    with bulk_create in one transaction, so the number of queries does not depend
+    on the number of tweets.
+    If a concurrent import inserted the same rows in the meantime, the page is
+    imported tweet by tweet with import_photo_from_tweet.
+    :param tweets: list of dicts with tweet data
+    :param album_instance: .models.Album instance
+    :return: list of imported images pks in the tweets order
+    """
+    # the first tweet wins if the same image appears in several tweets
+    IMPORTED_TWEETS.inc(len(tweets))
+    candidates = OrderedDict()
+    for tweet in tweets:
+        tweet_url = get_tweet_url(tweet)
+        original_image_url = get_original_image_url_from_tweet(tweet)
+        if original_image_url is None:
+            logger.debug('Skipping: No original_image_url found for tweet {}'.format(tweet_url))
+            SKIPPED_TWEETS.inc(reason='no_photo')
+        elif original_image_url in candidates:
+            logger.debug('Skipping duplicate image entry for tweet {}'.format(tweet_url))
+            SKIPPED_TWEETS.inc(reason='duplicate')
+        else:
+            candidates[original_image_url] = tweet
+    if not candidates:
+        return []
+
+    # validate uniqueness
+    related_urls = set(
+        AlbumImageRelation.objects
+                          .filter(album=album_instance,
+                                  image__original_image_url__in=list(candidates))
+                          .values_list('image__original_image_url', flat=True))
+    for original_image_url in related_urls:
+        logger.debug('Skipping duplicate image entry for tweet {}'.format(
+            get_tweet_url(candidates.pop(original_image_url))))
+    SKIPPED_TWEETS.inc(len(related_urls), reason='duplicate')
+    if not candidates:
+        return []
+
+    # check which images need to be fetched
+    images_pks = dict(
+        Image.objects.filter(original_image_url__in=list(candidates))
+                     .values_list('original_image_url', 'pk'))
+    missing_urls = [url for url in candidates if url not in images_pks]
+    image_files = download_images(missing_urls) if missing_urls else {}
+    new_images = []
+    for original_image_url in missing_urls:
+        image_django_file = image_files.get(original_image_url)
+        if image_django_file is None:
+            logger.debug('Skipping: failed to fetch the image for tweet {}'.format(
+                get_tweet_url(candidates.pop(original_image_url))))
+            SKIPPED_TWEETS.inc(reason='download_failed')
+            continue
+        image_instance = Image(
+            original_image_url=original_image_url,
+            checksum=getattr(image_django_file, 'checksum', ''))
+        # store the file before the transaction is started
+        with IMPORT_STAGE_SECONDS.time(stage='storage'):
+            image_instance.image_file.save(image_django_file.name, image_django_file,
+                                           save=False)
+        image_django_file.close()
+        new_images.append(image_instance)
+
+    try:
+        with transaction.atomic():
+            stage_started_at = time.time()
+            Image.objects.bulk_create(new_images)
+            if new_images:
+                # bulk_create does not set the pks on every database backend
+                images_pks.update(
+                    Image.objects.filter(original_image_url__in=[
+                        image.original_image_url for image in new_images])
+                                 .values_list('original_image_url', 'pk'))
+            IMPORT_STAGE_SECONDS.observe(time.time() - stage_started_at, stage='db_images')
+            stage_started_at = time.time()
+            new_relations = [
+                AlbumImageRelation(
+                    album=album_instance,
+                    image_id=images_pks[original_image_url],
+                    tweet_id=get_tweet_id(tweet),
+                    tweet_url=get_tweet_url(tweet))
+                for original_image_url, tweet in candidates.items()
+            ]
+            AlbumImageRelation.objects.bulk_create(new_relations)
+            # bulk_create does not send post_save signals
+            add_album_images(album_instance.pk, new_relations)
+            IMPORT_STAGE_SECONDS.observe(time.time() - stage_started_at,
+                                         stage='db_relations')
+    except IntegrityError:
+        logger.warning(
+            'Concurrent import detected for album {}, importing tweet by tweet'.format(
+                album_instance.name))
+        FAILURES.inc(reason='concurrent_import')
+        # already stored files are reused
+        stored_files = {image.original_image_url: image.image_file.name
+                        for image in new_images}
+        imported_pks = [
+            import_photo_from_tweet(tweet, album_instance=album_instance,
+                                    prefetched_image_files=stored_files)
+            for tweet in candidates.values()
+        ]
+        imported_pks = [pk for pk in imported_pks if pk is not None]
+    else:
+        imported_pks = [images_pks[original_image_url]
+                        for original_image_url in candidates]
+        IMPORTED_IMAGES.inc(len(imported_pks))
+    # the pages only show pregenerated thumbnails
+    with IMPORT_STAGE_SECONDS.time(stage='thumbnails'):
+        pregenerate_thumbnails(Image.objects.filter(pk__in=imported_pks,
+                                                    thumbnails_ready=False))
+    return imported_pks
+
+
+def get_search_max_pages(max_pages=None):
+    if max_pages is None:
+        max_pages = getattr(settings, 'IMPORT_SEARCH_MAX_PAGES', 10)
+    return max_pages
+
+
+def save_search_cursor(album_pk, since_id, max_id):
+    """
+    Keeps the search walk of an import on the album, so an import interrupted by
+    an error or by the pages budget is resumed from where it stopped. The album
+    last imported tweet id moves with the imported pages, without the cursor
+    the older part of the walk would never be imported.
+    :param album_pk: int album pk
+    :param since_id: int since_id of the walk, None if it has no lower bound
+    :param max_id: int the tweets older than or equal to this id are not
+    imported yet, None when the walk is completed
+    :return: None
+    """
+    Album.objects.filter(pk=album_pk).update(
+        search_since_id=since_id if max_id is not None else None,
+        search_max_id=max_id)
+
+
+def get_newest_tweet_id(search_results):
+    return max(get_tweet_id(tweet) for tweet in search_results)
+
+
+def import_photos_for_album(api, album_name, limit=100, max_pages=None,
+                            since_id=None, max_photos=None, heartbeat=None):
     """
     Imports photos from twitter by searching tweets with hash tag that is the
     same as album name. This function will search twitter, fetch photos and create
     corresponding entries in the database and notify the managers and the admin
     with import results.
+    Search results pages are imported one by one as they arrive, from the newest
+    tweets back to the last imported one or until max_pages were fetched.
+    The position in the search results is saved on the album after every
+    page, an import that failed or ran out of the pages budget is resumed by the
+    next one before the newer tweets are searched, see save_search_cursor.
     :param api: Twython instance, twitter api connection
     :param album_name: str album name - the hash tag without the '#' symbol
-    :param limit: int limit twitter search results
+    :param limit: int limit twitter search results per page
+    :param max_pages: int search requests budget, defaults to
+    settings.IMPORT_SEARCH_MAX_PAGES
+    :param since_id: int only import tweets newer than this id, overrides the
+    last imported tweet id of the album, the interrupted import of the album
+    is neither resumed nor saved then
+    :param max_photos: int stop after this number of the newest photos were
+    imported, no limit if None
+    :param heartbeat: callable called after every imported page, e.g. to renew
+    the lease of the import job, it may raise to abort the import
     :return: list of imported photos pks
     """
     logger.info('Starting import for album name "{}"'.format(album_name))
@@ -82,17 +273,21 @@ def import_photos_for_album(api, album_name, limit=100):
             'No album insatnce found in the database for name {}'.format(album_name))
         return []
     hash_tag = '#{}'.format(album_name)
+    save_cursor = since_id is None
+    # the walks are tuples (since_id, max_id)
+    walks = []
+    if save_cursor and album_instance.search_max_id is not None:
+        logger.info('Resuming the interrupted import of album {} from {}'.format(
+            album_name, album_instance.search_max_id))
+        walks.append((album_instance.search_since_id, album_instance.search_max_id))
     # check if there were previous imports, in case there are - we only
-    # need the most latest tweet id.
-    # Also limit the query to 1 record, and only tweet_id field.
-    last_imported_tweet_id_for_album = (
-        album_instance.image_relations
-                      .all()
-                      .order_by('-tweet_id')
-                      .values_list('tweet_id')[:1])
-    if last_imported_tweet_id_for_album:
+    # need the most latest tweet id, it is kept on the album.
+    if since_id is not None:
+        logger.debug('Using the given since_id {}'.format(since_id))
+        last_imported_tweet_id = since_id
+    elif album_instance.last_tweet_id is not None:
         # if there were previous imports - use appropriate twitter id
-        last_imported_tweet_id = last_imported_tweet_id_for_album[0][0]
+        last_imported_tweet_id = album_instance.last_tweet_id
         logger.debug(
             'Found last imported tweet_id from previous import: {}'.format(
                 last_imported_tweet_id))
@@ -101,33 +296,76 @@ def import_photos_for_album(api, album_name, limit=100):
             'No previous imports found for album {}'.format(
                 album_name))
         last_imported_tweet_id = None
-    logger.debug(
-        'search_tweets_by_hashtag.\n'
-        '\thash tag: {hash_tag}\n'
-        '\tlimit: {limit}\n'
-        '\tsince_id: {since_id}\n'
-        '\timage_only: {image_only}'.format(
-            hash_tag=hash_tag,
-            limit=limit,
-            since_id=last_imported_tweet_id,
-            image_only=True
-        ))
-    search_results = search_tweets_by_hashtag(
-        api=api,
-        hash_tag=hash_tag,
-        limit=limit,
-        since_id=last_imported_tweet_id,
-        image_only=True
-    )
-    logger.debug('Got {} search results after the query'.format(
-        len(search_results)))
-
-    # Process the search results
+    walks.append((last_imported_tweet_id, None))
+    max_pages = get_search_max_pages(max_pages)
+    pages_count = 0
     successful_imports_pks = []
-    for tweet in search_results:
-        image_pk = import_photo_from_tweet(tweet, album_instance=album_instance)
-        if image_pk is not None:
-            successful_imports_pks.append(image_pk)
+    next_max_id = None
+    for walk_since_id, walk_max_id in walks:
+        logger.debug(
+            'iter_search_pages.\n'
+            '\thash tag: {hash_tag}\n'
+            '\tlimit: {limit}\n'
+            '\tsince_id: {since_id}\n'
+            '\tmax_id: {max_id}\n'
+            '\tmax_pages: {max_pages}\n'
+            '\timage_only: {image_only}'.format(
+                hash_tag=hash_tag,
+                limit=limit,
+                since_id=walk_since_id,
+                max_id=walk_max_id,
+                max_pages=max_pages - pages_count,
+                image_only=True
+            ))
+        search_pages = iter_search_pages(
+            api=api,
+            query=build_search_query(hash_tag, image_only=True),
+            page_size=limit,
+            since_id=walk_since_id,
+            max_id=walk_max_id,
+            max_pages=max_pages - pages_count,
+        )
+
+        # Process the search results page by page
+        next_max_id = None
+        cursor_saved = walk_max_id is not None
+        for search_results, next_max_id in search_pages:
+            pages_count += 1
+            logger.debug('Got {} search results after the query'.format(
+                len(search_results)))
+            if save_cursor and not cursor_saved:
+                # the first page is imported again if the import fails
+                save_search_cursor(album_instance.pk, walk_since_id,
+                                   get_newest_tweet_id(search_results))
+                cursor_saved = True
+            if max_photos is not None:
+                # every tweet has at most one photo to import
+                search_results = search_results[:max_photos - len(successful_imports_pks)]
+            successful_imports_pks.extend(import_photos_from_tweets(
+                search_results, album_instance=album_instance))
+            if save_cursor and next_max_id is not None:
+                save_search_cursor(album_instance.pk, walk_since_id, next_max_id)
+            if heartbeat is not None:
+                heartbeat()
+            if max_photos is not None and len(successful_imports_pks) >= max_photos:
+                logger.info('Reached the limit of {} photo(s) for album {}'.format(
+                    max_photos, album_name))
+                # older tweets are left out on purpose, not for the lack of budget
+                next_max_id = None
+                break
+        if save_cursor:
+            save_search_cursor(album_instance.pk, walk_since_id, next_max_id)
+        if next_max_id is not None:
+            logger.warning(
+                'Search budget of {} page(s) exhausted for album {}, older tweets '
+                'starting from {} will be imported by the next import'.format(
+                    max_pages, album_name, next_max_id))
+            break
+        if max_photos is not None and len(successful_imports_pks) >= max_photos:
+            break
+        if pages_count >= max_pages:
+            # the newer tweets are imported by the next import
+            break
     # log results
     if successful_imports_pks:
         logger.debug('Successfully imported {} photo(s)'.format(
@@ -136,6 +374,168 @@ def import_photos_for_album(api, album_name, limit=100):
             str(successful_imports_pks)))
     else:
         logger.debug('No new images were imported.')
+    LAST_SUCCESSFUL_IMPORT.set(time.time(), album=album_name)
+    return successful_imports_pks
+
+
+def import_photos_for_albums(api, album_names, limit=100, max_pages=None,
+                             max_group_size=None, heartbeat=None):
+    """
+    Imports photos for several albums, searching twitter for several hash tags
+    with a single query (#a OR #b OR #c). Found tweets are routed to every album
+    whose hash tag they contain, each album only gets tweets newer than its own
+    last imported tweet.
+    The search position is saved on every album of the query, see
+    save_search_cursor. The albums with an interrupted import are imported one
+    by one with import_photos_for_album, which resumes it.
+    :param api: Twython instance, twitter api connection
+    :param album_names: list of str album names
+    :param limit: int limit twitter search results per page
+    :param max_pages: int search requests budget per query, defaults to
+    settings.IMPORT_SEARCH_MAX_PAGES
+    :param max_group_size: int maximum number of hash tags per query, defaults to
+    settings.IMPORT_SEARCH_HASHTAGS_PER_QUERY
+    :param heartbeat: callable called after every imported page, see
+    import_photos_for_album
+    :return: dict {album name: list of imported photos pks}
+    """
+    if max_group_size is None:
+        max_group_size = getattr(settings, 'IMPORT_SEARCH_HASHTAGS_PER_QUERY', 10)
+    max_pages = get_search_max_pages(max_pages)
+    albums = list(Album.objects.filter(name__in=album_names))
+    successful_imports_pks = {album_name: [] for album_name in album_names}
+    for album_instance in albums:
+        if album_instance.search_max_id is not None:
+            successful_imports_pks[album_instance.name] = import_photos_for_album(
+                api, album_instance.name, limit=limit, max_pages=max_pages,
+                heartbeat=heartbeat)
+    albums = [album_instance for album_instance in albums
+              if album_instance.search_max_id is None]
+    # albums with close since_id share the queries, so the query does not walk
+    # far back in time for the sake of a single album
+    albums.sort(key=lambda album: album.last_tweet_id or 0)
+    # hash tags are case insensitive
+    albums_by_hash_tag = OrderedDict()
+    for album_instance in albums:
+        albums_by_hash_tag.setdefault(album_instance.name.lower(), []).append(
+            album_instance)
+
+    hash_tags_groups = group_hash_tags(
+        ['#{}'.format(hash_tag) for hash_tag in albums_by_hash_tag],
+        max_group_size=max_group_size)
+    for hash_tags in hash_tags_groups:
+        group_albums = [album_instance for hash_tag in hash_tags
+                        for album_instance in albums_by_hash_tag[hash_tag[1:]]]
+        group_albums_qs = Album.objects.filter(pk__in=[album.pk for album in group_albums])
+        since_ids = [album.last_tweet_id for album in group_albums]
+        since_id = None if None in since_ids else min(since_ids)
+        logger.debug('Searching {} with since_id {}'.format(hash_tags, since_id))
+        search_pages = iter_search_pages(
+            api=api,
+            query=build_hash_tags_query(hash_tags, image_only=True),
+            page_size=limit,
+            since_id=since_id,
+            max_pages=max_pages,
+        )
+        next_max_id = None
+        for page_number, (search_results, next_max_id) in enumerate(search_pages):
+            if page_number == 0:
+                # the first page is imported again if the import fails, every
+                # album resumes the walk from its own last imported tweet
+                group_albums_qs.update(search_since_id=F('last_tweet_id'),
+                                       search_max_id=get_newest_tweet_id(search_results))
+            # route the tweets to the albums
+            album_tweets = OrderedDict((album.pk, []) for album in group_albums)
+            for tweet in search_results:
+                tweet_hash_tags = get_tweet_hash_tags(tweet)
+                for album_instance in group_albums:
+                    album_since_id = album_instance.last_tweet_id
+                    if (album_instance.name.lower() in tweet_hash_tags and
+                            (album_since_id is None or
+                             get_tweet_id(tweet) > album_since_id)):
+                        album_tweets[album_instance.pk].append(tweet)
+            for album_instance in group_albums:
+                if album_tweets[album_instance.pk]:
+                    successful_imports_pks[album_instance.name].extend(
+                        import_photos_from_tweets(album_tweets[album_instance.pk],
+                                                  album_instance=album_instance))
+            if next_max_id is not None:
+                group_albums_qs.update(search_max_id=next_max_id)
+            if heartbeat is not None:
+                heartbeat()
+        if next_max_id is None:
+            group_albums_qs.update(search_since_id=None, search_max_id=None)
+        if next_max_id is not None:
+            logger.warning(
+                'Search budget of {} page(s) exhausted for {}, older tweets starting '
+                'from {} will be imported by the next import'.format(
+                    max_pages, hash_tags, next_max_id))
+    imported_at = time.time()
+    for album_instance in albums:
+        LAST_SUCCESSFUL_IMPORT.set(imported_at, album=album_instance.name)
+    logger.debug('Imported {} photo(s) for {} album(s) with {} search query(ies)'.format(
+        sum(map(len, successful_imports_pks.values())), len(albums),
+        len(hash_tags_groups)))
+    return successful_imports_pks
+
+
+def backfill_photos_for_album(api, album_name, limit=100, max_pages=None,
+                              heartbeat=None):
+    """
+    Imports older photos for the album, walking the search results back in time
+    from the album backfill cursor. The cursor is saved after every page, so the
+    history can be imported in chunks by subsequent calls.
+    :param api: Twython instance, twitter api connection
+    :param album_name: str album name - the hash tag without the '#' symbol
+    :param limit: int limit twitter search results per page
+    :param max_pages: int search requests budget for this chunk, defaults to
+    settings.IMPORT_SEARCH_MAX_PAGES
+    :param heartbeat: callable called after every imported page, see
+    import_photos_for_album
+    :return: list of imported photos pks
+    """
+    logger.info('Starting backfill for album name "{}"'.format(album_name))
+    try:
+        album_instance = Album.objects.get(name=album_name)
+    except Album.DoesNotExist:
+        logger.error(
+            'No album insatnce found in the database for name {}'.format(album_name))
+        return []
+    if album_instance.backfill_completed_at is not None:
+        logger.debug('Backfill is already completed for album {}'.format(album_name))
+        return []
+    max_id = album_instance.backfill_max_id
+    if max_id is None:
+        # start right below the oldest imported tweet
+        oldest_imported_tweet_id = (album_instance.image_relations
+                                                  .order_by('tweet_id')
+                                                  .values_list('tweet_id', flat=True)
+                                    .first())
+        if oldest_imported_tweet_id is not None:
+            max_id = oldest_imported_tweet_id - 1
+    logger.debug('Backfill for album {} starts at max_id {}'.format(album_name, max_id))
+    search_pages = iter_search_pages(
+        api=api,
+        query=build_search_query('#{}'.format(album_name), image_only=True),
+        page_size=limit,
+        max_id=max_id,
+        max_pages=get_search_max_pages(max_pages),
+    )
+    successful_imports_pks = []
+    completed = True
+    for search_results, next_max_id in search_pages:
+        successful_imports_pks.extend(import_photos_from_tweets(
+            search_results, album_instance=album_instance))
+        # move the cursor once the page is imported
+        Album.objects.filter(pk=album_instance.pk).update(backfill_max_id=next_max_id)
+        completed = next_max_id is None
+        if heartbeat is not None:
+            heartbeat()
+    if completed:
+        logger.debug('Backfill completed for album {}'.format(album_name))
+        Album.objects.filter(pk=album_instance.pk).update(
+            backfill_completed_at=timezone.now())
+    logger.debug('Backfill imported {} photo(s)'.format(len(successful_imports_pks)))
     return successful_imports_pks
 
 
@@ -143,11 +543,12 @@ def construct_notification_emails(subject_template_name, body_template_name,
                                   album_name, photo_pks_list, from_email,
                                   recipients):
     """
-    Construct email messages to notify recipients about import results.
+    Construct email messages to notify recipients about import results. The
+    templates are rendered once, the same message is sent to every recipient.
     :param subject_template_name: str path to subject template
     :param body_template_name: str path to body template
     :param album_name: str name of the album, will be refrlected in the subject
-    :param photo_pks_list: list of photo pks to build urls
+    :param photo_pks_list: list or queryset of photo pks to build urls
     :param from_email: str email address to be used in from_email field
     :param recipients: str recipients
     :return: list of tuples suitable for usage in send_mass_email
@@ -158,7 +559,7 @@ def construct_notification_emails(subject_template_name, body_template_name,
     context_dict = {
         'photos': photos,
         'album_name': album_name,
-        'album_total_photos_count': album.images.count(),
+        'album_total_photos_count': album.image_count,
         'number_of_photos': len(photos),
         'album_url': 'http://{}{}'.format(site.domain,
                                           album.get_absolute_url()),
@@ -169,26 +570,3 @@ def construct_notification_emails(subject_template_name, body_template_name,
     body = render_to_string(body_template_name, context_dict)
     prepared_data = [(subject, body, from_email, (to_email,)) for to_email in recipients]
     return prepared_data
-
-
-def send_email_notifications(subject_template_name, body_template_name,
-                             album_name, photo_pks_list, from_email, recipients):
-    """
-    Constructs and sends import email notifications to recipients.
-    :param subject_template_name: str path to subject template
-    :param body_template_name: str path to body template
-    :param album_name: str name of the album, will be refrlected in the subject
-    :param photo_pks_list: list of photo pks to build urls
-    :param from_email: str email address to be used in from_email field
-    :param recipients: str recipients
-    :return: number of sent emails
-    """
-    data = construct_notification_emails(
-        subject_template_name=subject_template_name,
-        body_template_name=body_template_name,
-        album_name=album_name,
-        photo_pks_list=photo_pks_list,
-        from_email=from_email,
-        recipients=recipients,
-    )
-    return send_mass_mail(data)
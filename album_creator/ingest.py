@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import gzip
+import io
+import json
+import logging
+import os
+
+from django.utils import six
+from django.utils.encoding import force_text
+
+logger = logging.getLogger(__name__)
+
+
+def open_dump(path):
+    """
+    :param path: str path to the JSON lines file, gzipped if it ends with .gz
+    :return: binary file object, the offsets of a gzipped file are the offsets in
+    the uncompressed data
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return io.open(path, 'rb')
+
+
+def _is_list_of_dicts(value):
+    return isinstance(value, list) and all(isinstance(item, dict) for item in value)
+
+
+def is_valid_tweet(tweet):
+    """
+    Checks the fields the import reads: the id, the author screen name (the
+    tweet url) and the media and hash tags entities.
+    :param tweet: decoded JSON line
+    :return: bool
+    """
+    if not isinstance(tweet, dict):
+        return False
+    tweet_id = tweet.get('id')
+    if not isinstance(tweet_id, six.integer_types) or isinstance(tweet_id, bool):
+        return False
+    user = tweet.get('user')
+    if not isinstance(user, dict) or not isinstance(user.get('screen_name'),
+                                                    six.string_types):
+        return False
+    entities = tweet.get('entities', {})
+    if not isinstance(entities, dict):
+        return False
+    media_entities = entities.get('media', [])
+    if not _is_list_of_dicts(media_entities) or not _is_list_of_dicts(
+            entities.get('hashtags', [])):
+        return False
+    return all(isinstance(media.get('media_url'), six.string_types)
+               for media in media_entities if media.get('type') == 'photo')
+
+
+def iter_tweet_batches(dump_file, batch_size, offset=0):
+    """
+    Reads the tweets from a JSON lines file one line at a time, so the memory
+    used does not depend on the size of the file. Lines that are not valid
+    tweets (see is_valid_tweet) are logged and skipped.
+    :param dump_file: binary file object, see open_dump
+    :param batch_size: int maximum number of tweets per batch
+    :param offset: int offset of the line to start reading from
+    :return: generator of tuples (list of tweets dicts, int offset of the line
+    after the batch, int number of skipped lines)
+    """
+    if offset:
+        dump_file.seek(offset)
+    tweets = []
+    skipped_count = 0
+    while True:
+        line = dump_file.readline()
+        if not line:
+            break
+        line = line.strip()
+        if line:
+            try:
+                tweet = json.loads(line.decode('utf-8'))
+            except ValueError:
+                tweet = None
+            if is_valid_tweet(tweet):
+                tweets.append(tweet)
+            else:
+                logger.warning('Skipping: not a tweet at offset {}'.format(
+                    dump_file.tell() - len(line)))
+                skipped_count += 1
+        if len(tweets) >= batch_size:
+            yield tweets, dump_file.tell(), skipped_count
+            tweets = []
+            skipped_count = 0
+    if tweets or skipped_count:
+        yield tweets, dump_file.tell(), skipped_count
+
+
+def read_checkpoint(path):
+    """
+    :param path: str path to the checkpoint file
+    :return: dict checkpoint data, None if there is no checkpoint
+    """
+    try:
+        with io.open(path, 'r', encoding='utf-8') as checkpoint_file:
+            return json.load(checkpoint_file)
+    except IOError:
+        return None
+
+
+def write_checkpoint(path, data):
+    """
+    Replaces the checkpoint atomically, an interrupted write leaves the
+    previous checkpoint in place.
+    :param path: str path to the checkpoint file
+    :param data: dict checkpoint data
+    :return: None
+    """
+    temp_path = '{}.tmp'.format(path)
+    with io.open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+        checkpoint_file.write(force_text(json.dumps(data)))
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.rename(temp_path, path)
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import os
+import socket
+import traceback
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.timezone import utc
+
+from .metrics import FAILURES
+from .models import Album, AlbumImageRelation, ImportJob
+from .ratelimit import RateLimitExceeded
+from .helpers import (
+    import_photos_for_album, import_photos_for_albums, backfill_photos_for_album,
+)
+from .notifications import queue_import_notification
+
+logger = logging.getLogger(__name__)
+
+# how many candidate jobs are fetched at once when trying to claim a job
+CLAIM_CANDIDATES_LIMIT = 10
+
+
+class LeaseLost(Exception):
+    """
+    Raised by the lease heartbeat when another worker took the job over, the
+    import is aborted since the other worker imports the same tweets.
+    """
+
+
+def get_lease_seconds():
+    return getattr(settings, 'IMPORT_JOB_LEASE_SECONDS', 300)
+
+
+def get_retry_delay(attempts):
+    """
+    Returns the delay before the next attempt, grows exponentially with the
+    number of attempts already made.
+    :param attempts: int number of attempts already made
+    :return: datetime.timedelta
+    """
+    base_delay = getattr(settings, 'IMPORT_JOB_RETRY_DELAY', 60)
+    max_delay = getattr(settings, 'IMPORT_JOB_MAX_RETRY_DELAY', 3600)
+    delay = base_delay * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, max_delay))
+
+
+def get_worker_id():
+    """
+    Builds an identifier of the current worker process, unique across nodes.
+    :return: str
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def get_active_jobs():
+    """
+    Jobs that are waiting to be processed or are being processed right now.
+    :return: queryset of ImportJob
+    """
+    return ImportJob.objects.filter(
+        status__in=(ImportJob.STATUS_PENDING, ImportJob.STATUS_RUNNING))
+
+
+def enqueue_import(album_instance, mode=ImportJob.MODE_RECENT):
+    """
+    Schedules an import for the album. If the album already has a pending or running
+    job of the same mode no new job is created, since it would import the same tweets.
+    :param album_instance: .models.Album instance
+    :param mode: str ImportJob.MODE_RECENT to import new tweets or
+    ImportJob.MODE_BACKFILL to import the next chunk of older tweets
+    :return: tuple (ImportJob instance, bool created)
+    """
+    existing_job = get_active_jobs().filter(album=album_instance, mode=mode).first()
+    if existing_job is not None:
+        logger.debug('Album {} already has an active import job {}'.format(
+            album_instance.name, existing_job.pk))
+        return existing_job, False
+    job = ImportJob.objects.create(
+        album=album_instance,
+        mode=mode,
+        max_attempts=getattr(settings, 'IMPORT_JOB_MAX_ATTEMPTS', 5),
+    )
+    logger.debug('Enqueued import job {} for album {}'.format(
+        job.pk, album_instance.name))
+    return job, True
+
+
+def _claimable_jobs_filter(now):
+    # pending jobs that are due, or running jobs whose worker lost the lease
+    # (crashed or was killed) - those are taken over by another worker
+    return (
+        Q(status=ImportJob.STATUS_PENDING, run_after__lte=now) |
+        Q(status=ImportJob.STATUS_RUNNING, leased_until__lt=now)
+    )
+
+
+def claim_job(worker_id, lease_seconds=None, mode=None):
+    """
+    Claims the next due job for the worker. Claiming is done with a conditional
+    update (compare and swap on the job state), so it is safe to call it from
+    several processes or nodes sharing the same database: only one of them
+    will get the job.
+    :param worker_id: str identifier of the worker, see get_worker_id
+    :param lease_seconds: int for how long the job is leased to the worker
+    :param mode: str only claim jobs of this mode, any mode if None
+    :return: ImportJob instance or None if there is nothing to do
+    """
+    if lease_seconds is None:
+        lease_seconds = get_lease_seconds()
+    now = timezone.now()
+    claimable_filter = _claimable_jobs_filter(now)
+    if mode is not None:
+        claimable_filter &= Q(mode=mode)
+    candidates = (ImportJob.objects
+                           .filter(claimable_filter)
+                           .order_by('run_after', 'pk')
+                           .values_list('pk', 'attempts', 'max_attempts')
+                  [:CLAIM_CANDIDATES_LIMIT])
+    for job_pk, attempts, max_attempts in candidates:
+        job_qs = ImportJob.objects.filter(claimable_filter, pk=job_pk)
+        if attempts >= max_attempts:
+            # the last attempt was lost together with the worker
+            job_qs.update(
+                status=ImportJob.STATUS_DEAD,
+                last_error='Lease expired on the last attempt',
+                finished_at=now,
+            )
+            logger.error('Import job {} is dead, lease expired'.format(job_pk))
+            continue
+        claimed = job_qs.update(
+            status=ImportJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            leased_by=worker_id,
+            leased_until=now + timedelta(seconds=lease_seconds),
+        )
+        if claimed:
+            logger.debug('Worker {} claimed job {}'.format(worker_id, job_pk))
+            return ImportJob.objects.select_related('album').get(pk=job_pk)
+    return None
+
+
+def _owned_job_qs(job):
+    # updates are only applied while the worker still owns the job
+    return ImportJob.objects.filter(
+        pk=job.pk, status=ImportJob.STATUS_RUNNING, leased_by=job.leased_by)
+
+
+def renew_lease(job, lease_seconds=None):
+    """
+    Extends the lease of the job, so a long import is not taken over by another
+    worker while it is still running.
+    :param job: ImportJob instance claimed by the worker
+    :param lease_seconds: int for how long the job is leased from now
+    :return: bool False if the worker has lost the lease in the meantime
+    """
+    if lease_seconds is None:
+        lease_seconds = get_lease_seconds()
+    return bool(_owned_job_qs(job).update(
+        leased_until=timezone.now() + timedelta(seconds=lease_seconds)))
+
+
+def complete_job(job, imported_count):
+    """
+    Marks the job as successfully done.
+    :param job: ImportJob instance claimed by the worker
+    :param imported_count: int number of imported photos
+    :return: bool False if the worker has lost the lease in the meantime
+    """
+    return bool(_owned_job_qs(job).update(
+        status=ImportJob.STATUS_DONE,
+        imported_count=imported_count,
+        leased_until=None,
+        finished_at=timezone.now(),
+    ))
+
+
+def fail_job(job, error):
+    """
+    Registers failed attempt. The job is scheduled for a retry with a delay or
+    marked as dead if there are no attempts left.
+    :param job: ImportJob instance claimed by the worker
+    :param error: str error description
+    :return: str new job status
+    """
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        new_status = ImportJob.STATUS_DEAD
+        _owned_job_qs(job).update(
+            status=new_status,
+            last_error=error,
+            leased_until=None,
+            finished_at=now,
+        )
+        logger.error('Import job {} is dead after {} attempts'.format(
+            job.pk, job.attempts))
+    else:
+        new_status = ImportJob.STATUS_PENDING
+        _owned_job_qs(job).update(
+            status=new_status,
+            last_error=error,
+            leased_by='',
+            leased_until=None,
+            run_after=now + get_retry_delay(job.attempts),
+        )
+        logger.warning('Import job {} failed, will be retried'.format(job.pk))
+    return new_status
+
+
+def defer_job(job, run_after):
+    """
+    Puts the job back to the queue without counting the attempt, used when the
+    job could not be processed because of the twitter rate limit. Deferred jobs
+    keep their queue position: jobs are claimed in run_after, pk order, so when
+    the window resets they are picked up in the order they were enqueued.
+    :param job: ImportJob instance claimed by the worker
+    :param run_after: datetime when the job can be processed again
+    :return: bool False if the worker has lost the lease in the meantime
+    """
+    logger.info('Import job {} deferred until {}'.format(job.pk, run_after))
+    return bool(_owned_job_qs(job).update(
+        status=ImportJob.STATUS_PENDING,
+        attempts=F('attempts') - 1,
+        leased_by='',
+        leased_until=None,
+        run_after=run_after,
+    ))
+
+
+def get_lease_heartbeat(jobs, lease_seconds=None):
+    """
+    :param jobs: list of ImportJob instances claimed by the worker
+    :param lease_seconds: int for how long the jobs are leased on every beat
+    :return: callable renewing the leases of the jobs, raises LeaseLost if any
+    of them was taken over
+    """
+    def heartbeat():
+        for job in jobs:
+            if not renew_lease(job, lease_seconds=lease_seconds):
+                raise LeaseLost('Worker {} lost the lease on job {}'.format(
+                    job.leased_by, job.pk))
+    return heartbeat
+
+
+def queue_interrupted_import_notifications(jobs, started_at):
+    """
+    Queues the notifications of the photos the interrupted imports of the jobs
+    have already stored: every page is committed on its own, the retry skips
+    these photos as duplicates and would never notify about them.
+    :param jobs: list of ImportJob instances
+    :param started_at: datetime the imports were started at
+    :return: None
+    """
+    # the recently imported photos of the albums are an index lookup
+    relations = AlbumImageRelation.objects.filter(
+        album__in=[job.album_id for job in jobs], imported_at__gte=started_at)
+    imported_photos_pks = {}
+    for album_name, image_pk in relations.values_list('album__name', 'image_id'):
+        imported_photos_pks.setdefault(album_name, []).append(image_pk)
+    for album_name, album_imported_photos_pks in imported_photos_pks.items():
+        queue_import_notification(album_name, album_imported_photos_pks)
+
+
+def process_job(job, api, lease_seconds=None):
+    """
+    Runs the import for the claimed job and queues the notification of the
+    managers about new photos, also about those imported before the import
+    failed. The lease is renewed after every imported page.
+    :param job: ImportJob instance claimed by the worker
+    :param api: Twython instance, twitter api connection
+    :param lease_seconds: int for how long the job is leased on every renewal
+    :return: list of imported photos pks
+    :raises LeaseLost: if another worker took the job over
+    """
+    album_name = job.album.name
+    if job.mode == ImportJob.MODE_BACKFILL:
+        import_function = backfill_photos_for_album
+    else:
+        import_function = import_photos_for_album
+    started_at = timezone.now()
+    try:
+        imported_photos_pks = import_function(
+            api=api, album_name=album_name, limit=100,
+            heartbeat=get_lease_heartbeat([job], lease_seconds=lease_seconds))
+    except Exception:
+        queue_interrupted_import_notifications([job], started_at)
+        raise
+    queue_import_notification(album_name, imported_photos_pks)
+    return imported_photos_pks
+
+
+def process_jobs(jobs, api, lease_seconds=None):
+    """
+    Runs the imports for the claimed jobs and queues the notifications, see
+    process_job. Several new tweets imports are done together, searching for
+    the hash tags of all the albums at once.
+    :param jobs: list of ImportJob instances claimed by the worker
+    :param api: Twython instance, twitter api connection
+    :param lease_seconds: int for how long the jobs are leased on every renewal
+    :return: list of lists of imported photos pks, in the jobs order
+    :raises LeaseLost: if another worker took any of the jobs over
+    """
+    if len(jobs) == 1:
+        return [process_job(jobs[0], api, lease_seconds=lease_seconds)]
+    album_names = [job.album.name for job in jobs]
+    started_at = timezone.now()
+    try:
+        imported_photos_pks = import_photos_for_albums(
+            api=api, album_names=album_names, limit=100,
+            heartbeat=get_lease_heartbeat(jobs, lease_seconds=lease_seconds))
+    except Exception:
+        queue_interrupted_import_notifications(jobs, started_at)
+        raise
+    for album_name in album_names:
+        queue_import_notification(album_name, imported_photos_pks[album_name])
+    return [imported_photos_pks[album_name] for album_name in album_names]
+
+
+def claim_jobs(worker_id, lease_seconds=None, batch_size=1):
+    """
+    Claims the next due job and, if it imports new tweets, up to batch_size - 1
+    other new tweets jobs to be searched together.
+    :param worker_id: str identifier of the worker
+    :param lease_seconds: int for how long the jobs are leased to the worker
+    :param batch_size: int maximum number of claimed jobs
+    :return: list of ImportJob instances, empty if the queue is empty
+    """
+    job = claim_job(worker_id, lease_seconds=lease_seconds)
+    if job is None:
+        return []
+    jobs = [job]
+    if job.mode != ImportJob.MODE_RECENT:
+        return jobs
+    while len(jobs) < batch_size:
+        job = claim_job(worker_id, lease_seconds=lease_seconds,
+                        mode=ImportJob.MODE_RECENT)
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def run_next_jobs(worker_id, api, lease_seconds=None, batch_size=1):
+    """
+    Claims and processes the next jobs, see claim_jobs. All errors are registered
+    on the jobs.
+    :param worker_id: str identifier of the worker
+    :param api: Twython instance, twitter api connection
+    :param lease_seconds: int for how long the jobs are leased to the worker
+    :param batch_size: int maximum number of jobs processed together
+    :return: list of processed ImportJob instances, empty if the queue is empty
+    """
+    jobs = claim_jobs(worker_id, lease_seconds=lease_seconds, batch_size=batch_size)
+    if not jobs:
+        return jobs
+    try:
+        imported_photos_pks = process_jobs(jobs, api, lease_seconds=lease_seconds)
+    except LeaseLost as e:
+        logger.warning('{}, the import is aborted'.format(e))
+        # the jobs still owned are put back, the attempt was not theirs to fail
+        for job in jobs:
+            defer_job(job, timezone.now())
+    except RateLimitExceeded as e:
+        FAILURES.inc(reason='rate_limited')
+        for job in jobs:
+            defer_job(job, datetime.fromtimestamp(e.reset_at, utc))
+    except Exception:
+        logger.exception('Import job(s) {} failed'.format([job.pk for job in jobs]))
+        error = traceback.format_exc()
+        for job in jobs:
+            fail_job(job, error)
+    else:
+        for job, job_imported_photos_pks in zip(jobs, imported_photos_pks):
+            if not complete_job(job, len(job_imported_photos_pks)):
+                logger.warning(
+                    'Worker {} lost the lease on job {} before it was done'.format(
+                        worker_id, job.pk))
+            elif job.mode == ImportJob.MODE_BACKFILL:
+                # keep walking the history with the next chunk
+                album = Album.objects.get(pk=job.album_id)
+                if album.backfill_completed_at is None:
+                    enqueue_import(album, mode=ImportJob.MODE_BACKFILL)
+    return jobs
+
+
+def run_next_job(worker_id, api, lease_seconds=None):
+    """
+    Claims and processes a single job, all errors are registered on the job.
+    :param worker_id: str identifier of the worker
+    :param api: Twython instance, twitter api connection
+    :param lease_seconds: int for how long the job is leased to the worker
+    :return: ImportJob instance that was processed or None if the queue is empty
+    """
+    jobs = run_next_jobs(worker_id, api, lease_seconds=lease_seconds)
+    return jobs[0] if jobs else None
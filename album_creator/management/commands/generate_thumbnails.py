@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ...models import Image
+from ...thumbnails import pregenerate_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Generates the thumbnails of the images that were imported before the '
+            'thumbnails were pregenerated at import time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', default=False,
+            help='Regenerate the thumbnails of all the images, e.g. after the '
+                 'aliases were changed.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of images loaded and generated at once.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of thumbnail generation threads.')
+
+    def handle(self, *args, **options):
+        images_qs = Image.objects.order_by('pk')
+        if not options['all']:
+            images_qs = images_qs.filter(thumbnails_ready=False)
+        ready_count = failed_count = 0
+        last_pk = 0
+        while True:
+            # walk the images by pk, the generated ones leave the queryset
+            images = list(images_qs.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not images:
+                break
+            last_pk = images[-1].pk
+            ready_pks = pregenerate_thumbnails(images, max_workers=options['workers'])
+            ready_count += len(ready_pks)
+            failed_count += len(images) - len(ready_pks)
+            self.stdout.write('Generated thumbnails of {} image(s), {} failed'.format(
+                ready_count, failed_count))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...clients import build_twitter_client_pool
+from ...helpers import import_photos_for_album
+from ...jobs import get_worker_id
+from ...metrics import push_metrics
+from ...models import Album
+from ...notifications import queue_import_notification
+
+logger = logging.getLogger(__name__)
+
+
+def import_album(album_name, since_id=None, max_photos=None):
+    """
+    Imports new photos for a single album, runs in the pool processes.
+    :param album_name: str album name
+    :param since_id: int only import tweets newer than this id
+    :param max_photos: int maximum number of photos imported for the album
+    :return: dict import summary: album name, imported photos count, elapsed
+    seconds and error description (None if the import succeeded)
+    """
+    started_at = time.time()
+    summary = {
+        'album_name': album_name,
+        'imported_count': 0,
+        'error': None,
+    }
+    try:
+        imported_photos_pks = import_photos_for_album(
+            api=build_twitter_client_pool(),
+            album_name=album_name,
+            since_id=since_id,
+            max_photos=max_photos,
+        )
+        queue_import_notification(album_name, imported_photos_pks)
+        summary['imported_count'] = len(imported_photos_pks)
+    except Exception as e:
+        logger.exception('Import for album {} failed'.format(album_name))
+        summary['error'] = '{}: {}'.format(type(e).__name__, e)
+    summary['elapsed'] = time.time() - started_at
+    push_metrics(get_worker_id())
+    return summary
+
+
+def _import_album(kwargs):
+    # Pool.imap passes a single argument
+    return import_album(**kwargs)
+
+
+def get_rate(count, elapsed):
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Imports new photos for the albums right away, spreading the albums '
+            'between worker processes. Suitable to be run by cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes.')
+        parser.add_argument(
+            '--albums', nargs='+', default=None, metavar='ALBUM_NAME',
+            help='Names of the albums to import, all the albums by default.')
+        parser.add_argument(
+            '--since', type=int, default=None, metavar='TWEET_ID',
+            help='Only import tweets newer than this tweet id instead of the '
+                 'last imported tweet of every album.')
+        parser.add_argument(
+            '--max-per-album', type=int, default=None,
+            help='Maximum number of photos imported for every album.')
+
+    def get_album_names(self, album_names):
+        if album_names is None:
+            return list(Album.objects.order_by('name').values_list('name', flat=True))
+        existing_names = set(Album.objects.filter(
+            name__in=album_names).values_list('name', flat=True))
+        missing_names = [name for name in album_names if name not in existing_names]
+        if missing_names:
+            raise CommandError('Albums not found: {}'.format(', '.join(missing_names)))
+        return album_names
+
+    def write_summary(self, summary):
+        if summary['error'] is not None:
+            self.stdout.write(self.style.ERROR('{}: failed after {:.1f}s, {}'.format(
+                summary['album_name'], summary['elapsed'], summary['error'])))
+            return
+        self.stdout.write('{}: {} photo(s) in {:.1f}s ({:.1f} photos/s)'.format(
+            summary['album_name'], summary['imported_count'], summary['elapsed'],
+            get_rate(summary['imported_count'], summary['elapsed'])))
+
+    def handle(self, *args, **options):
+        album_names = self.get_album_names(options['albums'])
+        tasks = [{
+            'album_name': album_name,
+            'since_id': options['since'],
+            'max_photos': options['max_per_album'],
+        } for album_name in album_names]
+        started_at = time.time()
+        workers_count = min(options['workers'], len(tasks))
+        if workers_count <= 1:
+            summaries = (_import_album(task) for task in tasks)
+            pool = None
+        else:
+            # database connections must not be shared with the forked processes,
+            # each worker will open its own connection
+            connections.close_all()
+            pool = multiprocessing.Pool(workers_count)
+            summaries = pool.imap_unordered(_import_album, tasks)
+        imported_count = failed_count = 0
+        try:
+            # summaries are written as soon as the albums are imported
+            for summary in summaries:
+                self.write_summary(summary)
+                imported_count += summary['imported_count']
+                failed_count += summary['error'] is not None
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        elapsed = time.time() - started_at
+        self.stdout.write(
+            'Imported {} photo(s) for {} album(s) in {:.1f}s with {} worker(s): '
+            '{:.1f} albums/s, {:.1f} photos/s, {} failed'.format(
+                imported_count, len(tasks), elapsed, max(workers_count, 1),
+                get_rate(len(tasks), elapsed), get_rate(imported_count, elapsed),
+                failed_count))
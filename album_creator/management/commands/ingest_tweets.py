@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...helpers import import_photos_from_tweets
+from ...ingest import iter_tweet_batches, open_dump, read_checkpoint, write_checkpoint
+from ...jobs import get_worker_id
+from ...metrics import push_metrics
+from ...models import Album
+from ...notifications import queue_import_notification
+
+
+class Command(BaseCommand):
+    help = ('Imports the photos of archived tweets into an album. The tweets are '
+            'read from a JSON lines file (one tweet as returned by the search api '
+            'per line, gzipped if the name ends with .gz) one batch at a time, '
+            'the progress is saved after every batch and an interrupted ingest '
+            'continues from there. The photos of a batch are downloaded with '
+            'IMPORT_DOWNLOAD_CONCURRENCY threads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the tweets file.')
+        parser.add_argument(
+            '--album', required=True, metavar='ALBUM_NAME',
+            help='Name of the album the photos are imported into.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of tweets imported in a single transaction.')
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='Path to the file the progress is saved to, defaults to the '
+                 'tweets file path with the .checkpoint suffix.')
+        parser.add_argument(
+            '--restart', action='store_true', default=False,
+            help='Ignore the saved progress and read the file from the start.')
+        parser.add_argument(
+            '--notify', action='store_true', default=False,
+            help='Notify the managers about the imported photos.')
+
+    def get_start_offset(self, checkpoint_path, album_name):
+        checkpoint = read_checkpoint(checkpoint_path)
+        if checkpoint is None:
+            return 0
+        if checkpoint['album'] != album_name:
+            raise CommandError(
+                'Checkpoint {} belongs to album {}, use --restart or another '
+                '--checkpoint'.format(checkpoint_path, checkpoint['album']))
+        return checkpoint['offset']
+
+    def handle(self, *args, **options):
+        try:
+            album_instance = Album.objects.get(name=options['album'])
+        except Album.DoesNotExist:
+            raise CommandError('Album not found: {}'.format(options['album']))
+        checkpoint_path = options['checkpoint'] or '{}.checkpoint'.format(options['path'])
+        offset = 0
+        if not options['restart']:
+            offset = self.get_start_offset(checkpoint_path, album_instance.name)
+        try:
+            dump_file = open_dump(options['path'])
+        except IOError as e:
+            raise CommandError('Can not open {}: {}'.format(options['path'], e))
+        if offset:
+            self.stdout.write('Resuming from offset {}'.format(offset))
+        started_at = time.time()
+        tweets_count = imported_count = skipped_count = 0
+        with closing(dump_file):
+            for tweets, offset, batch_skipped_count in iter_tweet_batches(
+                    dump_file, options['batch_size'], offset=offset):
+                # the batch is imported in a single transaction, a batch that
+                # was interrupted is imported again, the duplicates are skipped
+                imported_pks = import_photos_from_tweets(tweets, album_instance)
+                if options['notify']:
+                    queue_import_notification(album_instance.name, imported_pks)
+                write_checkpoint(checkpoint_path, {
+                    'album': album_instance.name,
+                    'offset': offset,
+                })
+                tweets_count += len(tweets)
+                imported_count += len(imported_pks)
+                skipped_count += batch_skipped_count
+                if options['verbosity'] > 1:
+                    self.stdout.write('Offset {}: {} photo(s) from {} tweet(s)'.format(
+                        offset, len(imported_pks), len(tweets)))
+        push_metrics(get_worker_id())
+        self.stdout.write(
+            'Imported {} photo(s) from {} tweet(s) in {:.1f}s, skipped {} invalid '
+            'line(s)'.format(imported_count, tweets_count, time.time() - started_at,
+                             skipped_count))
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ...counters import repair_album_counters
+from ...models import Album
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the images count, the last imported tweet and the cover '
+            'image of the albums from their image relations.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--albums', nargs='+', default=None, metavar='ALBUM_NAME',
+            help='Names of the albums to repair, all the albums by default.')
+
+    def handle(self, *args, **options):
+        albums_qs = Album.objects.all()
+        if options['albums'] is not None:
+            albums_qs = albums_qs.filter(name__in=options['albums'])
+        repaired_count = repair_album_counters(albums_qs)
+        self.stdout.write('Repaired counters of {} album(s).'.format(repaired_count))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...clients import build_twitter_client_pool
+from ...jobs import get_worker_id, run_next_jobs
+from ...metrics import push_metrics
+
+
+def run_worker(burst, poll_interval, lease_seconds, batch_size=1, stdout=None):
+    """
+    Processes import jobs until interrupted.
+    :param burst: bool exit as soon as there are no jobs to process
+    :param poll_interval: float seconds to sleep when the queue is empty
+    :param lease_seconds: int for how long a claimed job is leased to the worker
+    :param batch_size: int number of albums searched with a single query
+    :param stdout: output stream for progress messages
+    :return: int number of processed jobs
+    """
+    worker_id = get_worker_id()
+    processed_jobs_count = 0
+    while True:
+        # search requests of all the workers share the rate limits of the twitter
+        # apps, clients are cached and only rebuilt when the credentials change
+        twitter_api = build_twitter_client_pool()
+        jobs = run_next_jobs(worker_id, twitter_api, lease_seconds=lease_seconds,
+                             batch_size=batch_size)
+        # the metrics view of the web server reads them from the shared cache
+        push_metrics(worker_id)
+        if jobs:
+            processed_jobs_count += len(jobs)
+            if stdout is not None:
+                for job in jobs:
+                    stdout.write('[{}] processed job {} for album {}'.format(
+                        worker_id, job.pk, job.album.name))
+            continue
+        if burst:
+            return processed_jobs_count
+        time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Runs worker processes that import photos for queued album import jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Number of worker processes to start on this node.')
+        parser.add_argument(
+            '--burst', action='store_true', default=False,
+            help='Exit when there are no more jobs to process.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=getattr(
+                settings, 'IMPORT_JOB_POLL_INTERVAL', 5),
+            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument(
+            '--lease-seconds', type=int, default=None,
+            help='For how long a claimed job is reserved for a worker.')
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(
+                settings, 'IMPORT_SEARCH_HASHTAGS_PER_QUERY', 10),
+            help='Number of albums searched with a single twitter query.')
+
+    def handle(self, *args, **options):
+        worker_kwargs = {
+            'burst': options['burst'],
+            'poll_interval': options['poll_interval'],
+            'lease_seconds': options['lease_seconds'],
+            'batch_size': options['batch_size'],
+            'stdout': self.stdout,
+        }
+        processes_count = options['processes']
+        if processes_count <= 1:
+            run_worker(**worker_kwargs)
+            return
+        # database connections must not be shared with the forked processes,
+        # each worker will open its own connection
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_worker, kwargs=worker_kwargs)
+            for __ in range(processes_count)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from ...jobs import get_worker_id
+from ...metrics import push_metrics
+from ...notifications import send_due_notifications
+
+
+class Command(BaseCommand):
+    help = ('Sends the queued import notifications to the managers, the imports of '
+            'an album within the digest window are sent as a single email.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--burst', action='store_true', default=False,
+            help='Exit when there are no more due notifications.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=getattr(
+                settings, 'IMPORT_NOTIFICATION_POLL_INTERVAL', 10),
+            help='Seconds to wait before checking the outbox again.')
+
+    def handle(self, *args, **options):
+        worker_id = get_worker_id()
+        # a single connection is kept open while there are digests to send, it
+        # is closed when the outbox is empty, before the server drops it
+        connection = get_connection()
+        while True:
+            try:
+                sent_count = send_due_notifications(worker_id, connection)
+            finally:
+                connection.close()
+            push_metrics(worker_id)
+            if sent_count and options['verbosity'] > 1:
+                self.stdout.write('[{}] sent {} digest(s)'.format(worker_id, sent_count))
+            if options['burst']:
+                return
+            time.sleep(options['poll_interval'])
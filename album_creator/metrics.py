@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from calendar import timegm
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.utils.encoding import force_text
+
+from .models import ImportJob, ImportNotification
+
+logger = logging.getLogger(__name__)
+
+# seconds, the import stages take from milliseconds (database writes) to
+# minutes (a search walking many pages)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+WORKERS_INDEX_KEY = 'album_creator:metrics:workers'
+
+
+class Metric(object):
+    """
+    Metric with a value for every combination of the label values, updated from
+    any thread of the process.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects labels {}, got {}'.format(
+                self.name, self.labelnames, tuple(labels)))
+        return tuple(force_text(labels[labelname]) for labelname in self.labelnames)
+
+    def snapshot(self):
+        """
+        :return: dict {tuple of label values: value}
+        """
+        with self._lock:
+            return {key: self.copy_value(value) for key, value in self._values.items()}
+
+    def copy_value(self, value):
+        return value
+
+    def merge_values(self, value, other_value):
+        """
+        Merges the values of the same metric of two processes, by default they
+        are added up.
+        """
+        return value + other_value
+
+    def get_samples(self, key, value):
+        """
+        :return: list of tuples (str sample name suffix, dict extra labels, value)
+        """
+        return [('', {}, value)]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Gauge of a timestamp or another value that only grows, the values of the
+    processes are merged by taking the largest one.
+    """
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def merge_values(self, value, other_value):
+        return max(value, other_value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            # observations count of every bucket and of +Inf, their sum
+            value = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            for index, upper_bound in enumerate(self.buckets):
+                if amount <= upper_bound:
+                    break
+            else:
+                index = len(self.buckets)
+            value[0][index] += 1
+            value[1] += amount
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - started_at, **labels)
+
+    def copy_value(self, value):
+        return [list(value[0]), value[1]]
+
+    def merge_values(self, value, other_value):
+        return [[count + other_count for count, other_count in zip(value[0], other_value[0])],
+                value[1] + other_value[1]]
+
+    def get_samples(self, key, value):
+        samples = []
+        cumulative_count = 0
+        for upper_bound, count in zip(self.buckets + (float('inf'),), value[0]):
+            cumulative_count += count
+            samples.append(('_bucket', {'le': format_value(upper_bound)}, cumulative_count))
+        samples.append(('_sum', {}, value[1]))
+        samples.append(('_count', {}, cumulative_count))
+        return samples
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def snapshot(self):
+        """
+        :return: dict {metric name: metric values}, picklable
+        """
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def merge_snapshots(self, snapshots):
+        """
+        :param snapshots: iterable of snapshots of the registries of the processes
+        :return: merged snapshot, metrics unknown to this registry are skipped
+        """
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                merged_values = merged[name]
+                for key, value in values.items():
+                    if key in merged_values:
+                        value = metric.merge_values(merged_values[key], value)
+                    merged_values[key] = metric.copy_value(value)
+        return merged
+
+    def render(self, snapshot=None):
+        """
+        :param snapshot: snapshot to render, the current values if None
+        :return: str metrics in the Prometheus text exposition format
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append('# HELP {} {}'.format(name, escape_help(metric.documentation)))
+            lines.append('# TYPE {} {}'.format(name, metric.type))
+            for key, value in sorted(snapshot.get(name, {}).items()):
+                labels = OrderedDict(zip(metric.labelnames, key))
+                for suffix, extra_labels, sample_value in metric.get_samples(key, value):
+                    sample_labels = OrderedDict(labels)
+                    sample_labels.update(extra_labels)
+                    lines.append('{}{}{} {}'.format(
+                        name, suffix, format_labels(sample_labels),
+                        format_value(sample_value)))
+        return '\n'.join(lines) + '\n'
+
+
+def escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, force_text(value).replace('\\', r'\\')
+                                                .replace('\n', r'\n')
+                                                .replace('"', r'\"'))
+        for name, value in labels.items()))
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return '{:.1f}'.format(value)
+    return repr(value) if isinstance(value, float) else '{}'.format(value)
+
+
+REGISTRY = Registry()
+
+IMPORT_STAGE_SECONDS = REGISTRY.histogram(
+    'album_creator_import_stage_seconds',
+    'Time spent in the import stages: search, download, storage, db_images, '
+    'db_relations, thumbnails and email.',
+    ('stage', ))
+IMPORTED_TWEETS = REGISTRY.counter(
+    'album_creator_import_tweets_total',
+    'Tweets processed by the imports.')
+IMPORTED_IMAGES = REGISTRY.counter(
+    'album_creator_import_images_total',
+    'Album images imported.')
+SKIPPED_TWEETS = REGISTRY.counter(
+    'album_creator_import_skipped_tweets_total',
+    'Tweets skipped by the imports by reason: no_photo, duplicate or download_failed.',
+    ('reason', ))
+DOWNLOADED_BYTES = REGISTRY.counter(
+    'album_creator_image_download_bytes_total',
+    'Bytes of the downloaded images.')
+FAILURES = REGISTRY.counter(
+    'album_creator_failures_total',
+    'Failures by reason: download_rejected, download_error, known_bad_url, '
+    'host_unavailable, concurrent_import, rate_limited or email.',
+    ('reason', ))
+SENT_EMAILS = REGISTRY.counter(
+    'album_creator_notification_emails_total',
+    'Notification emails sent.')
+LAST_SUCCESSFUL_IMPORT = REGISTRY.gauge(
+    'album_creator_album_last_successful_import_timestamp_seconds',
+    'Time of the last import of the album that finished without errors.',
+    ('album', ))
+# set from the database when the metrics are collected, see get_database_snapshot
+IMPORT_QUEUE_JOBS = REGISTRY.gauge(
+    'album_creator_import_queue_jobs',
+    'Import jobs waiting for a worker or being processed, by status and mode.',
+    ('status', 'mode'))
+PENDING_NOTIFICATIONS = REGISTRY.gauge(
+    'album_creator_pending_notifications',
+    'Import notifications waiting in the outbox.')
+
+
+def get_metrics_cache():
+    return caches[getattr(settings, 'METRICS_CACHE', 'shared')]
+
+
+def push_metrics(worker_id):
+    """
+    Publishes the metrics of this process in the cache shared by all the
+    processes, so they are exposed by the metrics view of the web server. The
+    metrics of the processes that stopped pushing expire after
+    settings.METRICS_SNAPSHOT_TIMEOUT seconds.
+    :param worker_id: str identifier of the process, see .jobs.get_worker_id
+    :return: None
+    """
+    cache = get_metrics_cache()
+    timeout = getattr(settings, 'METRICS_SNAPSHOT_TIMEOUT', 24 * 60 * 60)
+    try:
+        cache.set('album_creator:metrics:{}'.format(worker_id), REGISTRY.snapshot(), timeout)
+        worker_ids = cache.get(WORKERS_INDEX_KEY) or []
+        if worker_id not in worker_ids:
+            # a worker lost by a concurrent update is added back by its next push
+            cache.set(WORKERS_INDEX_KEY, worker_ids + [worker_id], None)
+    except Exception:
+        # metrics must never break an import
+        logger.warning('Failed to push the metrics', exc_info=True)
+
+
+def get_worker_snapshots(exclude_worker_id=None):
+    """
+    :param exclude_worker_id: str identifier of a worker whose snapshot is skipped,
+    the current process is counted from its own registry
+    :return: list of the snapshots pushed by the workers, see push_metrics
+    """
+    cache = get_metrics_cache()
+    worker_ids = cache.get(WORKERS_INDEX_KEY) or []
+    if not worker_ids:
+        return []
+    keys = {'album_creator:metrics:{}'.format(worker_id): worker_id
+            for worker_id in worker_ids}
+    snapshots = cache.get_many(list(keys))
+    if len(snapshots) < len(keys):
+        # forget the expired workers
+        cache.set(WORKERS_INDEX_KEY, [keys[key] for key in keys if key in snapshots], None)
+    return [snapshot for key, snapshot in snapshots.items()
+            if keys[key] != exclude_worker_id]
+
+
+def get_database_snapshot():
+    """
+    Queue depth, outbox size and the last successful import jobs, read from the
+    database, so they do not depend on the workers pushing their metrics.
+    :return: snapshot of the database based metrics, see Registry.snapshot
+    """
+    queue_jobs = {(status, mode): 0
+                  for status in (ImportJob.STATUS_PENDING, ImportJob.STATUS_RUNNING)
+                  for mode, __ in ImportJob.MODE_CHOICES}
+    queue_jobs.update(
+        ((row['status'], row['mode']), row['count'])
+        for row in ImportJob.objects.filter(status__in=[ImportJob.STATUS_PENDING,
+                                                        ImportJob.STATUS_RUNNING])
+                                    .values('status', 'mode')
+                                    .annotate(count=Count('pk'))
+                                    .order_by())
+    last_successful_imports = {
+        (row['album__name'], ): timegm(row['finished_at'].utctimetuple())
+        for row in ImportJob.objects.filter(status=ImportJob.STATUS_DONE)
+                                    .values('album__name')
+                                    .annotate(finished_at=Max('finished_at'))
+                                    .order_by()
+        if row['finished_at'] is not None
+    }
+    return {
+        IMPORT_QUEUE_JOBS.name: queue_jobs,
+        PENDING_NOTIFICATIONS.name: {(): ImportNotification.objects.filter(
+            status=ImportNotification.STATUS_PENDING).count()},
+        LAST_SUCCESSFUL_IMPORT.name: last_successful_imports,
+    }
+
+
+def render_metrics(worker_id=None):
+    """
+    :param worker_id: str identifier of the current process, see push_metrics
+    :return: str metrics of this process, of all the workers and of the
+    database, in the Prometheus text exposition format
+    """
+    snapshots = [REGISTRY.snapshot(), get_database_snapshot()]
+    snapshots.extend(get_worker_snapshots(exclude_worker_id=worker_id))
+    return REGISTRY.render(REGISTRY.merge_snapshots(snapshots))
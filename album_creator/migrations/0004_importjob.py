@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 11:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0003_auto_20160802_1202'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('dead', 'Dead')], db_index=True, default='pending', max_length=16, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='Max attempts')),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Job will not be picked up by workers before this time', verbose_name='Run after')),
+                ('leased_by', models.CharField(blank=True, help_text='Identifier of the worker that is processing the job', max_length=255, verbose_name='Leased by')),
+                ('leased_until', models.DateTimeField(blank=True, help_text='Job can be claimed by another worker after this time', null=True, verbose_name='Leased until')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('imported_count', models.PositiveIntegerField(default=0, verbose_name='Imported photos count')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='album_creator.Album')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 11:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0005_image_checksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='backfill_completed_at',
+            field=models.DateTimeField(blank=True, help_text='All available older tweets were imported', null=True, verbose_name='Backfill completed at'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='backfill_max_id',
+            field=models.BigIntegerField(blank=True, help_text='Older tweets are imported starting from this tweet id', null=True, verbose_name='Backfill cursor'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('recent', 'New tweets'), ('backfill', 'Older tweets')], default='recent', max_length=16, verbose_name='Mode'),
+        ),
+    ]
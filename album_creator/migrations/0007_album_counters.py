@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 11:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def fill_album_counters(apps, schema_editor):
+    Album = apps.get_model('album_creator', 'Album')
+    AlbumImageRelation = apps.get_model('album_creator', 'AlbumImageRelation')
+    albums = Album.objects.annotate(
+        actual_image_count=Count('image_relations'),
+        actual_last_imported_at=Max('image_relations__imported_at'),
+    )
+    for album in albums.filter(actual_image_count__gt=0):
+        last_tweet_id, cover_image_id = (AlbumImageRelation.objects
+                                                           .filter(album=album)
+                                                           .order_by('-tweet_id')
+                                                           .values_list('tweet_id', 'image_id')
+                                                           .first())
+        Album.objects.filter(pk=album.pk).update(
+            image_count=album.actual_image_count,
+            last_tweet_id=last_tweet_id,
+            last_imported_at=album.actual_last_imported_at,
+            cover_image_id=cover_image_id,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0006_search_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Image of the last imported tweet', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='album_creator.Image', verbose_name='Cover image'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Images count'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='last_imported_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last import datetime'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='last_tweet_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Last imported tweet ID'),
+        ),
+        migrations.RunPython(fill_album_counters, migrations.RunPython.noop),
+    ]
+
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 11:24
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0007_album_counters'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='albumimagerelation',
+            options={'ordering': ('-tweet_id', '-pk')},
+        ),
+        migrations.AlterIndexTogether(
+            name='albumimagerelation',
+            index_together=set([('album', 'tweet_id'), ('album', 'imported_at')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 11:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0008_relation_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='thumbnails_ready',
+            field=models.BooleanField(default=False, help_text='Thumbnails of all the aliases were generated', verbose_name='Thumbnails ready'),
+        ),
+    ]
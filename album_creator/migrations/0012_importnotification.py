@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 11:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0011_album_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now, help_text='Notification will not be sent before this time', verbose_name='Send after')),
+                ('leased_by', models.CharField(blank=True, help_text='Identifier of the sender that is sending the notification', max_length=255, verbose_name='Leased by')),
+                ('leased_until', models.DateTimeField(blank=True, help_text='Notification can be claimed by another sender after this time', null=True, verbose_name='Leased until')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent at')),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='album_creator.Album')),
+                ('images', models.ManyToManyField(related_name='_importnotification_images_+', to='album_creator.Image')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
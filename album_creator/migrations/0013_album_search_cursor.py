@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 12:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0012_importnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='search_max_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Interrupted import cursor'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='search_since_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Interrupted import since_id'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 12:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0013_album_search_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Modified at'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-17 12:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_creator', '0014_album_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitWindow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Identifier of the twitter app', max_length=255, unique=True, verbose_name='Key')),
+                ('remaining', models.IntegerField(verbose_name='Remaining requests')),
+                ('reset_at', models.FloatField(help_text='Unix timestamp of the window reset', verbose_name='Reset at')),
+            ],
+        ),
+    ]
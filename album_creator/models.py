@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 
 from django.db import models
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible, force_text
 
 
@@ -21,10 +22,94 @@ class Album(models.Model):
         related_name='albums',
         through='AlbumImageRelation',
     )
+    backfill_max_id = models.BigIntegerField(
+        verbose_name='Backfill cursor',
+        help_text='Older tweets are imported starting from this tweet id',
+        null=True,
+        blank=True,
+    )
+    backfill_completed_at = models.DateTimeField(
+        verbose_name='Backfill completed at',
+        help_text='All available older tweets were imported',
+        null=True,
+        blank=True,
+    )
+    # the search walk of an interrupted import, the tweets between
+    # search_since_id and search_max_id were not imported yet, see
+    # .helpers.import_photos_for_album
+    search_since_id = models.BigIntegerField(
+        verbose_name='Interrupted import since_id',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    search_max_id = models.BigIntegerField(
+        verbose_name='Interrupted import cursor',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    # denormalized from the image relations, kept up to date by the importer
+    # and the relations signals, see .counters
+    image_count = models.PositiveIntegerField(
+        verbose_name='Images count',
+        default=0,
+        editable=False,
+    )
+    last_tweet_id = models.BigIntegerField(
+        verbose_name='Last imported tweet ID',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    last_imported_at = models.DateTimeField(
+        verbose_name='Last import datetime',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    cover_image = models.ForeignKey(
+        to='Image',
+        verbose_name='Cover image',
+        help_text='Image of the last imported tweet',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    # bumped whenever the album pages change, the cached pages and the
+    # ETags depend on it, see .versioning
+    version = models.PositiveIntegerField(
+        verbose_name='Version',
+        default=0,
+        editable=False,
+    )
+    # the time of the last version bump, the Last-Modified of the album pages
+    modified_at = models.DateTimeField(
+        verbose_name='Modified at',
+        default=timezone.now,
+        editable=False,
+    )
+
+    # changed with queryset updates only, see .counters and .helpers
+    denormalized_fields = ('image_count', 'last_tweet_id', 'last_imported_at',
+                           'cover_image', 'version', 'modified_at',
+                           'search_since_id', 'search_max_id',
+                           'backfill_max_id', 'backfill_completed_at', )
 
     def __str__(self):
         return force_text(self.name)
 
+    def save(self, *args, **kwargs):
+        # saving a loaded album, e.g. in the admin, must not overwrite the
+        # counters updated by the imports in the meantime
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.denormalized_fields]
+        super(Album, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('album-detail', kwargs={'album_name': self.name})
 
@@ -44,11 +129,65 @@ class Image(models.Model):
         verbose_name='Original image url',
         unique=True,
     )
+    checksum = models.CharField(
+        verbose_name='Checksum',
+        help_text='SHA1 of the fetched image file',
+        max_length=40,
+        blank=True,
+        db_index=True,
+    )
+    thumbnails_ready = models.BooleanField(
+        verbose_name='Thumbnails ready',
+        help_text='Thumbnails of all the aliases were generated',
+        default=False,
+    )
 
     def __str__(self):
         return force_text(self.original_image_url)
 
 
+@python_2_unicode_compatible
+class Rendition(models.Model):
+    """
+    Resized copy of an image in one of the formats served to the browsers,
+    see .renditions.
+    """
+    FORMAT_JPEG = 'jpeg'
+    FORMAT_WEBP = 'webp'
+    FORMAT_CHOICES = (
+        (FORMAT_JPEG, 'JPEG'),
+        (FORMAT_WEBP, 'WebP'),
+    )
+
+    image = models.ForeignKey(
+        to='Image',
+        related_name='renditions',
+    )
+    format = models.CharField(
+        verbose_name='Format',
+        max_length=10,
+        choices=FORMAT_CHOICES,
+    )
+    width = models.PositiveIntegerField(
+        verbose_name='Width',
+    )
+    height = models.PositiveIntegerField(
+        verbose_name='Height',
+    )
+    rendition_file = models.ImageField(
+        verbose_name='Rendition file',
+        upload_to='renditions/',
+    )
+
+    def __str__(self):
+        return force_text('{} {}x{} {}'.format(
+            self.image_id, self.width, self.height, self.format))
+
+    class Meta:
+        unique_together = (('image', 'format', 'width'),)
+        ordering = ('image', 'format', 'width',)
+
+
 @python_2_unicode_compatible
 class AlbumImageRelation(models.Model):
     """
@@ -82,3 +221,199 @@ class AlbumImageRelation(models.Model):
 
     class Meta:
         unique_together = (('album', 'image'),)
+        # album timeline: the newest tweets first, the last imported tweet of the
+        # album (since_id) and the recently imported photos are index lookups
+        index_together = (('album', 'tweet_id'), ('album', 'imported_at'),)
+        ordering = ('-tweet_id', '-pk',)
+
+
+@python_2_unicode_compatible
+class ImportJob(models.Model):
+    """
+    Queued import of tweets for an album. Jobs are claimed by the import workers
+    (see run_import_workers management command) with a time limited lease, failed
+    jobs are retried with a delay until max_attempts is reached, after that they are
+    marked as dead and kept for inspection.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_DEAD, 'Dead'),
+    )
+    MODE_RECENT = 'recent'
+    MODE_BACKFILL = 'backfill'
+    MODE_CHOICES = (
+        (MODE_RECENT, 'New tweets'),
+        (MODE_BACKFILL, 'Older tweets'),
+    )
+
+    album = models.ForeignKey(
+        to='Album',
+        related_name='import_jobs',
+    )
+    mode = models.CharField(
+        verbose_name='Mode',
+        max_length=16,
+        choices=MODE_CHOICES,
+        default=MODE_RECENT,
+    )
+    status = models.CharField(
+        verbose_name='Status',
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name='Attempts',
+        default=0,
+    )
+    max_attempts = models.PositiveIntegerField(
+        verbose_name='Max attempts',
+        default=5,
+    )
+    run_after = models.DateTimeField(
+        verbose_name='Run after',
+        help_text='Job will not be picked up by workers before this time',
+        default=timezone.now,
+        db_index=True,
+    )
+    leased_by = models.CharField(
+        verbose_name='Leased by',
+        help_text='Identifier of the worker that is processing the job',
+        max_length=255,
+        blank=True,
+    )
+    leased_until = models.DateTimeField(
+        verbose_name='Leased until',
+        help_text='Job can be claimed by another worker after this time',
+        null=True,
+        blank=True,
+    )
+    last_error = models.TextField(
+        verbose_name='Last error',
+        blank=True,
+    )
+    imported_count = models.PositiveIntegerField(
+        verbose_name='Imported photos count',
+        default=0,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Created at',
+        auto_now_add=True,
+    )
+    finished_at = models.DateTimeField(
+        verbose_name='Finished at',
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return force_text('{} ({})'.format(self.pk, self.status))
+
+    class Meta:
+        ordering = ('-created_at',)
+
+
+@python_2_unicode_compatible
+class ImportNotification(models.Model):
+    """
+    Outbox entry written by an import that brought new photos. The pending
+    notifications of an album are sent to the managers as a single digest by the
+    sender (see send_notifications management command) once the oldest of them
+    is older than the digest window, failed digests are retried with a delay
+    until max_attempts is reached.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    album = models.ForeignKey(
+        to='Album',
+        related_name='notifications',
+    )
+    images = models.ManyToManyField(
+        to='Image',
+        related_name='+',
+    )
+    status = models.CharField(
+        verbose_name='Status',
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name='Attempts',
+        default=0,
+    )
+    send_after = models.DateTimeField(
+        verbose_name='Send after',
+        help_text='Notification will not be sent before this time',
+        default=timezone.now,
+    )
+    leased_by = models.CharField(
+        verbose_name='Leased by',
+        help_text='Identifier of the sender that is sending the notification',
+        max_length=255,
+        blank=True,
+    )
+    leased_until = models.DateTimeField(
+        verbose_name='Leased until',
+        help_text='Notification can be claimed by another sender after this time',
+        null=True,
+        blank=True,
+    )
+    last_error = models.TextField(
+        verbose_name='Last error',
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Created at',
+        auto_now_add=True,
+    )
+    sent_at = models.DateTimeField(
+        verbose_name='Sent at',
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return force_text('{} ({})'.format(self.pk, self.status))
+
+    class Meta:
+        ordering = ('-created_at',)
+
+
+@python_2_unicode_compatible
+class RateLimitWindow(models.Model):
+    """
+    Search rate limit window of a twitter app, shared by all the workers. The
+    tokens are taken with conditional updates, see .ratelimit.SearchRateLimiter.
+    """
+    key = models.CharField(
+        verbose_name='Key',
+        help_text='Identifier of the twitter app',
+        max_length=255,
+        unique=True,
+    )
+    remaining = models.IntegerField(
+        verbose_name='Remaining requests',
+    )
+    reset_at = models.FloatField(
+        verbose_name='Reset at',
+        help_text='Unix timestamp of the window reset',
+    )
+
+    def __str__(self):
+        return force_text('{} ({})'.format(self.key, self.remaining))
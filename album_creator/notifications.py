@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import traceback
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models import F, Max, Min, Q
+from django.utils import timezone
+
+from .helpers import construct_notification_emails
+from .metrics import FAILURES, IMPORT_STAGE_SECONDS, SENT_EMAILS
+from .models import Album, ImportNotification
+
+logger = logging.getLogger(__name__)
+
+EMAIL_SUBJECT_TEMPLATE_NAME = 'album_creator/emails/import_notification.subject.txt'
+EMAIL_BODY_TEMPLATE_NAME = 'album_creator/emails/import_notification.body.txt'
+
+# image relations of a notification are inserted with multi-row INSERTs of this
+# size (SQLite limits the number of terms in a statement)
+INSERT_BATCH_SIZE = 500
+
+
+def get_managers_emails():
+    # extract email from MANAGERS tuple
+    email_getter = itemgetter(1)
+    return list(map(email_getter, settings.MANAGERS))
+
+
+def get_digest_window():
+    return timedelta(seconds=getattr(settings, 'IMPORT_NOTIFICATION_DIGEST_WINDOW', 300))
+
+
+def get_retry_delay(attempts):
+    """
+    :param attempts: int number of attempts already made
+    :return: datetime.timedelta delay before the next attempt, grows
+    exponentially with the number of attempts
+    """
+    base_delay = getattr(settings, 'IMPORT_NOTIFICATION_RETRY_DELAY', 60)
+    max_delay = getattr(settings, 'IMPORT_NOTIFICATION_MAX_RETRY_DELAY', 3600)
+    delay = base_delay * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, max_delay))
+
+
+def queue_import_notification(album_name, imported_photos_pks):
+    """
+    Writes the notification about the imported photos to the outbox, it is sent
+    to the managers later by the sender, together with the other imports of the
+    album in the digest window.
+    :param album_name: str album name
+    :param imported_photos_pks: list of imported photos pks
+    :return: ImportNotification instance, None if nothing was imported
+    """
+    if not imported_photos_pks:
+        return None
+    notification = ImportNotification.objects.create(
+        album=Album.objects.get(name=album_name))
+    image_relation = ImportNotification.images.through
+    image_relation.objects.bulk_create([
+        image_relation(importnotification_id=notification.pk, image_id=image_pk)
+        for image_pk in set(imported_photos_pks)
+    ], batch_size=INSERT_BATCH_SIZE)
+    return notification
+
+
+def get_due_album_pks(now=None):
+    """
+    Albums whose pending notifications are due: the oldest of them has waited for
+    the digest window and none of them is waiting for a retry.
+    :param now: datetime, defaults to the current time
+    :return: list of albums pks
+    """
+    if now is None:
+        now = timezone.now()
+    return list(ImportNotification.objects
+                                  .filter(status=ImportNotification.STATUS_PENDING)
+                                  .values('album')
+                                  .annotate(first_created_at=Min('created_at'),
+                                            retry_at=Max('send_after'))
+                                  .filter(first_created_at__lte=now - get_digest_window(),
+                                          retry_at__lte=now)
+                                  .order_by('first_created_at')
+                                  .values_list('album', flat=True))
+
+
+def claim_album_notifications(album_pk, worker_id, now=None, lease_seconds=None):
+    """
+    Leases the pending notifications of the album to the sender, so they are not
+    sent twice by concurrent senders.
+    :param album_pk: int album pk
+    :param worker_id: str identifier of the sender
+    :param now: datetime, defaults to the current time
+    :param lease_seconds: int for how long the notifications are leased
+    :return: list of pks of the claimed notifications
+    """
+    if now is None:
+        now = timezone.now()
+    if lease_seconds is None:
+        lease_seconds = getattr(settings, 'IMPORT_NOTIFICATION_LEASE_SECONDS', 300)
+    leased_until = now + timedelta(seconds=lease_seconds)
+    pending_qs = ImportNotification.objects.filter(
+        album_id=album_pk, status=ImportNotification.STATUS_PENDING)
+    pending_qs.filter(Q(leased_until__isnull=True) | Q(leased_until__lt=now)).update(
+        leased_by=worker_id, leased_until=leased_until)
+    return list(pending_qs.filter(leased_by=worker_id, leased_until=leased_until)
+                          .values_list('pk', flat=True))
+
+
+def build_digest_messages(album_pk, notification_pks, connection=None):
+    """
+    Builds the digest of the notifications of the album, the templates are
+    rendered once for all the recipients.
+    :param album_pk: int album pk
+    :param notification_pks: list of the notifications pks
+    :param connection: email backend instance the messages are sent with
+    :return: list of EmailMessage instances, one for every manager
+    """
+    # a subquery, a digest may have more images than the query parameters limit
+    image_pks = (ImportNotification.images.through.objects
+                                   .filter(importnotification__in=notification_pks)
+                                   .values_list('image_id', flat=True))
+    data = construct_notification_emails(
+        subject_template_name=EMAIL_SUBJECT_TEMPLATE_NAME,
+        body_template_name=EMAIL_BODY_TEMPLATE_NAME,
+        album_name=Album.objects.values_list('name', flat=True).get(pk=album_pk),
+        photo_pks_list=image_pks,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipients=get_managers_emails(),
+    )
+    return [EmailMessage(subject, body, from_email, recipients, connection=connection)
+            for subject, body, from_email, recipients in data]
+
+
+def send_album_digest(album_pk, notification_pks, worker_id, connection, now=None):
+    """
+    Sends the digest of the claimed notifications. A failed digest is retried
+    with a delay, all the claimed notifications are marked as failed after
+    settings.IMPORT_NOTIFICATION_MAX_ATTEMPTS attempts.
+    :param album_pk: int album pk
+    :param notification_pks: list of pks of the notifications claimed by the sender
+    :param worker_id: str identifier of the sender
+    :param connection: email backend instance, opened by the caller to be
+    reused for several digests
+    :param now: datetime, defaults to the current time
+    :return: bool the digest was sent
+    """
+    if now is None:
+        now = timezone.now()
+    claimed_qs = ImportNotification.objects.filter(pk__in=notification_pks,
+                                                   leased_by=worker_id)
+    try:
+        messages = build_digest_messages(album_pk, notification_pks,
+                                         connection=connection)
+        with IMPORT_STAGE_SECONDS.time(stage='email'):
+            # reopens the connection closed after a failure
+            connection.open()
+            connection.send_messages(messages)
+    except Exception:
+        error = traceback.format_exc()
+        FAILURES.inc(reason='email')
+        logger.warning('Failed to send the notifications of album {}'.format(album_pk),
+                       exc_info=True)
+        # the connection may be broken
+        try:
+            connection.close()
+        except Exception:
+            pass
+        attempts = (claimed_qs.aggregate(attempts=Max('attempts'))['attempts'] or 0) + 1
+        max_attempts = getattr(settings, 'IMPORT_NOTIFICATION_MAX_ATTEMPTS', 5)
+        failed_values = {}
+        if attempts >= max_attempts:
+            failed_values['status'] = ImportNotification.STATUS_FAILED
+        else:
+            failed_values['send_after'] = now + get_retry_delay(attempts)
+        claimed_qs.update(attempts=F('attempts') + 1, leased_by='', leased_until=None,
+                          last_error=error, **failed_values)
+        return False
+    SENT_EMAILS.inc(len(messages))
+    claimed_qs.update(status=ImportNotification.STATUS_SENT, sent_at=now,
+                      attempts=F('attempts') + 1, leased_by='', leased_until=None)
+    return True
+
+
+def send_due_notifications(worker_id, connection, now=None):
+    """
+    Sends the digests of all the albums with due notifications.
+    :param worker_id: str identifier of the sender
+    :param connection: email backend instance, the digests are sent through it
+    :param now: datetime, defaults to the current time
+    :return: int number of sent digests
+    """
+    if now is None:
+        now = timezone.now()
+    sent_count = 0
+    for album_pk in get_due_album_pks(now):
+        notification_pks = claim_album_notifications(album_pk, worker_id, now=now)
+        if notification_pks:
+            sent_count += send_album_digest(album_pk, notification_pks, worker_id,
+                                            connection, now=now)
+    return sent_count
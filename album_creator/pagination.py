@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db.models import Q
+
+CURSOR_SEPARATOR = '_'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def make_cursor(relation):
+    """
+    :param relation: .models.AlbumImageRelation instance, the last one on the page
+    :return: str opaque position in the album timeline
+    """
+    return '{}{}{}'.format(relation.tweet_id, CURSOR_SEPARATOR, relation.pk)
+
+
+def parse_cursor(cursor):
+    """
+    :param cursor: str cursor built with make_cursor
+    :return: tuple (int tweet id, int pk)
+    :raises InvalidCursor: if the cursor is malformed
+    """
+    try:
+        tweet_id, pk = cursor.split(CURSOR_SEPARATOR)
+        return int(tweet_id), int(pk)
+    except (AttributeError, ValueError):
+        raise InvalidCursor('Invalid cursor {!r}'.format(cursor))
+
+
+def get_timeline_queryset(relations_qs, cursor=None):
+    """
+    :param relations_qs: queryset of AlbumImageRelation of a single album
+    :param cursor: str position after which the timeline starts, see
+    make_cursor, the whole timeline if None
+    :return: queryset of the relations after the cursor, the newest tweets first
+    :raises InvalidCursor: if the cursor is malformed
+    """
+    relations_qs = relations_qs.order_by('-tweet_id', '-pk')
+    if cursor is not None:
+        tweet_id, pk = parse_cursor(cursor)
+        relations_qs = relations_qs.filter(
+            Q(tweet_id__lt=tweet_id) | Q(tweet_id=tweet_id, pk__lt=pk))
+    return relations_qs
+
+
+def paginate_timeline(relations_qs, cursor=None, page_size=24):
+    """
+    Keyset pagination of the album timeline, the newest tweets first. Unlike the
+    OFFSET pagination the page is an index range scan on (album, tweet_id) that
+    starts right after the cursor, so it costs the same at any depth, and nothing
+    is counted.
+    :param relations_qs: queryset of AlbumImageRelation of a single album
+    :param cursor: str position after which the page starts, see make_cursor,
+    the first page if None
+    :param page_size: int number of relations per page
+    :return: tuple (list of AlbumImageRelation, str cursor of the next page or
+    None if this is the last page)
+    :raises InvalidCursor: if the cursor is malformed
+    """
+    # one extra row tells if there is the next page
+    relations = list(get_timeline_queryset(relations_qs, cursor)[:page_size + 1])
+    if len(relations) <= page_size:
+        return relations, None
+    relations = relations[:page_size]
+    return relations, make_cursor(relations[-1])
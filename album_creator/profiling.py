@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, unicode_literals
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class RequestProfile(object):
+    """
+    Time spent by a single request in the database, the templates and the
+    serializers, see ProfilingMiddleware.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        self.queries = []
+        self.sections = {}
+        self._queries_log_lengths = {}
+        self._force_debug_cursors = {}
+
+    def start_queries_capture(self):
+        # the same way as django.test.utils.CaptureQueriesContext, the queries
+        # are recorded by the debug cursor even with DEBUG off
+        for connection in connections.all():
+            self._force_debug_cursors[connection.alias] = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            self._queries_log_lengths[connection.alias] = len(connection.queries_log)
+
+    def stop_queries_capture(self):
+        for connection in connections.all():
+            if connection.alias not in self._queries_log_lengths:
+                continue
+            self.queries.extend(
+                list(connection.queries_log)[self._queries_log_lengths[connection.alias]:])
+            connection.force_debug_cursor = self._force_debug_cursors[connection.alias]
+
+    def finish(self):
+        self.stop_queries_capture()
+        self.finished_at = time.time()
+
+    def add_section_time(self, name, seconds):
+        self.sections[name] = self.sections.get(name, 0) + seconds
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(float(query['time']) for query in self.queries)
+
+    @property
+    def total_time(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def get_server_timing(self):
+        """
+        :return: str value of the Server-Timing header, durations in milliseconds
+        """
+        metrics = ['db;dur={:.1f};desc="{} queries"'.format(self.db_time * 1000,
+                                                           self.query_count)]
+        for name, seconds in sorted(self.sections.items()):
+            metrics.append('{};dur={:.1f}'.format(name, seconds * 1000))
+        metrics.append('total;dur={:.1f}'.format(self.total_time * 1000))
+        return ', '.join(metrics)
+
+
+def get_current_profile():
+    """
+    :return: RequestProfile of the request handled by this thread, None if the
+    request is not profiled
+    """
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def profile_section(name):
+    """
+    Adds the time spent in the block to the section of the current request
+    profile, does nothing if the request is not profiled.
+    :param name: str section name, reported in the Server-Timing header
+    """
+    profile = get_current_profile()
+    if profile is None:
+        yield
+        return
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        profile.add_section_time(name, time.time() - started_at)
+
+
+class ProfilingMiddleware(object):
+    """
+    Reports the queries count and the time spent in the database, the templates
+    and the serializers in the Server-Timing header of every response and logs
+    them for a sample of the requests. Only enabled with
+    settings.REQUEST_PROFILING, it should be the first of the middlewares to
+    see the whole request.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        profile = RequestProfile()
+        profile.start_queries_capture()
+        _local.profile = profile
+
+    def process_template_response(self, request, response):
+        # rendered here instead of by the handler to be measured
+        with profile_section('template'):
+            response.render()
+        return response
+
+    def process_response(self, request, response):
+        profile = get_current_profile()
+        if profile is None:
+            # the request was rejected by a middleware before this one
+            return response
+        _local.profile = None
+        profile.finish()
+        response['Server-Timing'] = profile.get_server_timing()
+        # kept for the tests, see tests.base.RequestBudgetMixin
+        response.profile = profile
+        if random.random() < getattr(settings, 'REQUEST_PROFILING_LOG_SAMPLE_RATE', 0.01):
+            logger.info('{} {} {}: {} queries, {}'.format(
+                request.method, request.get_full_path(), response.status_code,
+                profile.query_count, profile.get_server_timing()))
+        return response
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db.models import F
+from twython import TwythonRateLimitError
+
+from .models import RateLimitWindow
+
+logger = logging.getLogger(__name__)
+
+# twitter search rate limit window is 15 minutes
+DEFAULT_WINDOW_SECONDS = 15 * 60
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when the rate limit window is exhausted and it resets later than
+    the caller is willing to wait.
+    """
+
+    def __init__(self, msg, reset_at):
+        super(RateLimitExceeded, self).__init__(msg)
+        # unix timestamp when the requests can be made again
+        self.reset_at = reset_at
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SearchRateLimiter(object):
+    """
+    Token bucket for the search endpoint of a single twitter app. The number of
+    remaining requests and the window reset time are reported by twitter in the
+    x-rate-limit-* headers, they are kept in a RateLimitWindow row shared by all
+    the workers and every request takes a token from it. A token is taken with
+    a single conditional UPDATE, so the concurrent workers never spend more
+    than the window allows.
+    """
+
+    def __init__(self, key, max_wait=None):
+        """
+        :param key: str identifier of the twitter app, e.g. the app key
+        :param max_wait: int how many seconds acquire may sleep waiting for the
+        window reset, defaults to settings.TWITTER_RATE_LIMIT_MAX_WAIT
+        """
+        if max_wait is None:
+            max_wait = getattr(settings, 'TWITTER_RATE_LIMIT_MAX_WAIT', 0)
+        self.key = key
+        self.max_wait = max_wait
+
+    def get_window_qs(self):
+        # the expired windows are unknown
+        return RateLimitWindow.objects.filter(key=self.key, reset_at__gt=time.time())
+
+    def get_state(self):
+        """
+        :return: tuple (int remaining requests, int window reset timestamp), both
+        are None if the window state is unknown
+        """
+        state = self.get_window_qs().values_list('remaining', 'reset_at').first()
+        if state is None:
+            return None, None
+        return state
+
+    def update(self, remaining, reset_at):
+        """
+        Stores the window state reported by twitter.
+        :param remaining: int remaining requests in the window
+        :param reset_at: int window reset unix timestamp
+        """
+        RateLimitWindow.objects.update_or_create(
+            key=self.key, defaults={'remaining': remaining, 'reset_at': reset_at})
+
+    def update_from_headers(self, headers):
+        """
+        :param headers: dict-like response headers
+        """
+        remaining = _to_int(headers.get('x-rate-limit-remaining'))
+        reset_at = _to_int(headers.get('x-rate-limit-reset'))
+        if remaining is not None and reset_at is not None:
+            self.update(remaining, reset_at)
+
+    def take_token(self):
+        """
+        :return: bool a token was taken from the current window
+        """
+        return bool(self.get_window_qs().filter(remaining__gt=0).update(
+            remaining=F('remaining') - 1))
+
+    def acquire(self):
+        """
+        Takes a token for a single request. Waits for the window reset if it is
+        closer than max_wait seconds.
+        :raises RateLimitExceeded: if there are no tokens left in this window
+        """
+        if self.take_token():
+            return
+        remaining, reset_at = self.get_state()
+        if remaining is None:
+            # nothing is known about the window yet, the response headers will tell
+            return
+        if remaining > 0:
+            # the window was updated from the headers in the meantime
+            return self.acquire()
+        wait = reset_at - time.time()
+        if wait > self.max_wait:
+            raise RateLimitExceeded(
+                'Search rate limit exhausted until {}'.format(reset_at), reset_at)
+        logger.debug('Waiting {:.1f}s for the rate limit window reset'.format(wait))
+        time.sleep(max(wait, 0))
+
+
+class RateLimitedTwitterApi(object):
+    """
+    Wraps the Twython api, search requests are made through the shared rate
+    limiter. Responses with 429 status are retried with a jittered exponential
+    backoff. Other attributes are proxied to the wrapped api.
+    """
+
+    def __init__(self, api, limiter=None, max_retries=None, backoff=None):
+        """
+        :param api: Twython instance, twitter api connection
+        :param limiter: SearchRateLimiter, defaults to a limiter for the api app key
+        :param max_retries: int number of retries on 429 responses
+        :param backoff: float base delay of the retries in seconds
+        """
+        self.api = api
+        if limiter is None:
+            limiter = SearchRateLimiter(api.app_key)
+        self.limiter = limiter
+        if max_retries is None:
+            max_retries = getattr(settings, 'TWITTER_RATE_LIMIT_RETRIES', 3)
+        if backoff is None:
+            backoff = getattr(settings, 'TWITTER_RATE_LIMIT_BACKOFF', 1.0)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+    def get_backoff_delay(self, attempt):
+        # full jitter, spreads the retries of the workers hitting the limit together
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def search(self, **kwargs):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                search_results = self.api.search(**kwargs)
+            except TwythonRateLimitError as e:
+                reset_at = _to_int(e.retry_after)
+                if reset_at is not None:
+                    self.limiter.update(0, reset_at)
+                else:
+                    reset_at = int(time.time() + DEFAULT_WINDOW_SECONDS)
+                if attempt >= self.max_retries or (
+                        e.retry_after is not None and
+                        reset_at - time.time() > self.limiter.max_wait):
+                    raise RateLimitExceeded(
+                        'Search rate limit exceeded: {}'.format(e), reset_at)
+                delay = self.get_backoff_delay(attempt)
+                logger.warning('Search rate limit exceeded, retrying in {:.1f}s'.format(
+                    delay))
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.limiter.update_from_headers(self.get_last_headers())
+                return search_results
+
+    def get_last_headers(self):
+        return {
+            header: self.api.get_lastfunction_header(header)
+            for header in ('x-rate-limit-remaining', 'x-rate-limit-reset')
+        }
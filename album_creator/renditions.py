@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import os
+from io import BytesIO
+
+from PIL import Image as PILImage
+from PIL import ImageOps as PILImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .models import Rendition
+
+logger = logging.getLogger(__name__)
+
+# PIL save format and file extension of the rendition formats
+PIL_FORMATS = {
+    Rendition.FORMAT_JPEG: ('JPEG', 'jpg'),
+    Rendition.FORMAT_WEBP: ('WEBP', 'webp'),
+}
+
+
+def get_rendition_widths():
+    return sorted(getattr(settings, 'IMAGE_RENDITION_WIDTHS', (200, 400, 800)))
+
+
+def get_rendition_formats():
+    """
+    :return: list of Rendition.FORMAT_* the renditions are generated in, formats
+    the installed PIL can't write are skipped
+    """
+    PILImage.init()
+    formats = getattr(settings, 'IMAGE_RENDITION_FORMATS',
+                      (Rendition.FORMAT_WEBP, Rendition.FORMAT_JPEG))
+    return [rendition_format for rendition_format in formats
+            if PIL_FORMATS[rendition_format][0] in PILImage.SAVE]
+
+
+def get_rendition_size(width):
+    ratio_width, ratio_height = getattr(settings, 'IMAGE_RENDITION_ASPECT_RATIO', (4, 3))
+    return width, int(round(width * ratio_height / float(ratio_width)))
+
+
+def generate_image_renditions(image_instance):
+    """
+    Crops the image to the renditions aspect ratio and stores it resized to
+    every rendition width in every format. Images are never upscaled: the
+    renditions that don't fit in the image are skipped, an image smaller than
+    all of them gets a single rendition of its own size. Only the files
+    are touched, so it is safe to call it from several threads.
+    :param image_instance: .models.Image instance
+    :return: list of unsaved Rendition instances
+    """
+    image_instance.image_file.open('rb')
+    try:
+        source_image = PILImage.open(image_instance.image_file)
+        source_image.load()
+    finally:
+        image_instance.image_file.close()
+    # WebP is written in RGB(A) only, e.g. the grayscale images are converted too
+    if source_image.mode != 'RGB':
+        source_image = source_image.convert('RGB')
+    source_width, source_height = source_image.size
+    sizes = [get_rendition_size(width) for width in get_rendition_widths()]
+    fitting_sizes = [(width, height) for width, height in sizes
+                     if width <= source_width and height <= source_height]
+    if not fitting_sizes:
+        # the image is smaller than the smallest rendition in one of the
+        # dimensions, it is only cropped to the aspect ratio
+        width, height = sizes[0]
+        width = min(width, source_width, int(source_height * width / float(height)))
+        fitting_sizes = [get_rendition_size(max(width, 1))]
+    base_name = os.path.splitext(os.path.basename(image_instance.image_file.name))[0]
+    renditions = []
+    for width, height in fitting_sizes:
+        resized_image = PILImageOps.fit(source_image, (width, height), PILImage.ANTIALIAS)
+        for rendition_format in get_rendition_formats():
+            pil_format, extension = PIL_FORMATS[rendition_format]
+            content = BytesIO()
+            resized_image.save(content, pil_format, quality=getattr(
+                settings, 'IMAGE_RENDITION_QUALITY', 80))
+            rendition = Rendition(image_id=image_instance.pk, format=rendition_format,
+                                  width=width, height=height)
+            rendition.rendition_file.save(
+                '{}_{}.{}'.format(base_name, width, extension),
+                ContentFile(content.getvalue()), save=False)
+            renditions.append(rendition)
+    return renditions
+
+
+def replace_image_renditions(image_pks, renditions):
+    """
+    Stores the renditions generated for the images instead of their previous ones.
+    :param image_pks: list of images pks
+    :param renditions: list of unsaved Rendition instances for these images
+    :return: None
+    """
+    old_renditions = Rendition.objects.filter(image__in=image_pks)
+    for old_rendition in old_renditions:
+        old_rendition.rendition_file.delete(save=False)
+    old_renditions.delete()
+    Rendition.objects.bulk_create(renditions)
+
+
+def build_srcset(renditions, rendition_format):
+    """
+    :param renditions: iterable of Rendition instances of a single image
+    :param rendition_format: str Rendition.FORMAT_*
+    :return: str value of the srcset attribute, e.g. 'a.webp 200w, b.webp 400w'
+    """
+    return ', '.join(
+        '{} {}w'.format(rendition.rendition_file.url, rendition.width)
+        for rendition in sorted(renditions, key=lambda rendition: rendition.width)
+        if rendition.format == rendition_format)
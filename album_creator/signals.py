@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import add_album_images, bump_album_versions, remove_album_image
+from .models import Album, AlbumImageRelation, Image
+
+
+@receiver(post_save, sender=AlbumImageRelation)
+def album_image_relation_saved(sender, instance, created, raw=False, **kwargs):
+    # bulk_create does not send the signal, the importer updates the counters
+    # of the bulk created relations itself
+    if raw:
+        return
+    if created:
+        add_album_images(instance.album_id, [instance])
+    else:
+        bump_album_versions(Album.objects.filter(pk=instance.album_id))
+
+
+@receiver(post_delete, sender=AlbumImageRelation)
+def album_image_relation_deleted(sender, instance, **kwargs):
+    remove_album_image(instance.album_id)
+
+
+@receiver(post_save, sender=Album)
+def album_saved(sender, instance, created, raw=False, **kwargs):
+    # edited in the admin, the importer only updates the albums with querysets
+    if not created and not raw:
+        bump_album_versions(Album.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        bump_album_versions(Album.objects.filter(images=instance))
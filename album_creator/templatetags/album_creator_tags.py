@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django import template
+
+from ..renditions import build_srcset
+from ..thumbnails import get_thumbnail_url
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_url(image_instance, alias):
+    """
+    Url of the pregenerated thumbnail of the image, thumbnails are never
+    generated while the page is rendered.
+    Usage: {{ image|thumbnail_url:'album_grid' }}
+    """
+    return get_thumbnail_url(image_instance, alias)
+
+
+@register.filter
+def rendition_srcset(image_instance, rendition_format):
+    """
+    srcset attribute value with the renditions of the image in the format,
+    empty if there are none. The renditions should be prefetched.
+    Usage: {{ image|rendition_srcset:'webp' }}
+    """
+    return build_srcset(image_instance.renditions.all(), rendition_format)
@@ -9,6 +9,8 @@ from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.core.files import File
+from django.test import Client, override_settings
+from ..caching import get_cache
 from ..models import Album, Image, AlbumImageRelation
 
 
@@ -27,6 +29,44 @@ def create_image(mode='RGB', size=(800, 600)):
     return image
 
 
+class AlbumCacheMixin(object):
+
+    def setUp(self):
+        # the cache outlives the test database, the new albums could get the
+        # versions of the albums of the previous tests
+        get_cache().clear()
+        super(AlbumCacheMixin, self).setUp()
+
+
+class RequestBudgetMixin(object):
+    """
+    Checks the pages against the queries count and latency budgets, the
+    requests are profiled by album_creator.profiling.ProfilingMiddleware.
+    """
+
+    def assertWithinBudget(self, url, max_queries=None, max_seconds=None, data=None):
+        """
+        :param url: str url requested with GET
+        :param max_queries: int maximum number of queries, not checked if None
+        :param max_seconds: float maximum response time, not checked if None
+        :param data: dict query parameters
+        :return: response
+        """
+        with override_settings(REQUEST_PROFILING=True):
+            # the middlewares are loaded with the first request of the client
+            response = Client().get(url, data)
+        self.assertEqual(response.status_code, 200)
+        profile = response.profile
+        if max_queries is not None and profile.query_count > max_queries:
+            self.fail('{} made {} queries, the budget is {}:\n{}'.format(
+                url, profile.query_count, max_queries,
+                '\n'.join(query['sql'] for query in profile.queries)))
+        if max_seconds is not None and profile.total_time > max_seconds:
+            self.fail('{} took {:.3f}s, the budget is {}s: {}'.format(
+                url, profile.total_time, max_seconds, profile.get_server_timing()))
+        return response
+
+
 class AlbumNamesMixin(object):
     album1_name = 'python'
     album2_name = 'django'
@@ -157,3 +197,73 @@ class UserHelperMixin(object):
             password=make_password(password),
         )
         return user
+
+
+def search_statuses(statuses, params):
+    """
+    Searches the statuses the way twitter does: newest first, with since_id,
+    max_id and count parameters and the next_results cursor.
+    :param statuses: list of tweets dicts sorted by id descending
+    :param params: dict search parameters
+    :return: dict search results
+    """
+    since_id = int(params.get('since_id') or 0)
+    max_id = params.get('max_id')
+    max_id = int(max_id) if max_id else None
+    count = int(params.get('count', 15))
+    matching = [tweet for tweet in statuses
+                if tweet['id'] > since_id and (max_id is None or tweet['id'] <= max_id)]
+    page = matching[:count]
+    search_metadata = {}
+    if len(matching) > count:
+        search_metadata['next_results'] = '?max_id={}&q=test&count={}'.format(
+            page[-1]['id'] - 1, count)
+    return {'search_metadata': search_metadata, 'statuses': page}
+
+
+class FakeTwitterApi(object):
+    """
+    Stand-in for the Twython api, searches predefined statuses (see
+    search_statuses) and keeps the search arguments for inspection.
+    """
+
+    def __init__(self, statuses=None, error=None, failing_calls=None):
+        """
+        :param statuses: list of tweets dicts
+        :param error: exception raised by the searches
+        :param failing_calls: set of int numbers of the searches (1-based) that
+        raise the error, all of them if None
+        """
+        self.statuses = sorted(statuses or [], key=lambda tweet: -tweet['id'])
+        self.error = error
+        self.failing_calls = failing_calls
+        self.search_calls = []
+
+    def search(self, **kwargs):
+        self.search_calls.append(kwargs)
+        if self.error is not None and (self.failing_calls is None or
+                                       len(self.search_calls) in self.failing_calls):
+            raise self.error
+        return search_statuses(self.statuses, kwargs)
+
+
+def make_tweet(tweet_id, image_url=None, screen_name='test_user', hash_tags=()):
+    """
+    Builds tweet data the way it is returned by twitter search api, only the
+    fields used by the import are present.
+    :param tweet_id: int tweet id
+    :param image_url: str url of the attached photo, no media if None
+    :param screen_name: str tweet author
+    :param hash_tags: iterable of str hash tags without the '#' sign
+    :return: dict tweet data
+    """
+    entities = {
+        'hashtags': [{'text': hash_tag} for hash_tag in hash_tags],
+    }
+    if image_url is not None:
+        entities['media'] = [{'type': 'photo', 'media_url': image_url}]
+    return {
+        'id': tweet_id,
+        'user': {'screen_name': screen_name},
+        'entities': entities,
+    }
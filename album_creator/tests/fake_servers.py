@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import socket
+import threading
+import time
+from io import BytesIO
+
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib.parse import urlsplit, parse_qsl
+from twython import Twython
+
+from .base import create_image, search_statuses
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 connections is too small for concurrent clients
+    request_queue_size = 128
+
+
+class FakeServer(object):
+    """
+    Base class for the local stand-ins of the remote services used by the import.
+    Serves requests in a background thread on a random free port on localhost.
+    Use as a context manager or call start/stop.
+    """
+    handler_class = None
+
+    def __init__(self, latency=0):
+        """
+        :param latency: float seconds to wait before each response
+        """
+        self.latency = latency
+        self.requests_count = 0
+        self.connections_count = 0
+        self._connections = set()
+        self._lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        fake_server = self
+
+        class Handler(self.handler_class):
+            server_instance = fake_server
+
+        self.httpd = ThreadedHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+        # keep-alive connections would keep their handler threads waiting
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+            self._connections.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def get_url(self, path, host='127.0.0.1'):
+        return 'http://{}:{}{}'.format(host, self.port, path)
+
+    def register_connection(self, connection):
+        with self._lock:
+            self.connections_count += 1
+            self._connections.add(connection)
+
+    def register_request(self):
+        with self._lock:
+            self.requests_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive connections
+    protocol_version = 'HTTP/1.1'
+    # responses are written at once, small writes on a keep-alive connection
+    # would be delayed by the Nagle algorithm
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server_instance = None
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server_instance.register_connection(self.connection)
+
+    def log_message(self, format, *args):
+        # keep the test output clean
+        pass
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ImageRequestHandler(FakeRequestHandler):
+
+    def do_GET(self):
+        server = self.server_instance
+        server.register_request()
+        if server.truncate_body:
+            # the connection is lost in the middle of the body
+            self.send_response(server.status)
+            self.send_header('Content-Type', server.content_type)
+            self.send_header('Content-Length', str(len(server.image_body)))
+            self.end_headers()
+            self.wfile.write(server.image_body[:len(server.image_body) // 2])
+            self.close_connection = 1
+            return
+        if server.send_content_length:
+            self.send_body(server.image_body, server.content_type, status=server.status)
+            return
+        # the body is terminated by closing the connection
+        self.send_response(server.status)
+        self.send_header('Content-Type', server.content_type)
+        self.end_headers()
+        self.wfile.write(server.image_body)
+        self.close_connection = 1
+
+
+class FakeImageServer(FakeServer):
+    """
+    Image host, responds to any GET request with the same JPEG image.
+    """
+    handler_class = ImageRequestHandler
+
+    def __init__(self, latency=0, image_size=(800, 600), content_type='image/jpeg',
+                 send_content_length=True, status=200, truncate_body=False):
+        """
+        :param latency: float seconds to wait before each response
+        :param image_size: tuple image size in pixels
+        :param content_type: str Content-Type header value of the responses
+        :param send_content_length: bool if False, Content-Length header is omitted
+        :param status: int status code of the responses
+        :param truncate_body: bool if True, the connection is closed after a
+        half of the body
+        """
+        super(FakeImageServer, self).__init__(latency=latency)
+        self.content_type = content_type
+        self.status = status
+        self.send_content_length = send_content_length
+        self.truncate_body = truncate_body
+        image_buffer = BytesIO()
+        create_image(size=image_size).save(image_buffer, 'JPEG')
+        self.image_body = image_buffer.getvalue()
+
+    def get_image_url(self, name, host='127.0.0.1'):
+        return self.get_url('/media/{}.jpg'.format(name), host=host)
+
+
+class SearchRequestHandler(FakeRequestHandler):
+
+    def do_GET(self):
+        server = self.server_instance
+        server.register_request()
+        url = urlsplit(self.path)
+        if url.path != '/1.1/search/tweets.json':
+            self.send_body(b'{}', 'application/json', status=404)
+            return
+        status, headers, search_results = server.search(dict(parse_qsl(url.query)))
+        self.send_body(json.dumps(search_results).encode('utf-8'),
+                       'application/json', status=status, headers=headers)
+
+
+class FakeSearchServer(FakeServer):
+    """
+    Twitter search api stand-in. Serves the search endpoint for the given
+    tweets and enforces the rate limit: at most rate_limit requests per window,
+    reported in the x-rate-limit-* headers, 429 responses after that.
+    """
+    handler_class = SearchRequestHandler
+
+    def __init__(self, statuses=None, latency=0, rate_limit=180, window=15 * 60):
+        """
+        :param statuses: list of tweets dicts
+        :param latency: float seconds to wait before each response
+        :param rate_limit: int number of requests allowed per window
+        :param window: int window length in seconds
+        """
+        super(FakeSearchServer, self).__init__(latency=latency)
+        self.statuses = sorted(statuses or [], key=lambda tweet: -tweet['id'])
+        self.rate_limit = rate_limit
+        self.window = window
+        self.window_reset_at = None
+        self.window_requests = 0
+        self.rejected_requests_count = 0
+        self.search_params = []
+
+    def search(self, params):
+        """
+        :param params: dict search parameters
+        :return: tuple (int status, dict headers, dict body)
+        """
+        with self._lock:
+            now = time.time()
+            if self.window_reset_at is None or self.window_reset_at <= now:
+                self.window_reset_at = int(now + self.window)
+                self.window_requests = 0
+            self.window_requests += 1
+            remaining = max(self.rate_limit - self.window_requests, 0)
+            headers = {
+                'x-rate-limit-limit': str(self.rate_limit),
+                'x-rate-limit-remaining': str(remaining),
+                'x-rate-limit-reset': str(self.window_reset_at),
+            }
+            if self.window_requests > self.rate_limit:
+                self.rejected_requests_count += 1
+                return 429, headers, {
+                    'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}
+            self.search_params.append(params)
+        return 200, headers, search_statuses(self.statuses, params)
+
+    def get_api(self, app_key='test_app_key'):
+        """
+        Builds a Twython api connected to this server.
+        :param app_key: str twitter app key
+        :return: twython.Twython
+        """
+        api = Twython(app_key=app_key, app_secret='secret',
+                      oauth_token='token', oauth_token_secret='token_secret')
+        api.api_url = self.get_url('/%s')
+        return api
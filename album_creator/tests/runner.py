@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TemporaryMediaRootTestRunner(DiscoverRunner):
+    """
+    Runs the tests with MEDIA_ROOT in a temporary directory, removed when the
+    tests are done, so the images, thumbnails and renditions stored by the
+    imports under test don't end up in the project media.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(TemporaryMediaRootTestRunner, self).setup_test_environment(**kwargs)
+        self.media_root = tempfile.mkdtemp()
+        self.media_root_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_root_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.media_root_settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super(TemporaryMediaRootTestRunner, self).teardown_test_environment(**kwargs)
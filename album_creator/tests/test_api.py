@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from ..models import Album, AlbumImageRelation, Image
+
+from .base import AlbumCacheMixin, AlbumNamesMixin
+
+
+class AlbumApiTestCase(AlbumCacheMixin, AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        super(AlbumApiTestCase, self).setUp()
+        # the api only serializes the stored file names, no files are needed
+        for album_number in range(6):
+            album = self.create_album('album{}'.format('abcdef'[album_number]))
+            for tweet_id in range(1, 4):
+                image = Image.objects.create(
+                    image_file='uploads/test.jpg',
+                    original_image_url='http://example.com/{}/{}.jpg'.format(
+                        album.name, tweet_id))
+                AlbumImageRelation.objects.create(
+                    album=album, image=image, tweet_id=tweet_id,
+                    tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id))
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        url = reverse('album-api:album-list')
+        album = Album.objects.get(name='albuma')
+        for tweet_id in range(4, 50):
+            image = Image.objects.create(
+                image_file='uploads/test.jpg',
+                original_image_url='http://example.com/albuma/{}.jpg'.format(tweet_id))
+            AlbumImageRelation.objects.create(
+                album=album, image=image, tweet_id=tweet_id,
+                tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id))
+        for page_size in (2, 6):
+            # the version of the list, albums page, the newest images of all
+            # the albums and the renditions of the images
+            with self.assertNumQueries(4):
+                data = self.get(url, page_size=page_size, images_limit=5)
+            self.assertEqual(len(data['results']), page_size)
+            self.assertEqual(len(data['results'][0]['images']), 5)
+
+    def test_images_limit(self):
+        url = reverse('album-api:album-list')
+        data = self.get(url, images_limit=2)
+        album_data = data['results'][0]
+        self.assertEqual(album_data['name'], 'albuma')
+        self.assertEqual(
+            [image['original_image_url'] for image in album_data['images']],
+            ['http://example.com/albuma/3.jpg', 'http://example.com/albuma/2.jpg'])
+        self.assertTrue(album_data['images_url'].endswith(
+            reverse('album-api:album-images', kwargs={'album_name': 'albuma'})))
+
+    def test_cursor_pagination(self):
+        url = reverse('album-api:album-list')
+        data = self.get(url, page_size=4)
+        self.assertIsNone(data['previous'])
+        names = [album['name'] for album in data['results']]
+        data = self.client.get(data['next']).data
+        self.assertIsNone(data['next'])
+        names.extend(album['name'] for album in data['results'])
+        self.assertEqual(names, list(Album.objects.order_by('name').values_list(
+            'name', flat=True)))
+
+    def test_album_images(self):
+        url = reverse('album-api:album-images', kwargs={'album_name': 'albumb'})
+        data = self.get(url, page_size=2)
+        tweet_urls = [relation['tweet_url'] for relation in data['results']]
+        tweet_urls.extend(relation['tweet_url'] for relation in
+                          self.client.get(data['next']).data['results'])
+        self.assertEqual(tweet_urls, [
+            'http://twitter.com/test/statuses/{}'.format(tweet_id)
+            for tweet_id in (3, 2, 1)])
+        url = reverse('album-api:album-images', kwargs={'album_name': 'missing'})
+        self.assertEqual(self.client.get(url).status_code, 404)
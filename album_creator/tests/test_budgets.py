@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from ..models import AlbumImageRelation, Image
+from ..profiling import profile_section
+
+from .base import AlbumCacheMixin, AlbumNamesMixin, RequestBudgetMixin
+
+# url name, url kwargs, queries, seconds, the pages are rendered with a cold
+# cache, the query counts must not grow with the number of albums and images
+BUDGETS = (
+    ('album-list', {}, 4, 2.0),
+    ('album-detail', {'album_name': 'albuma'}, 5, 2.0),
+    ('album-images-fragment', {'album_name': 'albuma'}, 3, 2.0),
+    ('album-api:album-list', {}, 4, 2.0),
+    ('album-api:album-images', {'album_name': 'albuma'}, 4, 2.0),
+)
+
+
+class RequestBudgetsTestCase(RequestBudgetMixin, AlbumCacheMixin, AlbumNamesMixin,
+                             TestCase):
+
+    def setUp(self):
+        super(RequestBudgetsTestCase, self).setUp()
+        # the pages only show the stored file names, no files are needed
+        images = [Image(image_file='uploads/test.jpg',
+                        original_image_url='http://example.com/{}.jpg'.format(i),
+                        thumbnails_ready=True)
+                  for i in range(30)]
+        Image.objects.bulk_create(images)
+        images = list(Image.objects.order_by('pk'))
+        for album_number in range(15):
+            album = self.create_album('album{}'.format('abcdefghijklmnopqrstuvwxyz'[
+                album_number]))
+            for tweet_id, image in enumerate(images, 1):
+                AlbumImageRelation.objects.create(
+                    album=album, image=image, tweet_id=tweet_id,
+                    tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id))
+
+    def test_budgets(self):
+        for url_name, url_kwargs, max_queries, max_seconds in BUDGETS:
+            self.assertWithinBudget(reverse(url_name, kwargs=url_kwargs),
+                                    max_queries=max_queries, max_seconds=max_seconds)
+
+    def test_over_budget(self):
+        with self.assertRaisesMessage(AssertionError, 'queries, the budget is 1'):
+            self.assertWithinBudget(reverse('album-list'), max_queries=1)
+
+
+class ProfilingMiddlewareTestCase(AlbumCacheMixin, AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        super(ProfilingMiddlewareTestCase, self).setUp()
+        self.album = self.create_album(self.album1_name)
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('album-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_server_timing(self):
+        response = self.client.get(reverse('album-detail',
+                                           kwargs={'album_name': self.album1_name}))
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'template', 'total'])
+        self.assertIn('desc="{} queries"'.format(response.profile.query_count),
+                      response['Server-Timing'])
+        response = self.client.get(reverse('album-api:album-list'))
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_LOG_SAMPLE_RATE=1)
+    def test_sampled_log(self):
+        records = []
+        handler = logging.Handler(logging.INFO)
+        handler.emit = records.append
+        profiling_logger = logging.getLogger('album_creator.profiling')
+        profiling_logger.addHandler(handler)
+        self.addCleanup(profiling_logger.removeHandler, handler)
+        self.addCleanup(profiling_logger.setLevel, profiling_logger.level)
+        profiling_logger.setLevel(logging.INFO)
+        self.client.get(reverse('album-list'))
+        self.assertEqual(len(records), 1)
+        self.assertIn('GET / 200: ', records[0].getMessage())
+
+    def test_profile_section_outside_requests(self):
+        with profile_section('template'):
+            pass
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..caching import get_cache, get_or_build, make_cache_key
+from ..models import Album, AlbumImageRelation, Image
+from ..versioning import Version
+
+from .base import AlbumCacheMixin, AlbumNamesMixin
+
+
+class Builder(object):
+
+    def __init__(self, value, delay=0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.value
+
+
+class GetOrBuildTestCase(AlbumCacheMixin, TestCase):
+    version = Version('v1', None)
+
+    def test_read_through(self):
+        build = Builder('value')
+        for __ in range(2):
+            self.assertEqual(get_or_build('test', self.version, (1, ), build), 'value')
+        self.assertEqual(build.calls, 1)
+        # other parts and versions are built again
+        get_or_build('test', self.version, (2, ), build)
+        get_or_build('test', Version('v2', None), (1, ), build)
+        self.assertEqual(build.calls, 3)
+
+    def test_no_version(self):
+        build = Builder('value')
+        for __ in range(2):
+            self.assertEqual(get_or_build('test', None, (1, ), build), 'value')
+        self.assertEqual(build.calls, 2)
+
+    def test_build_error_releases_lock(self):
+        def build():
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            get_or_build('test', self.version, (1, ), build)
+        self.assertEqual(get_or_build('test', self.version, (1, ), Builder('value')),
+                         'value')
+
+    def test_concurrent_requests_build_once(self):
+        build = Builder('value', delay=0.2)
+        results = []
+
+        def get():
+            results.append(get_or_build('test', self.version, (1, ), build))
+        threads = [threading.Thread(target=get) for __ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(build.calls, 1)
+
+    @override_settings(ALBUM_CACHE_LOCK_WAIT=0.1)
+    def test_waiting_gives_up(self):
+        key = make_cache_key('test', self.version, (1, ))
+        # another request builds the value for too long
+        get_cache().add('{}:lock'.format(key), 1)
+        build = Builder('value')
+        self.assertEqual(get_or_build('test', self.version, (1, ), build), 'value')
+        self.assertEqual(build.calls, 1)
+
+
+class AlbumCacheTestCase(AlbumCacheMixin, AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        super(AlbumCacheTestCase, self).setUp()
+        self.album = self.create_album(self.album1_name)
+        self.relation = self.add_relation(1)
+
+    def add_relation(self, tweet_id):
+        image = Image.objects.create(
+            image_file='uploads/test.jpg',
+            original_image_url='http://example.com/{}.jpg'.format(tweet_id))
+        return AlbumImageRelation.objects.create(
+            album=self.album, image=image, tweet_id=tweet_id,
+            tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id))
+
+    def get_version(self):
+        return Album.objects.get(pk=self.album.pk).version
+
+    def test_grid_is_cached_until_import(self):
+        url = reverse('album-images-fragment', kwargs={'album_name': self.album.name})
+        self.assertContains(self.client.get(url), 'statuses/1')
+        # only the album for its version
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(url), 'statuses/1')
+        self.add_relation(2)
+        self.assertContains(self.client.get(url), 'statuses/2')
+
+    def test_api_page_is_cached_until_import(self):
+        url = reverse('album-api:album-images', kwargs={'album_name': self.album.name})
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get(url).data['results']), 1)
+        self.add_relation(2)
+        self.assertEqual(len(self.client.get(url).data['results']), 2)
+
+    def test_edits_bump_version(self):
+        version = self.get_version()
+        backfill_completed_at = timezone.now()
+        Album.objects.filter(pk=self.album.pk).update(
+            backfill_max_id=5, backfill_completed_at=backfill_completed_at)
+        # the instance was loaded before the import and the backfill
+        self.album.save()
+        self.assertEqual(self.get_version(), version + 1)
+        album = Album.objects.get(pk=self.album.pk)
+        self.assertEqual(album.image_count, 1)
+        self.assertEqual(album.backfill_max_id, 5)
+        self.assertEqual(album.backfill_completed_at, backfill_completed_at)
+        self.relation.tweet_url = 'http://twitter.com/test/statuses/10'
+        self.relation.save()
+        self.assertEqual(self.get_version(), version + 2)
+        self.relation.image.save()
+        self.assertEqual(self.get_version(), version + 3)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from ..clients import (
+    TwitterClientPool, build_twitter_client_pool, get_credentials_file_paths,
+)
+from ..ratelimit import RateLimitExceeded, RateLimitedTwitterApi, SearchRateLimiter
+
+from .base import make_tweet
+from .fake_servers import FakeSearchServer
+
+
+class TwitterClientPoolTestCase(TestCase):
+
+    def setUp(self):
+        statuses = [make_tweet(i) for i in range(1, 6)]
+        # every twitter app has its own rate limit
+        self.servers = [FakeSearchServer(statuses, rate_limit=limit).start()
+                        for limit in (2, 3)]
+        self.pool = TwitterClientPool([
+            RateLimitedTwitterApi(server.get_api('app{}'.format(i)),
+                                  limiter=SearchRateLimiter('app{}'.format(i),
+                                                            max_wait=0))
+            for i, server in enumerate(self.servers)
+        ], max_wait=0)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_search_uses_all_credentials(self):
+        for __ in range(5):
+            self.assertEqual(len(self.pool.search(q='#test')['statuses']), 5)
+        self.assertEqual([len(server.search_params) for server in self.servers], [2, 3])
+        with self.assertRaises(RateLimitExceeded) as context:
+            self.pool.search(q='#test')
+        self.assertEqual(context.exception.reset_at,
+                         min(server.window_reset_at for server in self.servers))
+        # exhausted clients are not bothered anymore
+        self.assertEqual(sum(server.rejected_requests_count
+                             for server in self.servers), 0)
+
+    def test_client_with_most_headroom_is_chosen(self):
+        # the first search goes to any client, after that the state is known
+        # and the requests are balanced by the remaining quota
+        for __ in range(3):
+            self.pool.search(q='#test')
+        remaining = [client.limiter.get_state()[0] for client in self.pool.clients]
+        self.assertEqual(remaining, [1, 1])
+        self.assertEqual(sum(len(server.search_params) for server in self.servers), 3)
+
+    def test_exhausted_client_comes_back_after_reset(self):
+        client = self.pool.clients[0]
+        client.limiter.update(0, 1)
+        self.assertEqual(client.limiter.get_state(), (None, None))
+        self.assertIn(client, [self.pool.choose_client()[0] for __ in range(50)])
+
+
+class BuildTwitterClientPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.credentials_dir = tempfile.mkdtemp()
+        for i in range(2):
+            file_path = os.path.join(self.credentials_dir, 'app{}.json'.format(i))
+            with open(file_path, 'w') as credentials_file:
+                json.dump({
+                    'app_key': 'app{}'.format(i),
+                    'app_secret': 'secret',
+                    'oauth_token': 'token',
+                    'oauth_token_secret': 'token_secret',
+                }, credentials_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.credentials_dir)
+
+    def test_credentials_dir(self):
+        with self.settings(TWITTER_CREDENTIALS_DIR=self.credentials_dir):
+            self.assertEqual(len(get_credentials_file_paths()), 2)
+            pool = build_twitter_client_pool()
+        self.assertEqual(sorted(client.api.app_key for client in pool.clients),
+                         ['app0', 'app1'])
+
+    def test_default_credentials_file(self):
+        with self.settings(TWITTER_CREDENTIALS_DIR=None,
+                           TWITTER_CREDENTIALS_JSON_FILES=[],
+                           TWITTER_CREDENTIALS_JSON_FILE='default.json'):
+            self.assertEqual(get_credentials_file_paths(), ['default.json'])
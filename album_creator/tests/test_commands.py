@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from ..ingest import read_checkpoint, write_checkpoint
+from ..management.commands import import_albums
+from ..models import AlbumImageRelation, Image, ImportNotification
+from ..notifications import queue_import_notification
+
+from .base import AlbumNamesMixin, FakeTwitterApi, make_tweet
+from .fake_servers import FakeImageServer
+
+
+class ImportAlbumsCommandTestCase(AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        self.album1 = self.create_album(self.album1_name)
+        self.album2 = self.create_album(self.album2_name)
+        self.server = FakeImageServer().start()
+        self.addCleanup(self.server.stop)
+        self.api = FakeTwitterApi([
+            make_tweet(tweet_id, self.server.get_image_url(tweet_id))
+            for tweet_id in range(1, 6)
+        ])
+        # the command builds the twitter client pool from the credentials files
+        build_twitter_client_pool = import_albums.build_twitter_client_pool
+        import_albums.build_twitter_client_pool = lambda: self.api
+        self.addCleanup(setattr, import_albums, 'build_twitter_client_pool',
+                        build_twitter_client_pool)
+
+    def call_command(self, *args):
+        stdout = StringIO()
+        call_command('import_albums', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_import_all_albums(self):
+        output = self.call_command('--max-per-album', '2')
+        self.assertEqual(len(self.api.search_calls), 2)
+        for album in (self.album1, self.album2):
+            # the newest tweets are imported
+            self.assertEqual(sorted(AlbumImageRelation.objects.filter(
+                album=album).values_list('tweet_id', flat=True)), [4, 5])
+            self.assertIn('{}: 2 photo(s)'.format(album.name), output)
+        self.assertIn('Imported 4 photo(s) for 2 album(s)', output)
+
+    def test_import_since(self):
+        output = self.call_command('--albums', self.album1_name, '--since', '3')
+        self.assertEqual(self.api.search_calls[0]['since_id'], 3)
+        self.assertEqual(sorted(AlbumImageRelation.objects.values_list(
+            'tweet_id', flat=True)), [4, 5])
+        self.assertIn('Imported 2 photo(s) for 1 album(s)', output)
+
+    def test_failed_album_is_reported(self):
+        self.api.error = ValueError('boom')
+        output = self.call_command('--albums', self.album1_name)
+        self.assertIn('{}: failed'.format(self.album1_name), output)
+        self.assertIn('1 failed', output)
+
+    def test_unknown_album(self):
+        with self.assertRaises(CommandError):
+            self.call_command('--albums', 'unknown')
+
+
+class SendNotificationsCommandTestCase(AlbumNamesMixin, TestCase):
+
+    @override_settings(IMPORT_NOTIFICATION_DIGEST_WINDOW=0)
+    def test_send_notifications(self):
+        album = self.create_album(self.album1_name)
+        image = Image.objects.create(image_file='uploads/test.jpg',
+                                     original_image_url='http://example.com/1.jpg')
+        queue_import_notification(album.name, [image.pk])
+        call_command('send_notifications', burst=True)
+        self.assertEqual(len(mail.outbox), len(settings.MANAGERS))
+        self.assertEqual(ImportNotification.objects.get().status,
+                         ImportNotification.STATUS_SENT)
+
+
+class IngestTweetsCommandTestCase(AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        self.album = self.create_album(self.album1_name)
+        self.server = FakeImageServer().start()
+        self.addCleanup(self.server.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.lines = [json.dumps(make_tweet(tweet_id, self.server.get_image_url(tweet_id)))
+                      for tweet_id in range(1, 6)]
+        # a tweet without a photo and a broken line
+        self.lines[2:2] = [json.dumps(make_tweet(10)), '{"id": 11, "entit']
+
+    def write_dump(self, file_name, lines):
+        path = os.path.join(self.directory, file_name)
+        open_file = gzip.open if file_name.endswith('.gz') else io.open
+        with open_file(path, 'wb') as dump_file:
+            for line in lines:
+                dump_file.write('{}\n'.format(line).encode('utf-8'))
+        return path
+
+    def call_command(self, path, *args):
+        stdout = StringIO()
+        call_command('ingest_tweets', path, '--album', self.album1_name, '--batch-size',
+                     '2', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def get_imported_tweet_ids(self):
+        return sorted(AlbumImageRelation.objects.filter(
+            album=self.album).values_list('tweet_id', flat=True))
+
+    def test_ingest(self):
+        for file_name in ('tweets.jsonl', 'tweets.jsonl.gz'):
+            AlbumImageRelation.objects.all().delete()
+            path = self.write_dump(file_name, self.lines)
+            output = self.call_command(path)
+            self.assertIn('Imported 5 photo(s) from 6 tweet(s)', output)
+            self.assertIn('skipped 1 invalid line(s)', output)
+            self.assertEqual(self.get_imported_tweet_ids(), [1, 2, 3, 4, 5])
+            # the whole file was read
+            checkpoint = read_checkpoint('{}.checkpoint'.format(path))
+            self.assertEqual(checkpoint['offset'],
+                             len('\n'.join(self.lines).encode('utf-8')) + 1)
+            output = self.call_command(path)
+            self.assertIn('Imported 0 photo(s) from 0 tweet(s)', output)
+            output = self.call_command(path, '--restart')
+            self.assertIn('Imported 0 photo(s) from 6 tweet(s)', output)
+
+    def test_malformed_tweets_are_skipped(self):
+        tweet = make_tweet(20, self.server.get_image_url(20))
+        malformed_tweets = [
+            dict(tweet, user=None),
+            dict(tweet, user={}),
+            dict(tweet, id='20'),
+            dict(tweet, entities=[]),
+            dict(tweet, entities={'media': [{'type': 'photo'}]}),
+            dict(tweet, entities={'hashtags': 'test'}),
+        ]
+        path = self.write_dump('tweets.jsonl', self.lines[:2] + [
+            json.dumps(malformed_tweet) for malformed_tweet in malformed_tweets
+        ] + self.lines[2:])
+        output = self.call_command(path)
+        self.assertIn('Imported 5 photo(s) from 6 tweet(s)', output)
+        self.assertIn('skipped 7 invalid line(s)', output)
+        self.assertEqual(self.get_imported_tweet_ids(), [1, 2, 3, 4, 5])
+
+    def test_resume(self):
+        for file_name in ('tweets.jsonl', 'tweets.jsonl.gz'):
+            AlbumImageRelation.objects.all().delete()
+            path = self.write_dump(file_name, self.lines)
+            checkpoint_path = os.path.join(self.directory, 'progress')
+            # the first three lines were imported before the interruption
+            write_checkpoint(checkpoint_path, {
+                'album': self.album1_name,
+                'offset': len(''.join(line + '\n' for line in self.lines[:3])),
+            })
+            output = self.call_command(path, '--checkpoint', checkpoint_path)
+            self.assertIn('Resuming from offset', output)
+            self.assertEqual(self.get_imported_tweet_ids(), [3, 4, 5])
+
+    def test_checkpoint_of_another_album(self):
+        path = self.write_dump('tweets.jsonl', self.lines)
+        write_checkpoint('{}.checkpoint'.format(path), {'album': 'other', 'offset': 10})
+        with self.assertRaisesMessage(CommandError, 'belongs to album other'):
+            self.call_command(path)
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            self.call_command(os.path.join(self.directory, 'missing.jsonl'))
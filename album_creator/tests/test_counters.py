@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from ..counters import repair_album_counters
+from ..models import Album, AlbumImageRelation
+
+from .base import ImageRelationHelperMixin
+
+
+class AlbumCountersTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def create_relation(self, image, tweet_id):
+        return self.create_album_image_relation(
+            album=self.album1, image=image, tweet_id=tweet_id,
+            tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id))
+
+    def assertCounters(self, image_count, last_tweet_id, cover_image):
+        self.album1.refresh_from_db()
+        self.assertEqual(self.album1.image_count, image_count)
+        self.assertEqual(self.album1.last_tweet_id, last_tweet_id)
+        self.assertEqual(self.album1.cover_image, cover_image)
+
+    def test_relations_update_counters(self):
+        self.assertCounters(0, None, None)
+        relation2 = self.create_relation(self.image2, 20)
+        self.assertIsNotNone(Album.objects.get(pk=self.album1.pk).last_imported_at)
+        # an older tweet does not replace the cover
+        relation1 = self.create_relation(self.image1, 10)
+        self.assertCounters(2, 20, self.image2)
+        relation2.delete()
+        self.assertCounters(1, 10, self.image1)
+        relation1.delete()
+        self.assertCounters(0, None, None)
+
+    def test_image_delete(self):
+        self.create_relation(self.image1, 10)
+        self.create_relation(self.image2, 20)
+        self.image2.delete()
+        self.assertCounters(1, 10, self.image1)
+
+    def test_counters_need_no_repair(self):
+        self.create_relation(self.image1, 10)
+        relation2 = self.create_relation(self.image2, 20)
+        version = Album.objects.get(pk=self.album1.pk).version
+        self.assertEqual(repair_album_counters(), 0)
+        relation2.delete()
+        self.assertEqual(repair_album_counters(), 0)
+        self.assertEqual(Album.objects.get(pk=self.album1.pk).version, version + 1)
+
+    def test_repair_command(self):
+        self.create_relation(self.image1, 10)
+        self.create_relation(self.image2, 20)
+        # queryset updates bypass the signals
+        AlbumImageRelation.objects.filter(tweet_id=20).update(tweet_id=5)
+        Album.objects.update(image_count=0)
+        stdout = StringIO()
+        call_command('repair_album_counters', stdout=stdout)
+        self.assertIn('Repaired counters of 1 album(s)', stdout.getvalue())
+        self.assertCounters(2, 10, self.image1)
+        self.assertEqual(self.album1.last_imported_at, AlbumImageRelation.objects.get(
+            tweet_id=5).imported_at)
+        # nothing to repair the second time
+        stdout = StringIO()
+        call_command('repair_album_counters', stdout=stdout)
+        self.assertIn('Repaired counters of 0 album(s)', stdout.getvalue())
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import defaultdict
+
+from django.test import TestCase, override_settings
+
+from ..downloads import DownloadFailures, download_images
+from ..helpers import import_photos_for_album
+from ..metrics import FAILURES
+from ..models import Image
+from ..utils import ImageDownloadError
+
+from .base import AlbumNamesMixin, FakeTwitterApi, make_tweet
+from .fake_servers import FakeImageServer
+
+
+class ConcurrencyRecorder(object):
+    """
+    Fake fetch function that records the maximum number of simultaneous calls,
+    in total and per host.
+    """
+
+    def __init__(self, delay=0.02, failing_urls=()):
+        self.delay = delay
+        self.failing_urls = failing_urls
+        self.lock = threading.Lock()
+        self.active = defaultdict(int)
+        self.max_active = defaultdict(int)
+        self.calls = []
+
+    def __call__(self, url):
+        host = url.split('/')[2]
+        with self.lock:
+            self.calls.append(url)
+            for key in (host, None):
+                self.active[key] += 1
+                self.max_active[key] = max(self.max_active[key], self.active[key])
+        time.sleep(self.delay)
+        with self.lock:
+            for key in (host, None):
+                self.active[key] -= 1
+        if url in self.failing_urls:
+            raise IOError('failed')
+        return url
+
+
+class DownloadImagesTestCase(TestCase):
+
+    def test_limits(self):
+        urls = ['http://host{}.example.com/{}.jpg'.format(i % 2, i) for i in range(20)]
+        fetch = ConcurrencyRecorder()
+        results = download_images(urls, max_workers=6, max_per_host=2, fetch=fetch)
+        self.assertEqual(results, dict(zip(urls, urls)))
+        self.assertLessEqual(fetch.max_active[None], 6)
+        self.assertLessEqual(fetch.max_active['host0.example.com'], 2)
+        self.assertLessEqual(fetch.max_active['host1.example.com'], 2)
+        # downloads did overlap
+        self.assertGreater(fetch.max_active[None], 1)
+
+    def test_duplicates_and_failures(self):
+        urls = ['http://example.com/1.jpg', 'http://example.com/2.jpg',
+                'http://example.com/1.jpg']
+        fetch = ConcurrencyRecorder(failing_urls=('http://example.com/2.jpg',))
+        results = download_images(urls, fetch=fetch)
+        self.assertEqual(sorted(fetch.calls), sorted(set(urls)))
+        self.assertEqual(results['http://example.com/1.jpg'], 'http://example.com/1.jpg')
+        self.assertIsNone(results['http://example.com/2.jpg'])
+
+
+class FailingFetch(object):
+    """
+    Fake fetch function that fails the given urls with the given errors.
+    """
+
+    def __init__(self, errors):
+        """
+        :param errors: dict {url: exception or list of exceptions raised by the
+        consecutive calls, None for a success}
+        """
+        self.errors = errors
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        error = self.errors.get(url)
+        if isinstance(error, list):
+            error = error.pop(0) if error else None
+        if error is not None:
+            raise error
+        return url
+
+
+@override_settings(IMPORT_DOWNLOAD_RETRY_BACKOFF=0, IMPORT_HOST_FAILURE_THRESHOLD=3)
+class DownloadFailuresTestCase(TestCase):
+    not_found_url = 'http://example.com/404.jpg'
+
+    def test_failed_urls_are_remembered(self):
+        fetch = FailingFetch({
+            self.not_found_url: ImageDownloadError('Unexpected status 404'),
+        })
+        urls = [self.not_found_url, 'http://example.com/1.jpg']
+        download_images(urls, fetch=fetch)
+        skipped_count = FAILURES.snapshot().get(('known_bad_url', ), 0)
+        results = download_images(urls, fetch=fetch)
+        self.assertIsNone(results[self.not_found_url])
+        self.assertEqual(results['http://example.com/1.jpg'], 'http://example.com/1.jpg')
+        # permanent errors are not retried, the url is not fetched again
+        self.assertEqual(fetch.calls.count(self.not_found_url), 1)
+        self.assertEqual(FAILURES.snapshot().get(('known_bad_url', ), 0), skipped_count + 1)
+
+    def test_transient_errors_are_retried(self):
+        url = 'http://example.com/1.jpg'
+        fetch = FailingFetch({url: [ImageDownloadError('503', transient=True),
+                                    ImageDownloadError('503', transient=True)]})
+        self.assertEqual(download_images([url], fetch=fetch), {url: url})
+        self.assertEqual(fetch.calls, [url] * 3)
+        # retries are bounded
+        url = 'http://other.example.com/1.jpg'
+        fetch = FailingFetch({url: ImageDownloadError('503', transient=True)})
+        self.assertEqual(download_images([url], fetch=fetch, max_retries=1), {url: None})
+        self.assertEqual(fetch.calls, [url] * 2)
+        # the failure is remembered for a while
+        failures = DownloadFailures()
+        failures.load([url])
+        self.assertEqual(failures.get_url_error(url), 'ImageDownloadError: 503')
+
+    def test_failing_host_is_skipped(self):
+        urls = ['http://down.example.com/{}.jpg'.format(i) for i in range(5)]
+        fetch = FailingFetch({url: ImageDownloadError('503', transient=True)
+                              for url in urls})
+        results = download_images(urls + ['http://up.example.com/1.jpg'],
+                                  max_workers=1, max_retries=0, fetch=fetch)
+        # the circuit is open after the third failure
+        self.assertEqual(fetch.calls, urls[:3] + ['http://up.example.com/1.jpg'])
+        self.assertEqual(results['http://up.example.com/1.jpg'], 'http://up.example.com/1.jpg')
+        # the other imports skip the host as well
+        failures = DownloadFailures()
+        failures.load(['http://down.example.com/6.jpg', 'http://up.example.com/2.jpg'])
+        self.assertFalse(failures.is_host_available('down.example.com'))
+        self.assertTrue(failures.is_host_available('up.example.com'))
+
+    def test_circuit_opens_again_after_a_failure(self):
+        url = 'http://example.com/1.jpg'
+        failures = DownloadFailures()
+        failures.load([url])
+        for i in range(2):
+            self.assertFalse(failures.add_host_failure('example.com'))
+        self.assertTrue(failures.add_host_failure('example.com'))
+        failures.save()
+        # the cooldown is over
+        cache_key = failures.get_cache_key('example.com')
+        host_failures = failures.cache.get(cache_key)
+        host_failures['open_until'] = time.time() - 1
+        failures.cache.set(cache_key, host_failures)
+        failures = DownloadFailures()
+        failures.load([url])
+        self.assertTrue(failures.is_host_available('example.com'))
+        self.assertTrue(failures.add_host_failure('example.com'))
+
+    def test_failures_of_workers_add_up(self):
+        url = 'http://example.com/1.jpg'
+        for i in range(3):
+            failures = DownloadFailures()
+            failures.load([url])
+            self.assertTrue(failures.is_host_available('example.com'))
+            failures.add_host_failure('example.com')
+            failures.save()
+        failures = DownloadFailures()
+        failures.load([url])
+        self.assertFalse(failures.is_host_available('example.com'))
+
+
+class ConcurrentImportTestCase(AlbumNamesMixin, TestCase):
+
+    def test_import_from_image_server(self):
+        album = self.create_album(self.album1_name)
+        with FakeImageServer() as server:
+            image_urls = [server.get_image_url('image{}'.format(i)) for i in range(5)]
+            # the last tweet repeats the image of the first one
+            tweets = [make_tweet(100 - i, url) for i, url in enumerate(image_urls)]
+            tweets.append(make_tweet(10, image_urls[0]))
+            imported_pks = import_photos_for_album(
+                FakeTwitterApi(tweets), album_name=album.name)
+            self.assertEqual(server.requests_count, 5)
+        # images are persisted in the search results order
+        imported_urls = [Image.objects.get(pk=pk).original_image_url
+                         for pk in imported_pks]
+        self.assertEqual(imported_urls, image_urls)
+        self.assertEqual(album.images.count(), 5)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils.timezone import utc
+
+from ..exports import ZIP32_LIMIT, ZipStream, iter_album_relations
+from ..models import Image
+from ..views import StreamingDownloadView
+
+from .base import ImageRelationHelperMixin, UserHelperMixin
+
+
+class ZipStreamTestCase(SimpleTestCase):
+    modified_at = datetime(2016, 8, 1, 12, 30, 10, tzinfo=utc)
+
+    def read_archive(self, zip_stream, files):
+        data = []
+        for name, chunks in files:
+            data.extend(zip_stream.iter_file(name, chunks, self.modified_at))
+        data.extend(zip_stream.iter_central_directory())
+        archive = zipfile.ZipFile(BytesIO(b''.join(data)))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def test_archive(self):
+        archive = self.read_archive(ZipStream(), [
+            ('album/1.jpg', [b'first', b' file']),
+            ('album/ünicode.jpg', [b'second file']),
+            ('album/empty.jpg', []),
+        ])
+        self.assertEqual(archive.namelist(),
+                         ['album/1.jpg', 'album/ünicode.jpg', 'album/empty.jpg'])
+        self.assertEqual(archive.read('album/1.jpg'), b'first file')
+        self.assertEqual(archive.read('album/ünicode.jpg'), b'second file')
+        self.assertEqual(archive.getinfo('album/1.jpg').date_time, (2016, 8, 1, 12, 30, 10))
+
+    def test_zip64_offsets(self):
+        zip_stream = ZipStream()
+        # pretend 4GB were sent already, the readers only see the offsets
+        zip_stream.offset = ZIP32_LIMIT + 1
+        data = list(zip_stream.iter_file('album/1.jpg', [b'data'], self.modified_at))
+        data.extend(zip_stream.iter_central_directory())
+        data = b''.join(data)
+        # ZIP64 end of central directory record and its locator
+        self.assertIn(b'PK\x06\x06', data)
+        self.assertIn(b'PK\x06\x07', data)
+        self.assertEqual(zip_stream.offset, ZIP32_LIMIT + 1 + len(data))
+
+
+class StreamingDownloadViewTestCase(SimpleTestCase):
+
+    def test_attributes(self):
+        view = StreamingDownloadView.as_view(
+            filename='export.txt', content_type='text/plain',
+            streaming_content=[b'a', b'b'])
+        response = view(RequestFactory().get('/'))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="export.txt"')
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+
+    def test_missing_content(self):
+        with self.assertRaises(ImproperlyConfigured):
+            StreamingDownloadView.as_view(filename='export.txt')(RequestFactory().get('/'))
+        with self.assertRaises(ImproperlyConfigured):
+            StreamingDownloadView.as_view(streaming_content=[b'a'])(RequestFactory().get('/'))
+
+
+class AlbumExportViewsTestCase(ImageRelationHelperMixin, UserHelperMixin, TestCase):
+    created_files = []
+
+    def setUp(self):
+        super(AlbumExportViewsTestCase, self).setUp()
+        self.create_album_image_relation(self.album1, self.image1, 1,
+                                         'http://twitter.com/test/statuses/1')
+        self.create_album_image_relation(self.album1, self.image2, 2,
+                                         'http://twitter.com/test/statuses/2')
+        self.json_url = reverse('album-export-json', kwargs={'album_name': self.album1_name})
+        self.zip_url = reverse('album-export-zip', kwargs={'album_name': self.album1_name})
+        self.create_user()
+        self.client.login(username=self.user_name, password=self.user_password)
+
+    def test_relations_are_read_in_chunks(self):
+        for tweet_id in range(3, 8):
+            self.create_album_image_relation(
+                self.album1, Image.objects.create(
+                    image_file='uploads/test.jpg',
+                    original_image_url='http://example.com/{}.jpg'.format(tweet_id)),
+                tweet_id, 'http://twitter.com/test/statuses/{}'.format(tweet_id))
+        # 7 relations, 3 per query
+        with self.assertNumQueries(3):
+            relations = list(iter_album_relations(self.album1.pk, chunk_size=3))
+        self.assertEqual([relation.tweet_id for relation in relations],
+                         [7, 6, 5, 4, 3, 2, 1])
+
+    def test_json_lines(self):
+        response = self.client.get(self.json_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="{}.jsonl"'.format(self.album1_name))
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        items = [json.loads(line) for line in lines]
+        self.assertEqual([item['tweet_id'] for item in items], [2, 1])
+        self.assertEqual(items[1]['original_image_url'], self.image1.original_image_url)
+        self.assertEqual(items[1]['image_url'],
+                         'http://testserver{}'.format(self.image1.image_file.url))
+
+    def test_zip(self):
+        # the file of the second image is gone
+        self.image2.image_file.delete(save=False)
+        response = self.client.get(self.zip_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        name = '{}/1_{}.jpg'.format(self.album1_name, self.image1.pk)
+        self.assertEqual(archive.namelist(), [name])
+        with self.image1.image_file.storage.open(self.image1.image_file.name, 'rb') as image_file:
+            self.assertEqual(archive.read(name), image_file.read())
+
+    def test_zip_requires_login(self):
+        self.client.logout()
+        response = self.client.get(self.zip_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.streaming)
+        # the JSON lines are public
+        self.assertEqual(self.client.get(self.json_url).status_code, 200)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.zip_url)
+        response = self.client.get(self.zip_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_album(self):
+        response = self.client.get(reverse('album-export-zip', kwargs={'album_name': 'unknown'}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..counters import repair_album_counters
+from ..helpers import (
+    import_photos_from_tweets, import_photos_for_album, import_photos_for_albums,
+    backfill_photos_for_album,
+)
+from ..models import Album, AlbumImageRelation, Image
+
+from .base import FakeTwitterApi, ImageRelationHelperMixin, make_tweet
+from .fake_servers import FakeImageServer
+
+
+class ImportPhotosFromTweetsTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def setUp(self):
+        super(ImportPhotosFromTweetsTestCase, self).setUp()
+        self.server = FakeImageServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        super(ImportPhotosFromTweetsTestCase, self).tearDown()
+
+    def make_page(self, prefix, size):
+        return [make_tweet(1000 + i, self.server.get_image_url('{}{}'.format(prefix, i)))
+                for i in range(size)]
+
+    def count_import_queries(self, tweets):
+        with CaptureQueriesContext(connection) as queries:
+            imported_pks = import_photos_from_tweets(tweets, self.album1)
+        self.assertEqual(len(imported_pks), len(tweets))
+        return len(queries)
+
+    def test_queries_count_does_not_depend_on_page_size(self):
+        small_page_queries = self.count_import_queries(self.make_page('small', 3))
+        large_page_queries = self.count_import_queries(self.make_page('large', 30))
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_dedup(self):
+        # image1 is already in album1, image2 is known but not in album1 yet
+        self.create_album_image_relation(
+            album=self.album1, image=self.image1, tweet_id=1,
+            tweet_url='http://twitter.com/test/statuses/1')
+        new_image_url = self.server.get_image_url('new')
+        tweets = [
+            make_tweet(10, self.image1.original_image_url),
+            make_tweet(11, self.image2.original_image_url),
+            make_tweet(12, new_image_url),
+            make_tweet(13, new_image_url),
+            make_tweet(14),
+        ]
+        imported_pks = import_photos_from_tweets(tweets, self.album1)
+        new_image = Image.objects.get(original_image_url=new_image_url)
+        self.assertEqual(imported_pks, [self.image2.pk, new_image.pk])
+        self.assertEqual(len(new_image.checksum), 40)
+        # only the new image was fetched
+        self.assertEqual(self.server.requests_count, 1)
+        self.assertEqual(
+            AlbumImageRelation.objects.get(album=self.album1, image=new_image).tweet_id, 12)
+        # the album counters are updated together with the relations
+        self.album1.refresh_from_db()
+        self.assertEqual(self.album1.image_count, 3)
+        self.assertEqual(self.album1.last_tweet_id, 12)
+        self.assertEqual(self.album1.cover_image, new_image)
+        # the counters are what the repair would compute
+        self.assertEqual(repair_album_counters(), 0)
+        # nothing is imported twice
+        self.assertEqual(import_photos_from_tweets(tweets, self.album1), [])
+
+
+class PaginatedImportTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def setUp(self):
+        super(PaginatedImportTestCase, self).setUp()
+        self.server = FakeImageServer().start()
+        self.tweets = [make_tweet(i, self.server.get_image_url('image{}'.format(i)))
+                       for i in range(1, 11)]
+
+    def tearDown(self):
+        self.server.stop()
+        super(PaginatedImportTestCase, self).tearDown()
+
+    def test_pages_are_followed_until_since_id(self):
+        self.create_album_image_relation(
+            album=self.album1, image=self.image1, tweet_id=3,
+            tweet_url='http://twitter.com/test/statuses/3')
+        api = FakeTwitterApi(self.tweets)
+        imported_pks = import_photos_for_album(api, self.album1_name, limit=3)
+        # tweets 4..10 in 3 pages
+        self.assertEqual(len(imported_pks), 7)
+        self.assertEqual([call.get('max_id') for call in api.search_calls],
+                         [None, 7, 4])
+        self.assertTrue(all(call['since_id'] == 3 for call in api.search_calls))
+
+    def test_pages_budget(self):
+        api = FakeTwitterApi(self.tweets)
+        imported_pks = import_photos_for_album(api, self.album1_name, limit=3,
+                                               max_pages=2)
+        self.assertEqual(len(imported_pks), 6)
+        self.assertEqual(len(api.search_calls), 2)
+        # the next import continues the walk
+        api = FakeTwitterApi(self.tweets)
+        imported_pks = import_photos_for_album(api, self.album1_name, limit=3,
+                                               max_pages=2)
+        self.assertEqual(len(imported_pks), 4)
+        self.assertEqual(api.search_calls[0]['max_id'], 4)
+        self.assertEqual(self.album1.images.count(), 10)
+
+    def test_failed_import_is_resumed(self):
+        self.tweets.append(make_tweet(11, self.server.get_image_url('image11')))
+        api = FakeTwitterApi(self.tweets[:-1], error=ValueError('boom'),
+                             failing_calls={2})
+        with self.assertRaises(ValueError):
+            import_photos_for_album(api, self.album1_name, limit=3)
+        self.assertEqual(sorted(AlbumImageRelation.objects.filter(
+            album=self.album1).values_list('tweet_id', flat=True)), [8, 9, 10])
+        # the retry imports the rest of the interrupted walk, then the new tweets
+        api = FakeTwitterApi(self.tweets)
+        imported_pks = import_photos_for_album(api, self.album1_name, limit=3)
+        self.assertEqual(len(imported_pks), 8)
+        self.assertEqual([(call.get('since_id'), call.get('max_id'))
+                          for call in api.search_calls],
+                         [(None, 7), (None, 4), (None, 1), (10, None)])
+        self.assertEqual(self.album1.images.count(), 11)
+        album = Album.objects.get(pk=self.album1.pk)
+        self.assertIsNone(album.search_max_id)
+
+    def test_backfill_in_chunks(self):
+        # tweets 9 and 10 were imported by a regular import
+        import_photos_for_album(FakeTwitterApi(self.tweets[-2:]), self.album1_name)
+        api = FakeTwitterApi(self.tweets)
+        imported_pks = backfill_photos_for_album(api, self.album1_name, limit=3,
+                                                 max_pages=2)
+        self.assertEqual(len(imported_pks), 6)
+        self.assertEqual(api.search_calls[0]['max_id'], 8)
+        album = Album.objects.get(pk=self.album1.pk)
+        self.assertEqual(album.backfill_max_id, 2)
+        self.assertIsNone(album.backfill_completed_at)
+        # the next chunk continues from the cursor and reaches the end
+        imported_pks = backfill_photos_for_album(api, self.album1_name, limit=3,
+                                                 max_pages=2)
+        self.assertEqual(len(imported_pks), 2)
+        album.refresh_from_db()
+        self.assertIsNotNone(album.backfill_completed_at)
+        self.assertEqual(album.images.count(), 10)
+
+
+class MultiAlbumImportTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def setUp(self):
+        super(MultiAlbumImportTestCase, self).setUp()
+        self.album3 = self.create_album(self.album3_name)
+        self.server = FakeImageServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        super(MultiAlbumImportTestCase, self).tearDown()
+
+    def make_tweet(self, tweet_id, *hash_tags):
+        return make_tweet(tweet_id, self.server.get_image_url(tweet_id),
+                          hash_tags=hash_tags)
+
+    def test_tweets_are_routed_to_albums(self):
+        # django album was imported up to tweet 5
+        self.create_album_image_relation(
+            album=self.album2, image=self.image1, tweet_id=5,
+            tweet_url='http://twitter.com/test/statuses/5')
+        api = FakeTwitterApi([
+            self.make_tweet(1, 'Python'),
+            self.make_tweet(4, 'django', 'python'),
+            self.make_tweet(6, 'django'),
+            self.make_tweet(7, 'html', 'other'),
+            self.make_tweet(8, 'other'),
+        ])
+        imported_pks = import_photos_for_albums(
+            api, [self.album1_name, self.album2_name, self.album3_name])
+        # a single search for all the albums
+        self.assertEqual(len(api.search_calls), 1)
+        # albums that were never imported go first, they need the longest walk
+        self.assertEqual(api.search_calls[0]['q'],
+                         '#html OR #python OR #django filter:images')
+        self.assertNotIn('since_id', api.search_calls[0])
+
+        def imported_tweet_ids(album):
+            return sorted(AlbumImageRelation.objects.filter(
+                album=album, image__pk__in=imported_pks[album.name]
+            ).values_list('tweet_id', flat=True))
+
+        self.assertEqual(imported_tweet_ids(self.album1), [1, 4])
+        self.assertEqual(imported_tweet_ids(self.album2), [6])
+        self.assertEqual(imported_tweet_ids(self.album3), [7])
+
+    def test_failed_import_is_resumed(self):
+        self.create_album_image_relation(
+            album=self.album2, image=self.image1, tweet_id=1,
+            tweet_url='http://twitter.com/test/statuses/1')
+        tweets = [self.make_tweet(tweet_id, 'python', 'django')
+                  for tweet_id in range(2, 8)]
+        album_names = [self.album1_name, self.album2_name]
+        api = FakeTwitterApi(tweets, error=ValueError('boom'), failing_calls={2})
+        with self.assertRaises(ValueError):
+            import_photos_for_albums(api, album_names, limit=3)
+        for album in (self.album1, self.album2):
+            self.assertEqual(sorted(AlbumImageRelation.objects.filter(
+                album=album, tweet_id__gt=1).values_list('tweet_id', flat=True)),
+                [5, 6, 7])
+        # every album resumes the walk from its own since_id
+        api = FakeTwitterApi(tweets)
+        imported_pks = import_photos_for_albums(api, album_names, limit=3)
+        self.assertEqual(len(imported_pks[self.album1_name]), 3)
+        self.assertEqual(len(imported_pks[self.album2_name]), 3)
+        self.assertEqual(sorted((call.get('since_id'), call.get('max_id'))
+                                for call in api.search_calls if 'max_id' in call),
+                         [(None, 4), (1, 4)])
+        self.assertEqual(self.album1.images.count(), 6)
+        self.assertEqual(self.album2.images.count(), 7)
+        self.assertFalse(Album.objects.filter(search_max_id__isnull=False).exists())
+
+    def test_query_groups(self):
+        api = FakeTwitterApi()
+        import_photos_for_albums(
+            api, [self.album1_name, self.album2_name, self.album3_name],
+            max_group_size=2)
+        self.assertEqual(len(api.search_calls), 2)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..jobs import (
+    enqueue_import, claim_job, complete_job, fail_job, renew_lease, run_next_job,
+    run_next_jobs,
+)
+from ..models import Album, ImportJob, ImportNotification
+from ..ratelimit import RateLimitExceeded
+
+from .base import AlbumNamesMixin, FakeTwitterApi, make_tweet
+from .fake_servers import FakeImageServer
+
+
+class ImportJobQueueTestCase(AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        self.album1 = self.create_album(self.album1_name)
+        self.album2 = self.create_album(self.album2_name)
+
+    def test_enqueue_reuses_active_job(self):
+        job1, created1 = enqueue_import(self.album1)
+        job2, created2 = enqueue_import(self.album1)
+        self.assertTrue(created1)
+        self.assertFalse(created2)
+        self.assertEqual(job1.pk, job2.pk)
+        # finished jobs do not block new imports
+        ImportJob.objects.filter(pk=job1.pk).update(status=ImportJob.STATUS_DONE)
+        job3, created3 = enqueue_import(self.album1)
+        self.assertTrue(created3)
+
+    def test_job_is_claimed_only_once(self):
+        job, __ = enqueue_import(self.album1)
+        claimed = claim_job('worker-1')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, ImportJob.STATUS_RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertEqual(claimed.leased_by, 'worker-1')
+        # nothing left for the second worker
+        self.assertIsNone(claim_job('worker-2'))
+
+    def test_expired_lease_is_taken_over(self):
+        job, __ = enqueue_import(self.album1)
+        claimed = claim_job('worker-1')
+        ImportJob.objects.filter(pk=job.pk).update(
+            leased_until=timezone.now() - timedelta(seconds=1))
+        taken_over = claim_job('worker-2')
+        self.assertEqual(taken_over.pk, job.pk)
+        self.assertEqual(taken_over.attempts, 2)
+        # the first worker can't finish the job it does not own anymore
+        self.assertFalse(complete_job(claimed, 1))
+        self.assertTrue(complete_job(taken_over, 1))
+
+    def test_lease_is_renewed(self):
+        job, __ = enqueue_import(self.album1)
+        claimed = claim_job('worker-1', lease_seconds=10)
+        self.assertTrue(renew_lease(claimed, lease_seconds=600))
+        job.refresh_from_db()
+        self.assertGreater(job.leased_until, timezone.now() + timedelta(seconds=500))
+        # nobody can take the job over now
+        ImportJob.objects.filter(pk=job.pk).update(leased_by='worker-2')
+        self.assertFalse(renew_lease(claimed))
+
+    def test_import_is_aborted_when_the_lease_is_lost(self):
+        job, __ = enqueue_import(self.album1)
+
+        class TakeOverApi(FakeTwitterApi):
+
+            def search(self, **kwargs):
+                # the lease expired and another worker claimed the job
+                ImportJob.objects.filter(pk=job.pk).update(leased_by='worker-2')
+                return super(TakeOverApi, self).search(**kwargs)
+
+        # two pages of tweets
+        api = TakeOverApi([make_tweet(i) for i in range(1, 151)])
+        run_next_job('worker-1', api)
+        # the second page is not searched
+        self.assertEqual(len(api.search_calls), 1)
+        job.refresh_from_db()
+        # the job is left to the other worker as it is
+        self.assertEqual(job.status, ImportJob.STATUS_RUNNING)
+        self.assertEqual(job.leased_by, 'worker-2')
+        self.assertEqual(job.attempts, 1)
+        self.assertFalse(ImportNotification.objects.exists())
+
+    def test_not_due_job_is_not_claimed(self):
+        job, __ = enqueue_import(self.album1)
+        ImportJob.objects.filter(pk=job.pk).update(
+            run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(claim_job('worker-1'))
+
+    def test_failed_job_is_retried_then_dead(self):
+        job, __ = enqueue_import(self.album1)
+        ImportJob.objects.filter(pk=job.pk).update(max_attempts=2)
+        claimed = claim_job('worker-1')
+        self.assertEqual(fail_job(claimed, 'error'), ImportJob.STATUS_PENDING)
+        job.refresh_from_db()
+        self.assertGreater(job.run_after, timezone.now())
+        # make it due right away
+        ImportJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        claimed = claim_job('worker-1')
+        self.assertEqual(fail_job(claimed, 'error'), ImportJob.STATUS_DEAD)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DEAD)
+        self.assertEqual(job.last_error, 'error')
+        self.assertIsNone(claim_job('worker-1'))
+
+    def test_run_next_job(self):
+        job, __ = enqueue_import(self.album1)
+        api = FakeTwitterApi()
+        processed = run_next_job('worker-1', api)
+        self.assertEqual(processed.pk, job.pk)
+        self.assertEqual(len(api.search_calls), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertIsNone(run_next_job('worker-1', api))
+
+    def test_run_next_job_failure(self):
+        job, __ = enqueue_import(self.album1)
+        run_next_job('worker-1', FakeTwitterApi(error=ValueError('boom')))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        self.assertIn('boom', job.last_error)
+
+    def test_backfill_job_is_continued_until_completed(self):
+        job, __ = enqueue_import(self.album1, mode=ImportJob.MODE_BACKFILL)
+        api = FakeTwitterApi()
+        run_next_job('worker-1', api)
+        # there are no tweets at all, the history walk is completed right away
+        self.album1.refresh_from_db()
+        self.assertIsNotNone(self.album1.backfill_completed_at)
+        self.assertFalse(ImportJob.objects.filter(
+            status=ImportJob.STATUS_PENDING).exists())
+        # backfill is not blocked by the regular import and vice versa
+        enqueue_import(self.album2)
+        job, created = enqueue_import(self.album2, mode=ImportJob.MODE_BACKFILL)
+        self.assertTrue(created)
+        Album.objects.filter(pk=self.album2.pk).update(backfill_max_id=250)
+        # the chunk ended before the history did, the next chunk is enqueued
+        api = FakeTwitterApi([make_tweet(i) for i in range(1, 300)])
+        with self.settings(IMPORT_SEARCH_MAX_PAGES=1):
+            run_next_job('worker-1', api)
+            run_next_job('worker-1', api)
+        self.assertEqual(ImportJob.objects.filter(
+            album=self.album2, mode=ImportJob.MODE_BACKFILL,
+            status=ImportJob.STATUS_PENDING).count(), 1)
+
+    def test_recent_jobs_are_searched_together(self):
+        enqueue_import(self.album1)
+        enqueue_import(self.album2)
+        enqueue_import(self.album1, mode=ImportJob.MODE_BACKFILL)
+        api = FakeTwitterApi()
+        jobs = run_next_jobs('worker-1', api, batch_size=5)
+        self.assertEqual(sorted(job.album_id for job in jobs),
+                         [self.album1.pk, self.album2.pk])
+        self.assertEqual(len(api.search_calls), 1)
+        self.assertEqual(ImportJob.objects.filter(
+            status=ImportJob.STATUS_DONE).count(), 2)
+        # backfill jobs are processed one by one
+        jobs = run_next_jobs('worker-1', api, batch_size=5)
+        self.assertEqual([job.mode for job in jobs], [ImportJob.MODE_BACKFILL])
+
+
+class InterruptedImportNotificationTestCase(AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        self.album1 = self.create_album(self.album1_name)
+        self.album2 = self.create_album(self.album2_name)
+        self.server = FakeImageServer().start()
+        self.addCleanup(self.server.stop)
+
+    def make_tweets(self, album_name, count):
+        return [make_tweet(i, self.server.get_image_url('{}{}'.format(album_name, i)),
+                           hash_tags=[album_name])
+                for i in range(1, count + 1)]
+
+    def get_notified_images_counts(self, album):
+        return [notification.images.count() for notification in
+                ImportNotification.objects.filter(album=album).order_by('pk')]
+
+    def test_photos_of_failed_import_are_notified(self):
+        job, __ = enqueue_import(self.album1)
+        tweets = self.make_tweets(self.album1_name, 150)
+        # the second page fails
+        run_next_job('worker-1', FakeTwitterApi(
+            tweets, error=ValueError('boom'), failing_calls={2}))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        self.assertEqual(self.get_notified_images_counts(self.album1), [100])
+        # the retry notifies about the rest only
+        ImportJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_next_job('worker-1', FakeTwitterApi(tweets))
+        self.assertEqual(self.get_notified_images_counts(self.album1), [100, 50])
+
+    def test_photos_of_rate_limited_group_import_are_notified(self):
+        enqueue_import(self.album1)
+        enqueue_import(self.album2)
+        tweets = (self.make_tweets(self.album1_name, 150) +
+                  [make_tweet(1000 + i, self.server.get_image_url('b{}'.format(i)),
+                              hash_tags=[self.album2_name]) for i in range(3)])
+        run_next_jobs('worker-1', FakeTwitterApi(
+            tweets, error=RateLimitExceeded('limited', 0), failing_calls={2}),
+            batch_size=2)
+        self.assertEqual(self.get_notified_images_counts(self.album1), [97])
+        self.assertEqual(self.get_notified_images_counts(self.album2), [3])
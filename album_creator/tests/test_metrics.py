@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase
+
+from ..helpers import import_photos_for_album
+from ..jobs import enqueue_import
+from ..metrics import (
+    DOWNLOADED_BYTES, IMPORTED_IMAGES, REGISTRY, SKIPPED_TWEETS, Registry,
+    push_metrics,
+)
+from ..models import ImportJob
+
+from .base import FakeTwitterApi, ImageRelationHelperMixin, make_tweet
+from .fake_servers import FakeImageServer
+
+
+class RegistryTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.counter = self.registry.counter('test_total', 'Test counter.', ('reason', ))
+        self.histogram = self.registry.histogram('test_seconds', 'Test histogram.',
+                                                 buckets=(0.1, 1))
+
+    def test_render(self):
+        self.counter.inc(reason='a "quoted"\nreason')
+        self.counter.inc(2, reason='a "quoted"\nreason')
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(5)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total{reason="a \\"quoted\\"\\nreason"} 3',
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            'test_seconds_sum 5.55',
+            'test_seconds_count 3',
+        ]) + '\n')
+
+    def test_labels_are_checked(self):
+        with self.assertRaises(ValueError):
+            self.counter.inc()
+        with self.assertRaises(ValueError):
+            self.counter.inc(reason='a', other='b')
+
+    def test_merge_snapshots(self):
+        gauge = self.registry.gauge('test_timestamp', 'Test gauge.')
+        self.counter.inc(reason='a')
+        self.histogram.observe(0.5)
+        gauge.set(10)
+        worker_snapshot = self.registry.snapshot()
+        self.counter.inc(reason='b')
+        self.histogram.observe(0.05)
+        gauge.set(5)
+        merged = self.registry.merge_snapshots([self.registry.snapshot(), worker_snapshot,
+                                                {'unknown_total': {(): 1}}])
+        self.assertEqual(merged['test_total'], {('a', ): 2, ('b', ): 1})
+        self.assertEqual(merged['test_seconds'], {(): [[1, 2, 0], 1.05]})
+        self.assertEqual(merged['test_timestamp'], {(): 10})
+        # the merge does not change the snapshots
+        self.assertEqual(worker_snapshot['test_total'], {('a', ): 1})
+
+
+class MetricsViewTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def setUp(self):
+        super(MetricsViewTestCase, self).setUp()
+        self.server = FakeImageServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        super(MetricsViewTestCase, self).tearDown()
+
+    def get_metrics(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode('utf-8').splitlines()
+
+    def get_value(self, metric, **labels):
+        return REGISTRY.snapshot()[metric.name].get(metric.get_key(labels), 0)
+
+    def test_import_is_measured(self):
+        image_url = self.server.get_image_url('new')
+        api = FakeTwitterApi([
+            make_tweet(1, image_url, hash_tags=[self.album1_name]),
+            make_tweet(2, image_url, hash_tags=[self.album1_name]),
+            make_tweet(3, hash_tags=[self.album1_name]),
+        ])
+        imported_images = self.get_value(IMPORTED_IMAGES)
+        duplicates = self.get_value(SKIPPED_TWEETS, reason='duplicate')
+        no_photos = self.get_value(SKIPPED_TWEETS, reason='no_photo')
+        downloaded_bytes = self.get_value(DOWNLOADED_BYTES)
+        self.assertEqual(len(import_photos_for_album(api, self.album1_name)), 1)
+        self.assertEqual(self.get_value(IMPORTED_IMAGES), imported_images + 1)
+        self.assertEqual(self.get_value(SKIPPED_TWEETS, reason='duplicate'), duplicates + 1)
+        self.assertEqual(self.get_value(SKIPPED_TWEETS, reason='no_photo'), no_photos + 1)
+        self.assertGreater(self.get_value(DOWNLOADED_BYTES), downloaded_bytes)
+        lines = self.get_metrics()
+        self.assertIn('# TYPE album_creator_import_stage_seconds histogram', lines)
+        for stage in ('search', 'download', 'storage', 'db_images', 'db_relations',
+                      'thumbnails'):
+            self.assertTrue(any(line.startswith(
+                'album_creator_import_stage_seconds_count{{stage="{}"}} '.format(stage))
+                for line in lines), stage)
+        self.assertTrue(any(line.startswith(
+            'album_creator_album_last_successful_import_timestamp_seconds'
+            '{{album="{}"}} '.format(self.album1_name)) for line in lines))
+
+    def test_queue_depth(self):
+        enqueue_import(self.album1)
+        enqueue_import(self.album2, mode=ImportJob.MODE_BACKFILL)
+        lines = self.get_metrics()
+        self.assertIn('album_creator_import_queue_jobs{status="pending",mode="recent"} 1',
+                      lines)
+        self.assertIn('album_creator_import_queue_jobs{status="pending",mode="backfill"} 1',
+                      lines)
+        self.assertIn('album_creator_import_queue_jobs{status="running",mode="recent"} 0',
+                      lines)
+        self.assertIn('album_creator_pending_notifications 0', lines)
+
+    def test_allowed_ips(self):
+        # the test client connects from 127.0.0.1
+        with self.settings(METRICS_ALLOWED_IPS=('10.0.0.1', )):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 200)
+
+    def test_workers_metrics_are_summed(self):
+        IMPORTED_IMAGES.inc()
+        imported_images = self.get_value(IMPORTED_IMAGES)
+        # two other workers pushed the same values as this process
+        push_metrics('other-host:1')
+        push_metrics('other-host:2')
+        self.assertIn('album_creator_import_images_total {}'.format(imported_images * 3),
+                      self.get_metrics())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from smtplib import SMTPException
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import Image, ImportNotification
+from ..notifications import (
+    claim_album_notifications, get_due_album_pks, queue_import_notification,
+    send_due_notifications,
+)
+
+from .base import AlbumNamesMixin
+
+
+class FailingEmailBackend(EmailBackend):
+
+    def send_messages(self, messages):
+        raise SMTPException('Connection unexpectedly closed')
+
+
+@override_settings(MANAGERS=[('Manager 1', 'manager1@example.com'),
+                             ('Manager 2', 'manager2@example.com')],
+                   IMPORT_NOTIFICATION_DIGEST_WINDOW=300,
+                   IMPORT_NOTIFICATION_MAX_ATTEMPTS=2)
+class ImportNotificationsTestCase(AlbumNamesMixin, TestCase):
+
+    def setUp(self):
+        self.album1 = self.create_album(self.album1_name)
+        self.album2 = self.create_album(self.album2_name)
+        self.images = [
+            Image.objects.create(image_file='uploads/test.jpg',
+                                 original_image_url='http://example.com/{}.jpg'.format(i))
+            for i in range(3)
+        ]
+
+    def queue(self, album, images):
+        return queue_import_notification(album.name, [image.pk for image in images])
+
+    def get_later(self, seconds=301):
+        return timezone.now() + timedelta(seconds=seconds)
+
+    def test_nothing_imported(self):
+        self.assertIsNone(queue_import_notification(self.album1_name, []))
+        self.assertFalse(ImportNotification.objects.exists())
+
+    def test_imports_are_sent_as_a_digest(self):
+        self.queue(self.album1, self.images[:2])
+        self.queue(self.album1, self.images[1:])
+        self.queue(self.album2, self.images[:1])
+        # nothing is sent before the digest window passes
+        self.assertEqual(send_due_notifications('sender-1', EmailBackend()), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(send_due_notifications('sender-1', EmailBackend(),
+                                                now=self.get_later()), 2)
+        # one email for every manager and album
+        self.assertEqual(len(mail.outbox), 4)
+        album1_messages = [message for message in mail.outbox
+                           if self.album1_name in message.subject]
+        self.assertEqual(sorted(message.to[0] for message in album1_messages),
+                         ['manager1@example.com', 'manager2@example.com'])
+        self.assertEqual(album1_messages[0].subject,
+                         '3 new photo(s) has been imported for album python')
+        self.assertEqual(ImportNotification.objects.filter(
+            status=ImportNotification.STATUS_SENT).count(), 3)
+        # sent notifications are not sent again
+        self.assertEqual(send_due_notifications('sender-1', EmailBackend(),
+                                                now=self.get_later()), 0)
+
+    def test_claimed_notifications_are_not_sent_twice(self):
+        self.queue(self.album1, self.images)
+        now = self.get_later()
+        self.assertEqual(len(claim_album_notifications(self.album1.pk, 'sender-1', now=now)), 1)
+        self.assertEqual(claim_album_notifications(self.album1.pk, 'sender-2', now=now), [])
+        self.assertEqual(send_due_notifications('sender-2', EmailBackend(), now=now), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_digest_is_retried_with_backoff(self):
+        self.queue(self.album1, self.images)
+        now = self.get_later()
+        self.assertEqual(send_due_notifications('sender-1', FailingEmailBackend(), now=now), 0)
+        notification = ImportNotification.objects.get()
+        self.assertEqual(notification.status, ImportNotification.STATUS_PENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertIn('Connection unexpectedly closed', notification.last_error)
+        self.assertGreater(notification.send_after, now)
+        # a new import waits for the retry of the album digest
+        self.queue(self.album1, self.images[:1])
+        self.assertEqual(get_due_album_pks(now=self.get_later(330)), [])
+        retry_at = notification.send_after + timedelta(seconds=1)
+        self.assertEqual(get_due_album_pks(now=retry_at), [self.album1.pk])
+        send_due_notifications('sender-1', FailingEmailBackend(), now=retry_at)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, ImportNotification.STATUS_FAILED)
+        self.assertEqual(notification.attempts, 2)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from datetime import datetime
+
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from ..jobs import enqueue_import, run_next_job
+from ..models import ImportJob
+from ..ratelimit import RateLimitExceeded, RateLimitedTwitterApi, SearchRateLimiter
+
+from .base import AlbumNamesMixin, FakeTwitterApi, make_tweet
+from .fake_servers import FakeSearchServer
+
+
+class SearchRateLimiterTestCase(TestCase):
+
+    def test_tokens_are_shared(self):
+        # two workers using the same twitter app
+        limiter1 = SearchRateLimiter('app', max_wait=0)
+        limiter2 = SearchRateLimiter('app', max_wait=0)
+        limiter1.update(2, int(time.time() + 60))
+        limiter1.acquire()
+        limiter2.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            limiter1.acquire()
+        # other apps are not affected
+        SearchRateLimiter('another_app', max_wait=0).acquire()
+
+    def test_last_token_is_taken_once(self):
+        limiter2 = SearchRateLimiter('app', max_wait=0)
+
+        class RacingLimiter(SearchRateLimiter):
+
+            def take_token(self):
+                # another worker takes the token between our read and write
+                limiter2.acquire()
+                return super(RacingLimiter, self).take_token()
+
+        limiter1 = RacingLimiter('app', max_wait=0)
+        limiter1.update(1, int(time.time() + 60))
+        with self.assertRaises(RateLimitExceeded):
+            limiter1.acquire()
+        self.assertEqual(limiter1.get_state()[0], 0)
+
+    def test_expired_window(self):
+        limiter = SearchRateLimiter('app', max_wait=0)
+        limiter.update(0, int(time.time() - 1))
+        self.assertEqual(limiter.get_state(), (None, None))
+        limiter.acquire()
+
+    def test_waits_for_close_reset(self):
+        limiter = SearchRateLimiter('app', max_wait=5)
+        limiter.update(0, time.time() + 0.2)
+        started_at = time.time()
+        limiter.acquire()
+        self.assertGreater(time.time() - started_at, 0.1)
+
+
+class RateLimitedTwitterApiTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeSearchServer(
+            [make_tweet(i) for i in range(1, 6)], rate_limit=2).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get_api(self, app_key='app', max_wait=0):
+        return RateLimitedTwitterApi(
+            self.server.get_api(app_key),
+            limiter=SearchRateLimiter(app_key, max_wait=max_wait),
+            backoff=0.01)
+
+    def test_limit_from_headers(self):
+        api = self.get_api()
+        self.assertEqual(len(api.search(q='#test', count=2)['statuses']), 2)
+        api.search(q='#test', count=2)
+        # the limit is known from the headers, the server is not bothered
+        with self.assertRaises(RateLimitExceeded) as context:
+            api.search(q='#test', count=2)
+        self.assertEqual(self.server.requests_count, 2)
+        self.assertEqual(context.exception.reset_at, self.server.window_reset_at)
+
+    def test_unknown_limit_state(self):
+        # another process used the whole window
+        self.server.window_reset_at = int(time.time() + 60)
+        self.server.window_requests = 2
+        api = self.get_api()
+        with self.assertRaises(RateLimitExceeded) as context:
+            api.search(q='#test')
+        self.assertEqual(self.server.rejected_requests_count, 1)
+        self.assertEqual(context.exception.reset_at, self.server.window_reset_at)
+        # other workers know about it now
+        with self.assertRaises(RateLimitExceeded):
+            self.get_api().search(q='#test')
+        self.assertEqual(self.server.requests_count, 1)
+
+    def test_backoff_until_window_reset(self):
+        self.server.window = 0.5
+        api = self.get_api(max_wait=5)
+        for __ in range(5):
+            api.search(q='#test')
+        self.assertEqual(len(self.server.search_params), 5)
+
+
+class RateLimitedJobTestCase(AlbumNamesMixin, TestCase):
+
+    def test_job_is_deferred_until_reset(self):
+        album = self.create_album(self.album1_name)
+        job, __ = enqueue_import(album)
+        reset_at = int(time.time() + 600)
+        run_next_job('worker-1', FakeTwitterApi(
+            error=RateLimitExceeded('limited', reset_at)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        self.assertEqual(job.attempts, 0)
+        self.assertEqual(job.run_after, datetime.fromtimestamp(reset_at, utc))
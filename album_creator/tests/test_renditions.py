@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from PIL import Image as PILImage
+
+from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import BytesIO
+
+from ..models import Image, Rendition
+from ..thumbnails import pregenerate_thumbnails
+
+from .base import ImageRelationHelperMixin, create_image
+
+
+class RenditionsTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def generate(self, image_instance):
+        pregenerate_thumbnails([image_instance])
+        renditions = list(image_instance.renditions.all())
+        for rendition in renditions:
+            self.addCleanup(rendition.rendition_file.delete, save=False)
+        return renditions
+
+    def test_widths_and_formats(self):
+        renditions = self.generate(self.image1)
+        self.assertEqual(
+            sorted((rendition.format, rendition.width, rendition.height)
+                   for rendition in renditions),
+            [(rendition_format, width, width * 3 // 4)
+             for rendition_format in (Rendition.FORMAT_JPEG, Rendition.FORMAT_WEBP)
+             for width in (200, 400, 800)])
+        for rendition in renditions:
+            rendition.rendition_file.open('rb')
+            try:
+                stored_image = PILImage.open(rendition.rendition_file)
+                self.assertEqual(stored_image.format, rendition.format.upper())
+                self.assertEqual(stored_image.size, (rendition.width, rendition.height))
+            finally:
+                rendition.rendition_file.close()
+
+    def create_sized_image(self, name, size, mode='RGB'):
+        content = BytesIO()
+        create_image(mode=mode, size=size).save(content, 'JPEG')
+        image_instance = Image(original_image_url='http://example.com/{}.jpg'.format(name))
+        image_instance.image_file.save('{}.jpg'.format(name), ContentFile(content.getvalue()))
+        self.addCleanup(image_instance.image_file.delete, save=False)
+        return image_instance
+
+    def test_small_image_is_not_upscaled(self):
+        image_instance = self.create_sized_image('small', (300, 200))
+        renditions = self.generate(image_instance)
+        self.assertEqual({rendition.width for rendition in renditions}, {200})
+        # regenerated renditions replace the previous ones
+        self.assertEqual(len(self.generate(image_instance)), 2)
+        self.assertEqual(image_instance.renditions.count(), 2)
+
+    def test_height_limited_image_is_not_upscaled(self):
+        # wide enough for all the widths, but only 300px high
+        renditions = self.generate(self.create_sized_image('wide', (1000, 300)))
+        self.assertEqual({(rendition.width, rendition.height) for rendition in renditions},
+                         {(200, 150), (400, 300)})
+        # narrower and lower than the smallest rendition
+        renditions = self.generate(self.create_sized_image('narrow', (100, 400)))
+        self.assertEqual({(rendition.width, rendition.height) for rendition in renditions},
+                         {(100, 75)})
+
+    def test_grayscale_image(self):
+        image_instance = self.create_sized_image('gray', (400, 300), mode='L')
+        renditions = self.generate(image_instance)
+        self.assertEqual(
+            sorted((rendition.format, rendition.width) for rendition in renditions),
+            [(Rendition.FORMAT_JPEG, 200), (Rendition.FORMAT_JPEG, 400),
+             (Rendition.FORMAT_WEBP, 200), (Rendition.FORMAT_WEBP, 400)])
+        image_instance.refresh_from_db()
+        self.assertTrue(image_instance.thumbnails_ready)
+
+    def test_failed_renditions_do_not_block_thumbnails(self):
+        renditions = self.generate(self.image1)
+        # a format the renditions can't be written in
+        with self.settings(IMAGE_RENDITION_FORMATS=('unknown', )):
+            self.assertEqual(pregenerate_thumbnails([self.image2]), [self.image2.pk])
+            self.assertEqual(pregenerate_thumbnails([self.image1]), [self.image1.pk])
+        self.image2.refresh_from_db()
+        self.assertTrue(self.image2.thumbnails_ready)
+        # the previous renditions are kept
+        self.assertEqual(set(self.image1.renditions.all()), set(renditions))
+
+    def test_pages_and_api_list_renditions(self):
+        self.create_album_image_relation(
+            album=self.album1, image=self.image1, tweet_id=1,
+            tweet_url='http://twitter.com/test/statuses/1')
+        renditions = self.generate(self.image1)
+        webp_rendition = [rendition for rendition in renditions
+                          if rendition.format == Rendition.FORMAT_WEBP][0]
+        srcset_item = '{} {}w'.format(webp_rendition.rendition_file.url,
+                                      webp_rendition.width)
+        for url in (reverse('album-list'),
+                    reverse('album-detail', kwargs={'album_name': self.album1_name})):
+            response = self.client.get(url)
+            self.assertContains(response, '<source type="image/webp"')
+            self.assertContains(response, srcset_item)
+        response = self.client.get(reverse('album-api:album-images', kwargs={
+            'album_name': self.album1_name}))
+        api_renditions = response.data['results'][0]['image']['renditions']
+        self.assertEqual(len(api_renditions), 6)
+        self.assertIn({
+            'url': 'http://testserver' + webp_rendition.rendition_file.url,
+            'format': 'webp',
+            'width': webp_rendition.width,
+            'height': webp_rendition.height,
+        }, [dict(api_rendition) for api_rendition in api_renditions])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from ..helpers import import_photos_from_tweets
+from ..models import Image
+from ..thumbnails import get_image_thumbnailer, get_thumbnail_aliases, get_thumbnail_url
+
+from .base import ImageRelationHelperMixin, make_tweet
+from .fake_servers import FakeImageServer
+
+
+class ThumbnailsTestCase(ImageRelationHelperMixin, TestCase):
+    created_files = []
+
+    def get_thumbnail_names(self, image_instance):
+        thumbnailer = get_image_thumbnailer(image_instance.image_file)
+        return [thumbnailer.get_thumbnail_name(options)
+                for options in get_thumbnail_aliases().values()]
+
+    def assertThumbnailsExist(self, image_instance):
+        image_instance.refresh_from_db()
+        self.assertTrue(image_instance.thumbnails_ready)
+        thumbnailer = get_image_thumbnailer(image_instance.image_file)
+        for thumbnail_name in self.get_thumbnail_names(image_instance):
+            self.assertTrue(thumbnailer.thumbnail_storage.exists(thumbnail_name))
+            self.addCleanup(thumbnailer.thumbnail_storage.delete, thumbnail_name)
+
+    def test_thumbnails_are_generated_at_import(self):
+        with FakeImageServer() as server:
+            imported_pks = import_photos_from_tweets(
+                [make_tweet(i, server.get_image_url('thumb{}'.format(i)))
+                 for i in range(1, 4)],
+                self.album1)
+        self.assertEqual(len(imported_pks), 3)
+        for image_instance in Image.objects.filter(pk__in=imported_pks):
+            self.addCleanup(image_instance.image_file.delete, save=False)
+            self.assertThumbnailsExist(image_instance)
+
+    def test_pages_do_not_generate_thumbnails(self):
+        self.create_album_image_relation(
+            album=self.album1, image=self.image1, tweet_id=1,
+            tweet_url='http://twitter.com/test/statuses/1')
+        call_command('generate_thumbnails', stdout=StringIO())
+        self.assertThumbnailsExist(self.image1)
+        self.image1.refresh_from_db()
+        for url in (reverse('album-list'),
+                    reverse('album-detail', kwargs={'album_name': self.album1_name})):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertContains(response, get_thumbnail_url(self.image1, 'album_grid'))
+            self.assertFalse([query for query in queries.captured_queries
+                              if 'easy_thumbnails_' in query['sql']])
+
+    def test_not_ready_image_is_served_in_full_size(self):
+        self.assertEqual(get_thumbnail_url(self.image1, 'album_grid'),
+                         self.image1.image_file.url)
+        with self.assertRaises(KeyError):
+            get_thumbnail_url(self.image1, 'unknown')
+
+    def test_backfill_command(self):
+        missing_image = Image.objects.create(
+            image_file='uploads/missing.jpg',
+            original_image_url='http://example.com/missing.jpg')
+        stdout = StringIO()
+        call_command('generate_thumbnails', '--batch-size', '1', stdout=stdout)
+        self.assertIn('Generated thumbnails of 2 image(s), 1 failed', stdout.getvalue())
+        self.assertThumbnailsExist(self.image1)
+        self.assertThumbnailsExist(self.image2)
+        missing_image.refresh_from_db()
+        self.assertFalse(missing_image.thumbnails_ready)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from .. import utils
+from ..clients import get_twitter_client
+from ..utils import (
+    ImageDownloadError, build_hash_tags_query, get_credentials_from_file,
+    get_image_from_url, group_hash_tags,
+)
+
+from .fake_servers import FakeImageServer
+
+
+class GetImageFromUrlTestCase(SimpleTestCase):
+
+    def test_fetch(self):
+        with FakeImageServer() as server:
+            image_file = get_image_from_url(server.get_image_url('photo'))
+        body = server.image_body
+        self.assertEqual(image_file.name, 'photo.jpg')
+        self.assertEqual(image_file.size, len(body))
+        self.assertEqual(image_file.read(), body)
+        self.assertEqual(image_file.checksum, hashlib.sha1(body).hexdigest())
+
+    def test_large_image_is_spooled_to_disk(self):
+        with FakeImageServer(image_size=(2000, 2000)) as server:
+            with self.settings(IMPORT_IMAGE_SPOOL_SIZE=1024):
+                image_file = get_image_from_url(server.get_image_url('photo'))
+        self.assertTrue(image_file.file._rolled)
+        self.assertEqual(image_file.read(), server.image_body)
+
+    def test_rejects_non_images(self):
+        with FakeImageServer(content_type='text/html') as server:
+            with self.assertRaises(ImageDownloadError):
+                get_image_from_url(server.get_image_url('photo'))
+
+    def test_rejects_error_responses(self):
+        # error pages served with an image content type are not images either
+        with FakeImageServer(status=404) as server:
+            with self.assertRaises(ImageDownloadError) as context:
+                get_image_from_url(server.get_image_url('photo'))
+            self.assertFalse(context.exception.transient)
+            server.status = 503
+            with self.assertRaises(ImageDownloadError) as context:
+                get_image_from_url(server.get_image_url('photo'))
+            self.assertTrue(context.exception.transient)
+
+    def test_rejects_large_images(self):
+        with FakeImageServer() as server:
+            max_size = len(server.image_body) - 1
+            # rejected by Content-Length
+            with self.assertRaises(ImageDownloadError):
+                get_image_from_url(server.get_image_url('photo'), max_size=max_size)
+            # rejected while reading the body
+            server.send_content_length = False
+            with self.assertRaises(ImageDownloadError):
+                get_image_from_url(server.get_image_url('photo'), max_size=max_size)
+            self.assertEqual(
+                get_image_from_url(server.get_image_url('photo')).size,
+                len(server.image_body))
+
+    def test_file_is_closed_when_the_body_fails(self):
+        spooled_files = []
+
+        class SpooledFile(tempfile.SpooledTemporaryFile):
+
+            def __init__(self, *args, **kwargs):
+                tempfile.SpooledTemporaryFile.__init__(self, *args, **kwargs)
+                spooled_files.append(self)
+
+        # records the files the downloads are written to
+        self.addCleanup(setattr, utils, 'SpooledTemporaryFile', utils.SpooledTemporaryFile)
+        utils.SpooledTemporaryFile = SpooledFile
+        with FakeImageServer(truncate_body=True) as server:
+            with self.settings(IMPORT_IMAGE_SPOOL_SIZE=1024):
+                with self.assertRaises(ImageDownloadError) as context:
+                    get_image_from_url(server.get_image_url('photo'))
+        self.assertTrue(context.exception.transient)
+        self.assertEqual(len(spooled_files), 1)
+        self.assertTrue(spooled_files[0].closed)
+
+    def test_connections_are_reused(self):
+        with FakeImageServer() as server:
+            for i in range(5):
+                get_image_from_url(server.get_image_url('photo{}'.format(i)))
+        self.assertEqual(server.requests_count, 5)
+        self.assertEqual(server.connections_count, 1)
+
+
+class CredentialsCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        file_descriptor, self.file_path = tempfile.mkstemp(suffix='.json')
+        os.close(file_descriptor)
+        self.write_credentials('app1', mtime=1000)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def write_credentials(self, app_key, mtime):
+        with open(self.file_path, 'w') as credentials_file:
+            json.dump({
+                'app_key': app_key,
+                'app_secret': 'secret',
+                'oauth_token': 'token',
+                'oauth_token_secret': 'token_secret',
+            }, credentials_file)
+        os.utime(self.file_path, (mtime, mtime))
+
+    def test_credentials_are_read_again_when_modified(self):
+        self.assertEqual(get_credentials_from_file(self.file_path)['app_key'], 'app1')
+        # same modification time, cached value is used
+        self.write_credentials('app2', mtime=1000)
+        self.assertEqual(get_credentials_from_file(self.file_path)['app_key'], 'app1')
+        self.write_credentials('app2', mtime=2000)
+        self.assertEqual(get_credentials_from_file(self.file_path)['app_key'], 'app2')
+
+    def test_twitter_client_is_reused(self):
+        client = get_twitter_client(self.file_path)
+        self.assertIs(get_twitter_client(self.file_path), client)
+        self.write_credentials('app3', mtime=3000)
+        new_client = get_twitter_client(self.file_path)
+        self.assertIsNot(new_client, client)
+        self.assertEqual(new_client.api.app_key, 'app3')
+
+
+class GroupHashTagsTestCase(SimpleTestCase):
+
+    def test_group_size(self):
+        hash_tags = ['#a', '#b', '#c', '#d', '#e']
+        self.assertEqual(group_hash_tags(hash_tags, max_group_size=2),
+                         [['#a', '#b'], ['#c', '#d'], ['#e']])
+
+    def test_query_length(self):
+        hash_tags = ['#{}'.format(name) for name in ('a' * 10, 'b' * 10, 'c' * 10)]
+        groups = group_hash_tags(hash_tags, max_group_size=10, max_query_length=40)
+        self.assertEqual(groups, [hash_tags[:2], hash_tags[2:]])
+        self.assertEqual(build_hash_tags_query(groups[0]),
+                         '#aaaaaaaaaa OR #bbbbbbbbbb filter:images')
+        # a hash tag that is too long for any query still gets its own
+        self.assertEqual(group_hash_tags(hash_tags, max_group_size=10,
+                                         max_query_length=5),
+                         [[hash_tag] for hash_tag in hash_tags])
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from calendar import timegm
+from datetime import timedelta
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.http import http_date
+
+from ..models import Album, AlbumImageRelation, Image
+from ..versioning import get_album_version, get_albums_version
+
+from .base import AlbumCacheMixin, AlbumNamesMixin, UserHelperMixin
+
+
+class VersioningTestCase(AlbumCacheMixin, AlbumNamesMixin, UserHelperMixin, TestCase):
+
+    def setUp(self):
+        super(VersioningTestCase, self).setUp()
+        self.album = self.create_album(self.album1_name)
+        self.add_relation(self.album, 1)
+
+    def add_relation(self, album, tweet_id):
+        # the pages only use the stored file names, no files are needed
+        image = Image.objects.create(
+            image_file='uploads/test.jpg',
+            original_image_url='http://example.com/{}.jpg'.format(tweet_id))
+        return AlbumImageRelation.objects.create(
+            album=album, image=image, tweet_id=tweet_id,
+            tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id))
+
+    def get_album(self):
+        return Album.objects.get(pk=self.album.pk)
+
+    def get_urls(self):
+        album_kwargs = {'album_name': self.album.name}
+        return [
+            reverse('album-list'),
+            reverse('album-detail', kwargs=album_kwargs),
+            reverse('album-images-fragment', kwargs=album_kwargs),
+            reverse('album-api:album-list'),
+            reverse('album-api:album-images', kwargs=album_kwargs),
+        ]
+
+    def test_album_version_changes_with_imports(self):
+        version = get_album_version(self.get_album())
+        self.assertEqual(version, get_album_version(self.get_album()))
+        self.assertEqual(version.last_modified, self.get_album().modified_at)
+        relation = self.add_relation(self.album, 2)
+        new_version = get_album_version(self.get_album())
+        self.assertNotEqual(new_version.tag, version.tag)
+        relation.delete()
+        self.assertNotEqual(get_album_version(self.get_album()).tag, new_version.tag)
+
+    def test_albums_version_changes_with_albums_and_imports(self):
+        version = get_albums_version()
+        self.add_relation(self.album, 2)
+        new_version = get_albums_version()
+        self.assertNotEqual(new_version.tag, version.tag)
+        self.assertIsNone(new_version.last_modified)
+        self.create_album(self.album2_name)
+        self.assertNotEqual(get_albums_version().tag, new_version.tag)
+
+    def test_not_modified(self):
+        for url in self.get_urls():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            # strong validator
+            self.assertFalse(etag.startswith('W/'))
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+
+    def test_last_modified(self):
+        list_urls = [reverse('album-list'), reverse('album-api:album-list')]
+        album_urls = [url for url in self.get_urls() if url not in list_urls]
+        for url in album_urls:
+            response = self.client.get(url)
+            self.assertEqual(response['Last-Modified'], http_date(
+                timegm(self.get_album().modified_at.utctimetuple())))
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304, url)
+        # the lists can't tell when an album was deleted
+        for url in list_urls:
+            self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+
+    def test_edits_change_last_modified(self):
+        Album.objects.update(modified_at=timezone.now() - timedelta(hours=1))
+        url = reverse('album-detail', kwargs={'album_name': self.album.name})
+        last_modified = self.client.get(url)['Last-Modified']
+        # renamed in the admin, the imports are not involved
+        album = self.get_album()
+        album.name = self.album2_name
+        album.save()
+        url = reverse('album-detail', kwargs={'album_name': album.name})
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_formats_have_own_etags(self):
+        url = reverse('album-api:album-list')
+        json_response = self.client.get(url, HTTP_ACCEPT='application/json')
+        html_response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertNotEqual(json_response['ETag'], html_response['ETag'])
+        self.assertIn('Accept', json_response['Vary'])
+        response = self.client.get(url, HTTP_ACCEPT='text/html',
+                                   HTTP_IF_NONE_MATCH=json_response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified_without_page_queries(self):
+        url = reverse('album-detail', kwargs={'album_name': self.album.name})
+        etag = self.client.get(url)['ETag']
+        # only the album is loaded for its version
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_import_invalidates(self):
+        etags = [self.client.get(url)['ETag'] for url in self.get_urls()]
+        self.add_relation(self.album, 2)
+        for url, etag in zip(self.get_urls(), etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_pages_depend_on_user(self):
+        url = reverse('album-detail', kwargs={'album_name': self.album.name})
+        etag = self.client.get(url)['ETag']
+        self.client.login(username=self.user_name, password=self.user_password)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Import new photos')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pages_with_messages_are_not_validated(self):
+        self.client.login(username=self.user_name, password=self.user_password)
+        url = reverse('album-detail', kwargs={'album_name': self.album.name})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(
+            reverse('album-import-photos', kwargs={'album_name': self.album.name}))
+        response = self.client.get(response['Location'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Import has been scheduled')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_missing_album(self):
+        for url in (reverse('album-detail', kwargs={'album_name': 'missing'}),
+                    reverse('album-api:album-images', kwargs={'album_name': 'missing'})):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertFalse(response.has_header('ETag'))
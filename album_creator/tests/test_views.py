@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import logging
+
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 
-from ..models import Album, Image, AlbumImageRelation
+from ..models import Album, Image, AlbumImageRelation, ImportJob
 
 from .base import (
-    AlbumNamesMixin, ImageHelperMixin, ImageRelationHelperMixin,
+    AlbumCacheMixin, AlbumNamesMixin, ImageHelperMixin, ImageRelationHelperMixin,
     UserHelperMixin,
 )
 
@@ -58,6 +62,29 @@ class AlbumsListViewTestCase(GetViewUrlHelperMixin,
         response = self.client.get(self.view_url)
         self.assertContains(response, self.album1_name)
 
+    def test_albums_are_rendered_without_per_album_queries(self):
+        for tweet_id, album in enumerate((self.album1, self.album2), start=1):
+            self.create_album_image_relation(
+                album=album,
+                image=self.image1,
+                tweet_id=tweet_id,
+                tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id),
+            )
+        # debug logging of the missing template variables includes the repr of
+        # the context, which evaluates the querysets once more
+        template_logger = logging.getLogger('django.template')
+        self.addCleanup(template_logger.setLevel, template_logger.level)
+        template_logger.setLevel(logging.INFO)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.view_url)
+        self.assertContains(response, '<span class="badge">1</span>', count=2)
+        # thumbnails are looked up in the easy_thumbnails tables
+        album_queries = [query for query in queries.captured_queries
+                         if 'album_creator_' in query['sql']]
+        # the version of the list, the albums count for the paginator, the
+        # page of albums and the renditions of the covers
+        self.assertEqual(len(album_queries), 4)
+
 
 class CreateAlbumViewTestCase(GetViewUrlHelperMixin,
                               UserHelperMixin,
@@ -101,7 +128,8 @@ class CreateAlbumViewTestCase(GetViewUrlHelperMixin,
         self.assertEqual(Album.objects.count(), 0)
 
 
-class AlbumImagesViewTestCase(GetViewUrlHelperMixin,
+class AlbumImagesViewTestCase(AlbumCacheMixin,
+                              GetViewUrlHelperMixin,
                               ImageRelationHelperMixin,
                               TestCase):
     view_name = 'album-detail'
@@ -128,9 +156,59 @@ class AlbumImagesViewTestCase(GetViewUrlHelperMixin,
         self.assertContains(response, tweet_url)
         self.assertContains(response, self.image1.image_file.url)
 
+    def create_relations(self, count):
+        for tweet_id in range(1, count + 1):
+            image = Image.objects.create(
+                image_file=self.image1.image_file.name,
+                original_image_url='http://example.com/{}.jpg'.format(tweet_id))
+            self.create_album_image_relation(
+                album=self.album1,
+                image=image,
+                tweet_id=tweet_id,
+                tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id),
+            )
+
+    def get_page_tweet_urls(self, response):
+        return [relation.tweet_url for relation in response.context['object_list']]
+
+    def test_keyset_pages(self):
+        self.create_relations(5)
+        with self.settings(ALBUM_IMAGES_PAGE_SIZE=2):
+            response = self.client.get(self.view_url)
+            self.assertEqual(self.get_page_tweet_urls(response), [
+                'http://twitter.com/test/statuses/5',
+                'http://twitter.com/test/statuses/4',
+            ])
+            fragment_urls = []
+            while response.context['next_fragment_url']:
+                fragment_urls.append(response.context['next_fragment_url'])
+                # the album, the page and the renditions, no counting
+                with self.assertNumQueries(3):
+                    response = self.client.get(fragment_urls[-1])
+                self.assertNotContains(response, '<h1')
+        self.assertEqual(len(fragment_urls), 2)
+        self.assertEqual(self.get_page_tweet_urls(response),
+                         ['http://twitter.com/test/statuses/1'])
+        self.assertNotContains(response, 'More photos')
+
+    def test_next_page_without_javascript(self):
+        self.create_relations(3)
+        with self.settings(ALBUM_IMAGES_PAGE_SIZE=2):
+            response = self.client.get(self.view_url)
+            self.assertContains(response, 'More photos')
+            response = self.client.get(response.context['next_page_url'])
+        self.assertContains(response, '<h1')
+        self.assertEqual(self.get_page_tweet_urls(response),
+                         ['http://twitter.com/test/statuses/1'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.view_url, {'after': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
 
 class AlbumImportViewTestCase(GetViewUrlHelperMixin,
                               ImageRelationHelperMixin,
+                              UserHelperMixin,
                               TestCase):
     created_files = []
     view_name = 'album-import-photos'
@@ -146,3 +224,16 @@ class AlbumImportViewTestCase(GetViewUrlHelperMixin,
         # when test credentials exist
         self.assertEqual(self.album1.images.count(),
                          album1_images_count)
+
+    def test_import_enqueues_job(self):
+        self.create_user()
+        self.client.login(username=self.user_name,
+                          password=self.user_password)
+        response = self.client.get(self.view_url)
+        self.assertRedirects(response, self.album1.get_absolute_url())
+        self.assertEqual(
+            ImportJob.objects.filter(album=self.album1,
+                                     status=ImportJob.STATUS_PENDING).count(), 1)
+        # second click does not schedule the same import again
+        self.client.get(self.view_url)
+        self.assertEqual(ImportJob.objects.filter(album=self.album1).count(), 1)
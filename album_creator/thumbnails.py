@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.files import get_thumbnailer
+
+from .counters import bump_album_versions
+from .models import Album, Image
+from .renditions import generate_image_renditions, replace_image_renditions
+
+logger = logging.getLogger(__name__)
+
+
+def get_image_thumbnailer(image_file):
+    """
+    :param image_file: Image.image_file field file
+    :return: easy_thumbnails Thumbnailer. Thumbnails keep the extension of the
+    source, so their names only depend on the source name and the options and
+    can be built without opening the source (see get_thumbnail_url)
+    """
+    thumbnailer = get_thumbnailer(image_file)
+    thumbnailer.thumbnail_preserve_extensions = True
+    return thumbnailer
+
+
+def get_thumbnail_aliases():
+    """
+    :return: dict {alias: thumbnail options} of settings.THUMBNAIL_ALIASES
+    generated for every imported image
+    """
+    return aliases.all()
+
+
+def generate_image_thumbnails(image_instance):
+    """
+    Generates and stores the thumbnails of all the aliases for the image. Only
+    the files are touched, so it is safe to call it from several threads.
+    :param image_instance: .models.Image instance
+    :return: int image pk
+    """
+    thumbnailer = get_image_thumbnailer(image_instance.image_file)
+    for alias, options in get_thumbnail_aliases().items():
+        thumbnail = thumbnailer.generate_thumbnail(options)
+        # the storage would pick another name for an existing file
+        thumbnailer.thumbnail_storage.delete(thumbnail.name)
+        thumbnailer.thumbnail_storage.save(thumbnail.name, thumbnail)
+    return image_instance.pk
+
+
+def _generate_image_thumbnails(image_instance):
+    try:
+        generate_image_thumbnails(image_instance)
+    except Exception:
+        logger.warning('Failed to generate thumbnails of image {}'.format(
+            image_instance.pk), exc_info=True)
+        return None
+    # the thumbnails are served without the renditions too
+    try:
+        renditions = generate_image_renditions(image_instance)
+    except Exception:
+        logger.warning('Failed to generate renditions of image {}'.format(
+            image_instance.pk), exc_info=True)
+        renditions = None
+    return image_instance.pk, renditions
+
+
+def pregenerate_thumbnails(images, max_workers=None):
+    """
+    Generates the thumbnails and the renditions (see .renditions) of the images
+    concurrently and marks the images as ready, so the pages never generate the
+    thumbnails while they are rendered. Images whose thumbnails failed are left
+    not ready and logged, images whose renditions failed keep the previous ones.
+    :param images: iterable of .models.Image instances
+    :param max_workers: int number of threads, defaults to
+    settings.IMPORT_THUMBNAIL_CONCURRENCY
+    :return: list of pks of the images that are ready
+    """
+    images = list(images)
+    if not images:
+        return []
+    if max_workers is None:
+        max_workers = getattr(settings, 'IMPORT_THUMBNAIL_CONCURRENCY', 4)
+    pool = ThreadPool(min(max_workers, len(images)))
+    ready_pks = []
+    renditions_pks = []
+    renditions = []
+    try:
+        for result in pool.imap_unordered(_generate_image_thumbnails, images):
+            if result is None:
+                continue
+            ready_pks.append(result[0])
+            if result[1] is not None:
+                renditions_pks.append(result[0])
+                renditions.extend(result[1])
+    finally:
+        pool.close()
+        pool.join()
+    # the database is only used from this thread
+    replace_image_renditions(renditions_pks, renditions)
+    Image.objects.filter(pk__in=ready_pks).update(thumbnails_ready=True)
+    # the pages of the albums now show the thumbnails instead of the originals
+    if ready_pks:
+        bump_album_versions(Album.objects.filter(images__in=ready_pks).distinct())
+    logger.debug('Generated thumbnails of {} image(s)'.format(len(ready_pks)))
+    return ready_pks
+
+
+def get_thumbnail_url(image_instance, alias):
+    """
+    Returns the url of the pregenerated thumbnail, without touching the storage
+    or the database. Images that are not ready yet are served in full size.
+    :param image_instance: .models.Image instance
+    :param alias: str thumbnail alias, see settings.THUMBNAIL_ALIASES
+    :return: str url
+    """
+    options = aliases.get(alias)
+    if options is None:
+        raise KeyError(alias)
+    if not image_instance.thumbnails_ready:
+        return image_instance.image_file.url
+    thumbnailer = get_image_thumbnailer(image_instance.image_file)
+    return thumbnailer.thumbnail_storage.url(thumbnailer.get_thumbnail_name(options))
@@ -3,7 +3,8 @@ from __future__ import unicode_literals
 
 from django.conf.urls import url
 from .views import (
-    CreateAlbumView, AlbumsListView, AlbumImagesView, AlbumImportView,
+    CreateAlbumView, AlbumsListView, AlbumImagesView, AlbumImagesFragmentView,
+    AlbumImportView, AlbumExportJsonView, AlbumExportZipView, MetricsView,
 )
 
 urlpatterns = [
@@ -13,6 +14,14 @@ urlpatterns = [
         name='album-create'),
     url(r'^album/(?P<album_name>[a-zA-Z]+)/$', AlbumImagesView.as_view(),
         name='album-detail'),
+    url(r'^album/(?P<album_name>[a-zA-Z]+)/images/$', AlbumImagesFragmentView.as_view(),
+        name='album-images-fragment'),
     url(r'^album/(?P<album_name>[a-zA-Z]+)/import/$', AlbumImportView.as_view(),
         name='album-import-photos'),
+    url(r'^album/(?P<album_name>[a-zA-Z]+)/export\.jsonl$', AlbumExportJsonView.as_view(),
+        name='album-export-json'),
+    url(r'^album/(?P<album_name>[a-zA-Z]+)/export\.zip$', AlbumExportZipView.as_view(),
+        name='album-export-zip'),
+    url(r'^metrics$', MetricsView.as_view(),
+        name='metrics'),
 ]
@@ -1,27 +1,52 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import hashlib
 import json
+import os
+import threading
+import time
+from tempfile import SpooledTemporaryFile
+
 from twython import Twython
 import requests
+from requests.adapters import HTTPAdapter
 
-from cStringIO import StringIO
+from django.conf import settings
 from django.core.files import File
+from django.utils.six.moves.urllib.parse import parse_qs
+
+from .metrics import DOWNLOADED_BYTES, IMPORT_STAGE_SECONDS
 
 # will be used to build tweet absolute url
 TWEET_URL_TEMPLATE = "https://twitter.com/{user_name}/status/{tweet_id}/"
 
+# size of the chunks the image response body is read with
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+# process wide caches, see get_credentials_from_file and get_http_session
+_credentials_cache = {}
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+
 
 def get_credentials_from_file(file_path):
     """
     Returns a dict with twitter api credentials. Reads them from json file.
+    The parsed file is cached in the process and is read again only when
+    the file modification time changes.
     :param file_path: str absolute path to credentials file
     :return: dict with credentials
     """
-    # since this operation requires disk access it can be optimized
-    # with cache/memoization, should not be an issue for small projects
-    with open(file_path, 'rb') as credentials_file:
-        return json.load(credentials_file)
+    mtime = os.path.getmtime(file_path)
+    cached = _credentials_cache.get(file_path)
+    if cached is None or cached[0] != mtime:
+        with open(file_path, 'rb') as credentials_file:
+            cached = (mtime, json.load(credentials_file))
+        _credentials_cache[file_path] = cached
+    # callers may modify the returned dict
+    return dict(cached[1])
 
 
 def get_twitter_api(credentials):
@@ -43,16 +68,115 @@ def get_twitter_api(credentials):
     return twitter
 
 
-def get_image_from_url(image_url):
+def get_http_session():
+    """
+    Returns the requests session shared by the threads of the current process.
+    The session keeps the connections to every image host alive in a pool,
+    so TCP/TLS setup is not repeated for every image. Forked processes get
+    their own session.
+    :return: requests.Session
+    """
+    pid = os.getpid()
+    session = _http_sessions.get(pid)
+    if session is None:
+        with _http_sessions_lock:
+            session = _http_sessions.get(pid)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=getattr(settings, 'IMPORT_HTTP_POOL_HOSTS', 10),
+                    pool_maxsize=getattr(
+                        settings, 'IMPORT_DOWNLOAD_CONCURRENCY_PER_HOST', 4))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                # sessions inherited from the parent process are dropped
+                _http_sessions.clear()
+                _http_sessions[pid] = session
+    return session
+
+
+class ImageDownloadError(Exception):
+    """
+    Raised when the image can not be fetched or the response is not acceptable.
+    Transient errors (server errors, throttling) may go away if the download is
+    retried later, the others will not.
+    """
+
+    def __init__(self, msg, transient=False):
+        super(ImageDownloadError, self).__init__(msg)
+        self.transient = transient
+
+
+# responses worth retrying: timeouts, throttling and server errors
+TRANSIENT_STATUS_CODES = (408, 429)
+
+
+def get_image_from_url(image_url, max_size=None):
     """
     Fetch the image from original_image_url and return Django file object.
+    The response body is streamed to a spooled temporary file (kept in memory
+    while it is small, moved to disk when it grows) and is hashed on the way.
     :param image_url: str absolute url to image
-    :return: django.core.files.File
+    :param max_size: int maximum accepted image size in bytes, defaults to
+    settings.IMPORT_IMAGE_MAX_SIZE
+    :return: django.core.files.File with extra 'checksum' attribute (sha1 hex digest)
+    :raises ImageDownloadError: if the response is not successful, it is not an
+    image, it is too large or incomplete
     """
-    response = requests.get(image_url)
+    if max_size is None:
+        max_size = getattr(settings, 'IMPORT_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+    started_at = time.time()
+    size = 0
+    response = get_http_session().get(
+        image_url, stream=True,
+        timeout=getattr(settings, 'IMPORT_IMAGE_DOWNLOAD_TIMEOUT', 30))
+    try:
+        # check the headers before the body is read
+        if response.status_code != 200:
+            raise ImageDownloadError(
+                'Unexpected status {} for {}'.format(response.status_code, image_url),
+                transient=(response.status_code in TRANSIENT_STATUS_CODES or
+                           response.status_code >= 500))
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+        if not content_type.lower().startswith('image/'):
+            raise ImageDownloadError(
+                'Unexpected content type "{}" for {}'.format(content_type, image_url))
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > max_size:
+            raise ImageDownloadError('Image {} is too large: {} bytes'.format(
+                image_url, content_length))
+        file_like = SpooledTemporaryFile(
+            max_size=getattr(settings, 'IMPORT_IMAGE_SPOOL_SIZE', 256 * 1024),
+            dir=settings.FILE_UPLOAD_TEMP_DIR)
+        checksum = hashlib.sha1()
+        try:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                # Content-Length may be missing or wrong, check the actual size too
+                if size > max_size:
+                    raise ImageDownloadError('Image {} is too large: over {} bytes'.format(
+                        image_url, max_size))
+                checksum.update(chunk)
+                file_like.write(chunk)
+            # the connection may be closed before the whole body was sent
+            if content_length and content_length.isdigit() and size < int(content_length):
+                raise ImageDownloadError(
+                    'Image {} is incomplete: {} of {} bytes'.format(
+                        image_url, size, content_length),
+                    transient=True)
+        except Exception:
+            # the body could not be read, e.g. the connection was lost
+            file_like.close()
+            raise
+    finally:
+        response.close()
+        IMPORT_STAGE_SECONDS.observe(time.time() - started_at, stage='download')
+        DOWNLOADED_BYTES.inc(size)
+    file_like.seek(0)
     file_name = image_url.split('/')[-1]
-    file_like = StringIO(response.content)
     file_obj = File(file_like, name=file_name)
+    file_obj.size = size
+    file_obj.checksum = checksum.hexdigest()
     return file_obj
 
 
@@ -95,32 +219,148 @@ def get_tweet_url(tweet):
                                      tweet_id=tweet_id)
 
 
-def search_tweets_by_hashtag(api, hash_tag, limit=100, since_id=None, image_only=True):
+def build_search_query(hash_tag, image_only=True):
     """
-    Search twitter for tweets with specific hashtag, if image_only is true - will search
-    for tweets that have photos in it (twitter filtering).
-    :param api: twython api to access twitter (should be authenticated)
+    Builds the search query for the hash tag.
     :param hash_tag: str hash tag for search
-    :param limit: int limit results to this number
-    :param since_id: int tweet id, perform search only on tweets that are older then this id
     :param image_only: bool only search tweets with images
-    :return: dict with statuses .
+    :return: str query
     """
     # build the query to twitter, search for hashtag in any case, if image_only selected - add
     # twitter filtering to the query based on twitter api documentation
     # https://dev.twitter.com/rest/public/search (query operators)
-    query = '{hash_tag}{extra}'.format(
+    return '{hash_tag}{extra}'.format(
         hash_tag=hash_tag,
         extra=' filter:images' if image_only else '')
+
+
+def build_hash_tags_query(hash_tags, image_only=True):
+    """
+    Builds a single search query for several hash tags, matching any of them.
+    :param hash_tags: list of str hash tags
+    :param image_only: bool only search tweets with images
+    :return: str query
+    """
+    return build_search_query(' OR '.join(hash_tags), image_only=image_only)
+
+
+def group_hash_tags(hash_tags, max_group_size, max_query_length=None, image_only=True):
+    """
+    Splits the hash tags into groups that can be searched with a single query
+    (see build_hash_tags_query), keeping the query within the length limit.
+    :param hash_tags: list of str hash tags
+    :param max_group_size: int maximum number of hash tags in a single query
+    :param max_query_length: int maximum query length, defaults to
+    settings.TWITTER_SEARCH_MAX_QUERY_LENGTH
+    :param image_only: bool only search tweets with images
+    :return: list of lists of str hash tags
+    """
+    if max_query_length is None:
+        max_query_length = getattr(settings, 'TWITTER_SEARCH_MAX_QUERY_LENGTH', 500)
+    groups = []
+    group = []
+    for hash_tag in hash_tags:
+        extended_group = group + [hash_tag]
+        query_length = len(build_hash_tags_query(extended_group, image_only=image_only))
+        if group and (len(extended_group) > max_group_size or
+                      query_length > max_query_length):
+            groups.append(group)
+            group = [hash_tag]
+        else:
+            group = extended_group
+    if group:
+        groups.append(group)
+    return groups
+
+
+def get_tweet_hash_tags(tweet):
+    """
+    Extracts the hash tags of the tweet from tweet data received with twitter api.
+    :param tweet: dict with tweet data
+    :return: set of lowercase str hash tags without the '#' sign
+    """
+    entities = tweet.get('entities', {})
+    return set(hash_tag.get('text', '').lower()
+               for hash_tag in entities.get('hashtags', []))
+
+
+def get_next_max_id(search_metadata):
+    """
+    Extracts the max_id of the next (older) search results page from the search
+    metadata. Twitter only provides the 'next_results' when there are more results.
+    :param search_metadata: dict 'search_metadata' of the search results
+    :return: int or None if there are no more pages
+    """
+    next_results = search_metadata.get('next_results')
+    if not next_results:
+        return None
+    max_id = parse_qs(next_results.lstrip('?')).get('max_id')
+    if not max_id:
+        return None
+    return int(max_id[0])
+
+
+def iter_search_pages(api, query, page_size=100, since_id=None, max_id=None,
+                      max_pages=None):
+    """
+    Lazily walks the search results pages from the newest to the oldest tweets,
+    following the max_id cursors until there are no more results (all tweets
+    newer than since_id were returned) or max_pages were fetched.
+    The next page is only requested when the previous one was consumed.
+    :param api: twython api to access twitter (should be authenticated)
+    :param query: str search query, see build_search_query
+    :param page_size: int number of tweets per page
+    :param since_id: int only return tweets newer than this id
+    :param max_id: int only return tweets older than or equal to this id
+    :param max_pages: int maximum number of pages (search requests), no limit if None
+    :return: generator of tuples (list of statuses, int max_id of the next page or
+    None if this is the last page)
+    """
     search_kwargs = {
         'q': query,
-        'count': limit,
+        'count': page_size,
     }
     # limit the search with only recent items
     if since_id:
         search_kwargs['since_id'] = since_id
-    # query the api
-    search_results = api.search(**search_kwargs)
-    # search results will be a dict of 'search_metadata' and 'statuses', where statuses
-    # are actual twitter statuses (dict)
-    return search_results['statuses']
+    pages_count = 0
+    while max_pages is None or pages_count < max_pages:
+        if max_id is not None:
+            search_kwargs['max_id'] = max_id
+        # query the api
+        with IMPORT_STAGE_SECONDS.time(stage='search'):
+            search_results = api.search(**search_kwargs)
+        pages_count += 1
+        # search results will be a dict of 'search_metadata' and 'statuses', where statuses
+        # are actual twitter statuses (dict)
+        statuses = search_results['statuses']
+        max_id = get_next_max_id(search_results.get('search_metadata', {}))
+        if statuses:
+            yield statuses, max_id
+        if not statuses or max_id is None:
+            return
+
+
+def search_tweets_by_hashtag(api, hash_tag, limit=100, since_id=None, image_only=True):
+    """
+    Search twitter for tweets with specific hashtag, if image_only is true - will search
+    for tweets that have photos in it (twitter filtering).
+    Only the first page of the results is returned, see iter_search_pages to get
+    all of them.
+    :param api: twython api to access twitter (should be authenticated)
+    :param hash_tag: str hash tag for search
+    :param limit: int limit results to this number
+    :param since_id: int tweet id, perform search only on tweets that are newer then this id
+    :param image_only: bool only search tweets with images
+    :return: list of statuses.
+    """
+    pages = iter_search_pages(
+        api=api,
+        query=build_search_query(hash_tag, image_only=image_only),
+        page_size=limit,
+        since_id=since_id,
+        max_pages=1,
+    )
+    for statuses, __ in pages:
+        return statuses
+    return []
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+from calendar import timegm
+from collections import namedtuple
+
+from django.contrib import messages
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Album
+
+# tag is a str digest that changes whenever the content changes, last_modified
+# is the datetime of the last change or None if the changes are not dated
+Version = namedtuple('Version', ('tag', 'last_modified'))
+
+
+def make_version(parts, last_modified):
+    """
+    :param parts: iterable of the values the content depends on
+    :param last_modified: datetime or None
+    :return: Version
+    """
+    digest = hashlib.sha1('|'.join('{}'.format(part) for part in parts).encode('utf-8'))
+    return Version(digest.hexdigest(), last_modified)
+
+
+def get_album_version(album):
+    """
+    The version of the album page and of its images, built from the counters
+    kept on the album (see .counters), so it costs no query: Album.version and
+    Album.modified_at are bumped by the imports and by the edits of the album
+    and its images.
+    :param album: .models.Album instance
+    :return: Version
+    """
+    return make_version(
+        (album.pk, album.version, album.name, album.image_count,
+         album.last_tweet_id, album.last_imported_at, album.cover_image_id),
+        album.modified_at)
+
+
+def get_albums_version():
+    """
+    The version of the albums list, with a single aggregate query over the
+    album counters: the list changes when an album is created or deleted or
+    when any album changes. It has no last modified time, the deletions are
+    not dated.
+    :return: Version
+    """
+    values = Album.objects.aggregate(
+        album_count=Count('pk'),
+        max_pk=Max('pk'),
+        version=Sum('version'),
+        image_count=Sum('image_count'),
+        last_tweet_id=Max('last_tweet_id'),
+        last_imported_at=Max('last_imported_at'),
+    )
+    return make_version(
+        (values['album_count'], values['max_pk'], values['version'],
+         values['image_count'], values['last_tweet_id'], values['last_imported_at']),
+        None)
+
+
+class ConditionalGetMixin(object):
+    """
+    Adds strong ETag and Last-Modified headers built from get_version() to the
+    GET responses of the view, and answers the conditional requests of the
+    clients that have the current version with 304 Not Modified before the
+    page is queried and rendered. Works with the Django and the DRF views, the
+    DRF responses depend on the negotiated format (JSON or the browsable API).
+    """
+    # the page differs for the anonymous and the authenticated users and shows
+    # the flash messages
+    vary_on_user = False
+
+    def get_version(self):
+        """
+        :return: Version of the requested content, or None to serve the
+        response without validators
+        """
+        return None
+
+    def get_content_version(self):
+        """
+        :return: get_version(), computed once per request
+        """
+        if not hasattr(self, '_content_version'):
+            self._content_version = self.get_version()
+        return self._content_version
+
+    def get_validators(self):
+        """
+        :return: tuple (str etag, int last modified timestamp or None), or
+        None if the response can't be validated
+        """
+        request = self.request
+        etag_parts = []
+        if self.vary_on_user:
+            # the messages are shown once, the page must be rendered
+            if len(messages.get_messages(request)):
+                return None
+            etag_parts.append(int(request.user.is_authenticated()))
+        accepted_renderer = getattr(request, 'accepted_renderer', None)
+        if accepted_renderer is not None:
+            etag_parts.append(accepted_renderer.format)
+        version = self.get_content_version()
+        if version is None:
+            return None
+        etag_parts.append(version.tag)
+        last_modified = None
+        if version.last_modified is not None:
+            last_modified = timegm(version.last_modified.utctimetuple())
+        return make_version(etag_parts, None).tag, last_modified
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if last_modified is not None and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(last_modified)
+            if not response.has_header('ETag'):
+                response['ETag'] = quote_etag(etag)
+            if getattr(request, 'accepted_renderer', None) is not None:
+                patch_vary_headers(response, ('Accept', ))
+        return response
@@ -1,23 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from operator import itemgetter
-
 from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.core.urlresolvers import reverse
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
 from django.views.generic import ListView, CreateView, View
 
+from .caching import get_or_build
+from .exports import iter_album_json_lines, iter_album_zip
 from .models import Album, AlbumImageRelation
-from .helpers import import_photos_for_album, send_email_notifications
-from .utils import get_credentials_from_file, get_twitter_api
+from .jobs import enqueue_import, get_worker_id
+from .metrics import render_metrics
+from .pagination import InvalidCursor, paginate_timeline
+from .profiling import profile_section
+from .versioning import ConditionalGetMixin, get_album_version, get_albums_version
 
 
-class AlbumsListView(ListView):
-    model = Album
+class AlbumsListView(ConditionalGetMixin, ListView):
+    # counters and the cover are kept on the album, the list is rendered with
+    # a query for the albums and one for the covers renditions
+    queryset = (Album.objects.select_related('cover_image')
+                             .prefetch_related('cover_image__renditions')
+                             .order_by('name'))
     template_name = 'album_creator/album_list.html'
+    paginate_by = getattr(settings, 'ALBUMS_PAGE_SIZE', 12)
+    vary_on_user = True
+
+    def get_version(self):
+        return get_albums_version()
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super(
+            AlbumsListView, self).paginate_queryset(queryset, page_size)
+        # the page is read once, formatting the context (e.g. when a missing
+        # template variable is logged) must not query the albums again
+        page.object_list = list(object_list)
+        return paginator, page, page.object_list, is_paginated
 
 
 class CreateAlbumView(LoginRequiredMixin, CreateView):
@@ -29,34 +54,109 @@ class CreateAlbumView(LoginRequiredMixin, CreateView):
         return reverse('album-detail', kwargs={'album_name': self.object.name})
 
 
-class AlbumImagesView(ListView):
+class AlbumTimelineMixin(ConditionalGetMixin):
+    """
+    Lists the album images from the newest, a page at a time with keyset
+    pagination: ?after= is the cursor of the last image of the previous page.
+    """
     model = AlbumImageRelation
-    template_name = 'album_creator/album_images.html'
+    cursor_query_param = 'after'
+    grid_template_name = 'album_creator/includes/album_images_grid.html'
+    album = None
+
+    def get_album(self):
+        # get the correct album, once for the version and the page
+        if self.album is None:
+            album_name = self.kwargs.get('album_name')
+            self.album = get_object_or_404(Album, name=album_name)
+        return self.album
+
+    def get_version(self):
+        return get_album_version(self.get_album())
 
     def get_queryset(self):
-        qs = super(AlbumImagesView, self).get_queryset()
-        # get the correct album
-        album_name = self.kwargs.get('album_name')
-        album = get_object_or_404(Album, name=album_name)
-        qs = qs.filter(album=album).select_related('image')
-        return qs
+        return (self.get_album().image_relations
+                                .select_related('image')
+                                .prefetch_related('image__renditions'))
+
+    def get_next_page_url(self, view_name, next_cursor):
+        if next_cursor is None:
+            return None
+        return '{}?{}'.format(
+            reverse(view_name, kwargs={'album_name': self.album.name}),
+            urlencode({self.cursor_query_param: next_cursor}))
+
+    def build_grid(self, cursor):
+        """
+        :param cursor: str cursor of the page or None for the first page
+        :return: dict with the rendered grid html of the page and the cursor
+        of the next page
+        """
+        relations, next_cursor = paginate_timeline(
+            self.object_list,
+            cursor=cursor,
+            page_size=getattr(settings, 'ALBUM_IMAGES_PAGE_SIZE', 24),
+        )
+        with profile_section('template'):
+            html = render_to_string(self.grid_template_name, {
+                'object_list': relations,
+                'album_name': self.album.name,
+                # the next chunk is loaded into the page by the script, the full
+                # page is the fallback for browsers without javascript
+                'next_page_url': self.get_next_page_url('album-detail', next_cursor),
+                'next_fragment_url': self.get_next_page_url(
+                    'album-images-fragment', next_cursor),
+            })
+        return {'html': html, 'next_cursor': next_cursor}
+
+    def get_context_data(self, **kwargs):
+        cursor = self.request.GET.get(self.cursor_query_param)
+        # the grid is the same for all the users, it is rendered once for every
+        # version of the album, see .caching
+        try:
+            grid = get_or_build(
+                'album-grid', self.get_content_version(),
+                (self.album.pk, cursor, getattr(settings, 'ALBUM_IMAGES_PAGE_SIZE', 24)),
+                lambda: self.build_grid(cursor))
+        except InvalidCursor:
+            raise Http404('Invalid page')
+        kwargs['grid_html'] = mark_safe(grid['html'])
+        kwargs['album_name'] = self.album.name
+        kwargs['next_page_url'] = self.get_next_page_url('album-detail', grid['next_cursor'])
+        kwargs['next_fragment_url'] = self.get_next_page_url(
+            'album-images-fragment', grid['next_cursor'])
+        # the page shows the cached grid, the whole album queryset is kept out
+        # of the context, formatting it would query all the relations
+        kwargs['object_list'] = []
+        return super(AlbumTimelineMixin, self).get_context_data(**kwargs)
+
+
+class AlbumImagesView(AlbumTimelineMixin, ListView):
+    template_name = 'album_creator/album_images.html'
+    vary_on_user = True
 
     def get_context_data(self, **kwargs):
         user = self.request.user
         # check if user is authenticated, if he is - he can update
         # the album and request the fetch/import from twitter
         kwargs['user_can_import'] = user.is_authenticated()
-        kwargs['album_name'] = self.kwargs.get('album_name')
         return super(AlbumImagesView, self).get_context_data(**kwargs)
 
 
+class AlbumImagesFragmentView(AlbumTimelineMixin, ListView):
+    """
+    The next chunk of the album images grid, appended to the album page as the
+    user scrolls down.
+    """
+
+    def render_to_response(self, context, **response_kwargs):
+        return HttpResponse(context['grid_html'], **response_kwargs)
+
+
 class AlbumImportView(LoginRequiredMixin, View):
     http_method_names = ('get',)
     permission_denied_message = 'Sorry, you have no permissions to do that.,,'
     raise_exception = True
-    email_subject_template_name = 'album_creator/emails/import_notification.subject.txt'
-    email_body_template_name = 'album_creator/emails/import_notification.body.txt'
-    from_email = settings.DEFAULT_FROM_EMAIL
 
     def get_success_url(self):
         return reverse('album-detail', kwargs={'album_name': self.album_name})
@@ -66,29 +166,110 @@ class AlbumImportView(LoginRequiredMixin, View):
         # if there is no such album - return 404
         if album_name is None:
             raise Http404()
+        album = get_object_or_404(Album, name=album_name)
         # album name will be used in get_success_url
         self.album_name = album_name
 
-        # if this setting is not set - fail with 500 error
-        credentials_file_paht = settings.TWITTER_CREDENTIALS_JSON_FILE
-        twitter_credentials = get_credentials_from_file(credentials_file_paht)
-        twitter_api = get_twitter_api(twitter_credentials)
-        imported_photos_pks = import_photos_for_album(
-            api=twitter_api, album_name=album_name, limit=100)
-
-        # if there were new photos imported - send email notifications
-        if imported_photos_pks:
-            # extract email from MANAGERS tuple
-            email_getter = itemgetter(1)
-            managers_emails = list(map(email_getter, settings.MANAGERS))
-            # send notifications
-            send_email_notifications(
-                subject_template_name=self.email_subject_template_name,
-                body_template_name=self.email_body_template_name,
-                album_name=album_name,
-                photo_pks_list=imported_photos_pks,
-                from_email=self.from_email,
-                recipients=managers_emails,
-            )
-
-        return HttpResponseRedirect(self.get_success_url())
\ No newline at end of file
+        # the import itself is done by the import workers, see
+        # run_import_workers management command
+        job, created = enqueue_import(album)
+        if created:
+            messages.info(request, 'Import has been scheduled, new photos will '
+                                   'appear shortly.')
+        else:
+            messages.info(request, 'Import is already in progress.')
+
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class StreamingDownloadView(View):
+    """
+    Streams the content as an attachment, so the memory used does not depend
+    on its size.
+    """
+    http_method_names = ('get', )
+    content_type = None
+    filename = None
+    # iterable of bytes
+    streaming_content = None
+
+    def get_filename(self):
+        if self.filename is None:
+            raise ImproperlyConfigured(
+                '{0} is missing the filename. Define {0}.filename or override '
+                '{0}.get_filename().'.format(self.__class__.__name__))
+        return self.filename
+
+    def get_streaming_content(self):
+        if self.streaming_content is None:
+            raise ImproperlyConfigured(
+                '{0} is missing the content. Define {0}.streaming_content or '
+                'override {0}.get_streaming_content().'.format(self.__class__.__name__))
+        return self.streaming_content
+
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(self.get_streaming_content(),
+                                         content_type=self.content_type)
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+            self.get_filename())
+        return response
+
+
+class AlbumExportMixin(ConditionalGetMixin):
+    """
+    Exports the whole album, a chunk of the timeline at a time, see .exports.
+    """
+    file_extension = None
+    album = None
+
+    def get_album(self):
+        if self.album is None:
+            self.album = get_object_or_404(Album, name=self.kwargs['album_name'])
+        return self.album
+
+    def get_version(self):
+        return get_album_version(self.get_album())
+
+    def get_filename(self):
+        return '{}.{}'.format(self.get_album().name, self.file_extension)
+
+
+class AlbumExportJsonView(AlbumExportMixin, StreamingDownloadView):
+    """
+    The album image relations as JSON lines, the newest first.
+    """
+    content_type = 'application/x-ndjson'
+    file_extension = 'jsonl'
+
+    def get_streaming_content(self):
+        return iter_album_json_lines(self.get_album().pk,
+                                     self.request.build_absolute_uri)
+
+
+class AlbumExportZipView(LoginRequiredMixin, AlbumExportMixin, StreamingDownloadView):
+    """
+    ZIP archive of the stored image files of the album, only for the
+    authenticated users as it reads every image file of the album.
+    """
+    content_type = 'application/zip'
+    file_extension = 'zip'
+
+    def get_streaming_content(self):
+        album = self.get_album()
+        return iter_album_zip(album.pk, album.name)
+
+
+class MetricsView(View):
+    """
+    Import metrics of all the workers in the Prometheus text format, served
+    only to the settings.METRICS_ALLOWED_IPS addresses (e.g. the Prometheus
+    server).
+    """
+    http_method_names = ('get', )
+
+    def get(self, request, *args, **kwargs):
+        allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+        if request.META.get('REMOTE_ADDR') not in allowed_ips:
+            raise PermissionDenied
+        return HttpResponse(render_metrics(worker_id=get_worker_id()),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
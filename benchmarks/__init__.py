@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks for the album_creator import pipeline.
+Run them from the project root, e.g.::
+
+    python -m benchmarks.download_concurrency
+"""
+from __future__ import unicode_literals
+
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
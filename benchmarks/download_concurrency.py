@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how the wall-clock time of the concurrent image download stage scales
+with the concurrency limits. Images are served by a local fake image server
+with artificial latency, so the results do not depend on the network.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import time
+
+from . import setup_django
+
+
+def time_downloads(urls, concurrency, max_per_host):
+    from album_creator.downloads import DownloadFailures, download_images
+
+    started_at = time.time()
+    # the benchmark has no database, the failures are kept in the local memory
+    # cache instead of the shared one
+    results = download_images(urls, max_workers=concurrency,
+                              max_per_host=max_per_host,
+                              failures=DownloadFailures(cache_alias='default'))
+    elapsed = time.time() - started_at
+    assert all(results.values()), 'some downloads failed'
+    return elapsed
+
+
+def print_runs(runs, urls):
+    print('{:>12} {:>9} {:>10} {:>9}'.format(
+        'concurrency', 'per host', 'seconds', 'speedup'))
+    baseline = None
+    for concurrency, max_per_host in runs:
+        elapsed = time_downloads(urls, concurrency, max_per_host)
+        if baseline is None:
+            baseline = elapsed
+        print('{:>12} {:>9} {:>10.3f} {:>8.1f}x'.format(
+            concurrency, max_per_host, elapsed, baseline / elapsed))
+
+
+def run(images_count, latency, concurrency_levels, hosts, per_host_limits):
+    from album_creator.tests.fake_servers import FakeImageServer
+
+    with FakeImageServer(latency=latency) as server:
+        urls = [server.get_image_url('image{}'.format(i), host=hosts[i % len(hosts)])
+                for i in range(images_count)]
+        print('{} images, {:.0f} ms latency, {} host(s)'.format(
+            images_count, latency * 1000, len(hosts)))
+        print_runs([(concurrency, concurrency) for concurrency in concurrency_levels],
+                   urls)
+
+        # all the images on one host, the per host limit caps the downloads
+        # below the concurrency, the first run is not throttled
+        concurrency = max(concurrency_levels)
+        urls = [server.get_image_url('image{}'.format(i), host=hosts[0])
+                for i in range(images_count)]
+        print()
+        print('{} images, {:.0f} ms latency, 1 host'.format(
+            images_count, latency * 1000))
+        print_runs([(concurrency, max_per_host) for max_per_host in
+                    [concurrency] + [limit for limit in per_host_limits
+                                     if limit < concurrency]],
+                   urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every image response')
+    # the same server is reachable under several host names, this is used to
+    # exercise the per host limit
+    parser.add_argument('--hosts', nargs='+', default=['127.0.0.1', 'localhost'],
+                        help='host names the fake image server is reached by')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--max-per-host', type=int, nargs='+', default=[2, 4],
+                        help='per host limits below the highest concurrency, '
+                             'run with all the images on a single host')
+    args = parser.parse_args()
+    setup_django()
+    run(args.images, args.latency, args.concurrency, args.hosts, args.max_per_host)
+
+
+if __name__ == '__main__':
+    main()
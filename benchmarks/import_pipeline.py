@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the photos import. A local fake twitter search server
+serves synthetic tweets (some without photos, some sharing the photos of other
+tweets) and a local fake image host serves the photos, both with artificial
+latency. The albums are imported with import_photos_for_album one by one and
+with the import_albums command, and the throughput, the database queries per
+tweet, the import latency percentiles and the peak memory are reported.
+The import runs against a test database of the given alias, created with the
+migrations and destroyed afterwards, and a temporary MEDIA_ROOT.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import json
+import logging
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from . import setup_django
+
+METRICS = (
+    # name, format, higher is better
+    ('tweets_per_second', '{:.1f}', True),
+    ('images_per_second', '{:.1f}', True),
+    ('queries_per_tweet', '{:.2f}', False),
+    ('latency_p50', '{:.3f}', False),
+    ('latency_p95', '{:.3f}', False),
+    ('peak_rss_mb', '{:.1f}', False),
+)
+
+
+def make_statuses(image_server, tweets_count, media_ratio, duplicate_ratio, seed=0):
+    """
+    :param image_server: FakeImageServer the photos are served by
+    :param tweets_count: int number of tweets
+    :param media_ratio: float share of the tweets with a photo
+    :param duplicate_ratio: float share of the photos that were already posted in
+    another tweet
+    :param seed: int random seed, the same arguments give the same tweets
+    :return: list of tweets dicts
+    """
+    from album_creator.tests.base import make_tweet
+
+    generator = random.Random(seed)
+    image_urls = []
+    statuses = []
+    for tweet_id in range(1, tweets_count + 1):
+        image_url = None
+        if generator.random() < media_ratio:
+            if image_urls and generator.random() < duplicate_ratio:
+                image_url = generator.choice(image_urls)
+            else:
+                image_url = image_server.get_image_url('image{}'.format(tweet_id))
+                image_urls.append(image_url)
+        statuses.append(make_tweet(tweet_id, image_url))
+    return statuses
+
+
+def percentile(values, percent):
+    """
+    :param values: list of numbers
+    :param percent: int 0..100
+    :return: the nearest-rank percentile, None for no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(round(percent / 100 * (len(values) - 1)))
+    return values[rank]
+
+
+def get_peak_rss_mb():
+    """
+    :return: float peak resident set size of this process and its finished
+    children, in megabytes
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on linux, bytes on mac os
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def reset_albums(album_names):
+    from album_creator.models import Album, Image
+
+    Image.objects.all().delete()
+    Album.objects.all().delete()
+    Album.objects.bulk_create([Album(name=album_name) for album_name in album_names])
+
+
+def summarize(tweets_count, images_count, queries_count, elapsed, latencies):
+    return {
+        'tweets': tweets_count,
+        'images': images_count,
+        'seconds': elapsed,
+        'tweets_per_second': tweets_count / elapsed,
+        'images_per_second': images_count / elapsed,
+        'queries_per_tweet': (queries_count / tweets_count
+                              if queries_count is not None else None),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+
+def run_album_imports(search_server, album_names, tweets_count):
+    """
+    Imports the albums one by one with import_photos_for_album, the latency is
+    the duration of a single album import.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from album_creator.helpers import import_photos_for_album
+
+    api = search_server.get_api()
+    latencies = []
+    images_count = 0
+    started_at = time.time()
+    with CaptureQueriesContext(connection) as queries:
+        for album_name in album_names:
+            album_started_at = time.time()
+            images_count += len(import_photos_for_album(api=api, album_name=album_name))
+            latencies.append(time.time() - album_started_at)
+    return summarize(tweets_count * len(album_names), images_count,
+                     len(queries.captured_queries), time.time() - started_at, latencies)
+
+
+def run_import_command(search_server, album_names, tweets_count, workers):
+    """
+    Imports the albums with the import_albums command, the latency is the
+    duration of a single album import as reported by the command.
+    """
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils.six import StringIO
+    from album_creator.management.commands import import_albums
+    from album_creator.models import AlbumImageRelation
+
+    summaries = []
+    original_write_summary = import_albums.Command.write_summary
+    original_build_client = import_albums.build_twitter_client_pool
+
+    def write_summary(command, summary):
+        # called in this process for the imports of all the workers
+        summaries.append(summary)
+        original_write_summary(command, summary)
+    import_albums.build_twitter_client_pool = search_server.get_api
+    import_albums.Command.write_summary = write_summary
+    started_at = time.time()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_albums', workers=workers, stdout=StringIO())
+    finally:
+        import_albums.Command.write_summary = original_write_summary
+        import_albums.build_twitter_client_pool = original_build_client
+    elapsed = time.time() - started_at
+    # the imports of the worker processes are not seen from here
+    queries_count = len(queries.captured_queries) if workers <= 1 else None
+    return summarize(tweets_count * len(album_names),
+                     AlbumImageRelation.objects.count(), queries_count, elapsed,
+                     [summary['elapsed'] for summary in summaries])
+
+
+def run(database, albums_count, tweets_count, media_ratio, duplicate_ratio,
+        search_latency, image_latency, workers):
+    from django.db import connections
+    from django.test.utils import override_settings
+    from album_creator.tests.fake_servers import FakeImageServer, FakeSearchServer
+
+    # the import logs every tweet and the queries are logged while they are
+    # counted, that would be measured too
+    for logger_name in ('album_creator.helpers', 'album_creator.jobs',
+                        'django.db.backends'):
+        logging.getLogger(logger_name).setLevel(logging.WARNING)
+    connection = connections[database]
+    if workers > 1 and connection.vendor == 'sqlite':
+        # the in-memory test database is not shared with the forked workers
+        print('SQLite test database is in memory, using a single worker')
+        workers = 1
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    media_root = tempfile.mkdtemp()
+    album_names = ['album{}'.format('abcdefghijklmnopqrstuvwxyz'[i % 26] * (i // 26 + 1))
+                   for i in range(albums_count)]
+    results = {
+        'vendor': connection.vendor,
+        'albums': albums_count,
+        'tweets': tweets_count,
+        'media_ratio': media_ratio,
+        'duplicate_ratio': duplicate_ratio,
+        'search_latency': search_latency,
+        'image_latency': image_latency,
+        'workers': workers,
+    }
+    try:
+        with FakeImageServer(latency=image_latency) as image_server:
+            statuses = make_statuses(image_server, tweets_count, media_ratio,
+                                     duplicate_ratio)
+            search_server = FakeSearchServer(statuses, latency=search_latency,
+                                             rate_limit=10 ** 6)
+            # all the tweets are searched, a hundred per page
+            with search_server, override_settings(
+                    MEDIA_ROOT=media_root,
+                    IMPORT_SEARCH_MAX_PAGES=tweets_count // 100 + 1):
+                for name, run_scenario in (
+                        ('import_photos_for_album',
+                         lambda: run_album_imports(search_server, album_names,
+                                                   tweets_count)),
+                        ('import_albums',
+                         lambda: run_import_command(search_server, album_names,
+                                                    tweets_count, workers))):
+                    reset_albums(album_names)
+                    print('{}:'.format(name))
+                    results[name] = run_scenario()
+                    for metric, metric_format, __ in METRICS:
+                        value = results[name][metric]
+                        print('  {:<20} {}'.format(
+                            metric, 'n/a' if value is None else metric_format.format(value)))
+        return results
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def compare(results, baseline):
+    """
+    Prints the relative change of the metrics from the baseline results.
+    """
+    print('Compared to the baseline:')
+    for name in ('import_photos_for_album', 'import_albums'):
+        if name not in results or name not in baseline:
+            continue
+        print('{}:'.format(name))
+        for metric, __, higher_is_better in METRICS:
+            value, baseline_value = results[name][metric], baseline[name].get(metric)
+            if not value or not baseline_value:
+                continue
+            change = (value - baseline_value) / baseline_value * 100
+            better = (change > 0) == higher_is_better
+            print('  {:<20} {:+.1f}% ({})'.format(
+                metric, change, 'better' if better else 'worse'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', default='default',
+                        help='alias of the database to benchmark')
+    parser.add_argument('--albums', type=int, default=5)
+    parser.add_argument('--tweets', type=int, default=200,
+                        help='number of tweets found by every search')
+    parser.add_argument('--media-ratio', type=float, default=0.8,
+                        help='share of the tweets with a photo')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1,
+                        help='share of the photos posted in several tweets')
+    parser.add_argument('--search-latency', type=float, default=0.05,
+                        help='seconds added to every search response')
+    parser.add_argument('--image-latency', type=float, default=0.02,
+                        help='seconds added to every image response')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes of the import_albums command')
+    parser.add_argument('--output', default=None,
+                        help='file to write the results to as JSON')
+    parser.add_argument('--compare', default=None, metavar='RESULTS_FILE',
+                        help='results of a previous run to compare with')
+    args = parser.parse_args()
+    setup_django()
+    results = run(args.database, args.albums, args.tweets, args.media_ratio,
+                  args.duplicate_ratio, args.search_latency, args.image_latency,
+                  args.workers)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(results, json.load(baseline_file))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
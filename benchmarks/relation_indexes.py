@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the album timeline queries on a large number of album image relations
+with and without the (album, tweet_id) and (album, imported_at) indexes, and
+prints their query plans.
+The relations are seeded into a test database of the given alias, created with
+the migrations and destroyed afterwards, so the benchmark runs against the same
+database engine as the project: point DJANGO_SETTINGS_MODULE to settings with a
+PostgreSQL database to benchmark PostgreSQL.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import time
+
+from . import setup_django
+
+# rows are inserted in transactions of this size, with multi-row INSERTs of
+# INSERT_BATCH_SIZE rows (SQLite limits the number of terms in a statement)
+SEED_BATCH_SIZE = 5000
+INSERT_BATCH_SIZE = 500
+
+
+def seed(albums_count, relations_count):
+    from django.db import transaction
+    from album_creator.models import Album, AlbumImageRelation, Image
+
+    images_count = relations_count // albums_count
+    Album.objects.bulk_create([Album(name='album{}'.format(i))
+                               for i in range(albums_count)])
+    album_pks = list(Album.objects.order_by('pk').values_list('pk', flat=True))
+    Image.objects.bulk_create([
+        Image(image_file='uploads/{}.jpg'.format(i),
+              original_image_url='http://example.com/{}.jpg'.format(i))
+        for i in range(images_count)
+    ], batch_size=INSERT_BATCH_SIZE)
+    image_pks = list(Image.objects.order_by('pk').values_list('pk', flat=True))
+    relations = []
+    # tweets of the albums are interleaved, like they are in the real searches
+    for image_number, image_pk in enumerate(image_pks):
+        for album_number, album_pk in enumerate(album_pks):
+            tweet_id = image_number * albums_count + album_number
+            relations.append(AlbumImageRelation(
+                album_id=album_pk, image_id=image_pk, tweet_id=tweet_id,
+                tweet_url='http://twitter.com/test/statuses/{}'.format(tweet_id)))
+        if len(relations) >= SEED_BATCH_SIZE:
+            with transaction.atomic():
+                AlbumImageRelation.objects.bulk_create(relations,
+                                                       batch_size=INSERT_BATCH_SIZE)
+            relations = []
+    AlbumImageRelation.objects.bulk_create(relations, batch_size=INSERT_BATCH_SIZE)
+    return album_pks
+
+
+def get_queries(album_pk, page_size, cursor_tweet_id):
+    from album_creator.models import AlbumImageRelation
+    from album_creator.pagination import get_timeline_queryset, make_cursor
+
+    relations = AlbumImageRelation.objects.filter(album_id=album_pk)
+    # the pages are read like paginate_timeline reads them, with the extra row
+    # and the (tweet_id, pk) keyset predicate after the cursor
+    cursor = make_cursor(get_timeline_queryset(relations).filter(
+        tweet_id__lte=cursor_tweet_id)[0])
+    return [
+        ('last imported tweet (since_id)',
+         relations.order_by('-tweet_id').values_list('tweet_id')[:1]),
+        ('timeline page',
+         get_timeline_queryset(relations.select_related('image'))[:page_size + 1]),
+        ('timeline page after a cursor',
+         get_timeline_queryset(relations.select_related('image'),
+                               cursor)[:page_size + 1]),
+        ('recently imported',
+         relations.order_by('-imported_at')[:page_size]),
+    ]
+
+
+def explain(connection, queryset):
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN ANALYZE '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [' '.join(map(str, row)) for row in cursor.fetchall()]
+
+
+def measure(queryset, repeat):
+    timings = []
+    for __ in range(repeat):
+        started_at = time.time()
+        list(queryset._clone())
+        timings.append(time.time() - started_at)
+    return min(timings)
+
+
+def run_queries(connection, album_pk, page_size, cursor_tweet_id, repeat):
+    results = []
+    for name, queryset in get_queries(album_pk, page_size, cursor_tweet_id):
+        result = {
+            'query': name,
+            'seconds': measure(queryset, repeat),
+            'plan': explain(connection, queryset),
+        }
+        print('  {:<32} {:>9.3f} ms'.format(name, result['seconds'] * 1000))
+        for line in result['plan']:
+            print('    {}'.format(line))
+        results.append(result)
+    return results
+
+
+def run(database, albums_count, relations_count, page_size, repeat):
+    from django.db import connections
+    from album_creator.models import AlbumImageRelation
+
+    connection = connections[database]
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print('Seeding {} relations for {} albums ({})'.format(
+            relations_count, albums_count, connection.vendor))
+        started_at = time.time()
+        album_pks = seed(albums_count, relations_count)
+        print('Seeded in {:.1f}s'.format(time.time() - started_at))
+        # the album in the middle of the table, paged from the middle of its timeline
+        album_pk = album_pks[len(album_pks) // 2]
+        cursor_tweet_id = relations_count // 2
+        index_together = AlbumImageRelation._meta.index_together
+        results = {
+            'vendor': connection.vendor,
+            'albums': albums_count,
+            'relations': relations_count,
+        }
+        for key, old_index_together, new_index_together in (
+                ('before', index_together, []),
+                ('after', [], index_together)):
+            with connection.schema_editor() as schema_editor:
+                schema_editor.alter_index_together(
+                    AlbumImageRelation, old_index_together, new_index_together)
+            # refresh the planner statistics
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            print('{} the timeline indexes:'.format(
+                'With' if new_index_together else 'Without'))
+            results[key] = run_queries(connection, album_pk, page_size,
+                                       cursor_tweet_id, repeat)
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', default='default',
+                        help='alias of the database to benchmark')
+    parser.add_argument('--albums', type=int, default=100)
+    parser.add_argument('--relations', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='the best of this number of runs is reported')
+    parser.add_argument('--output', default=None,
+                        help='file to write the results to as JSON')
+    args = parser.parse_args()
+    setup_django()
+    results = run(args.database, args.albums, args.relations, args.page_size,
+                  args.repeat)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -23,8 +23,121 @@ STATICFILES_DIRS = (
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 FILE_UPLOAD_TEMP_DIR = mkdtemp()
 
+# the tests store their files in a temporary MEDIA_ROOT
+TEST_RUNNER = 'album_creator.tests.runner.TemporaryMediaRootTestRunner'
+
 # path to default twitter credentials json file
 TWITTER_CREDENTIALS_JSON_FILE = os.path.join(BASE_DIR, 'default_twitter_credentials.json')
+# to multiply the search rate limit use several twitter apps: list their
+# credentials files and/or put them to a directory, see album_creator.clients
+TWITTER_CREDENTIALS_JSON_FILES = []
+TWITTER_CREDENTIALS_DIR = None
+
+# import jobs queue, see album_creator.jobs
+IMPORT_JOB_LEASE_SECONDS = 300
+IMPORT_JOB_MAX_ATTEMPTS = 5
+IMPORT_JOB_RETRY_DELAY = 60
+IMPORT_JOB_MAX_RETRY_DELAY = 3600
+IMPORT_JOB_POLL_INTERVAL = 5
+
+# maximum number of twitter search requests (result pages) per import job
+IMPORT_SEARCH_MAX_PAGES = 10
+# hash tags of several albums are searched with a single query, up to this
+# number of them and within the query length limit
+IMPORT_SEARCH_HASHTAGS_PER_QUERY = 10
+TWITTER_SEARCH_MAX_QUERY_LENGTH = 500
+
+# seconds a worker may wait for the rate limit window reset, jobs that would
+# have to wait longer are deferred until the reset
+TWITTER_RATE_LIMIT_MAX_WAIT = 0
+# retries of the search requests rejected with 429 status, with jittered
+# exponential backoff starting at TWITTER_RATE_LIMIT_BACKOFF seconds
+TWITTER_RATE_LIMIT_RETRIES = 3
+TWITTER_RATE_LIMIT_BACKOFF = 1.0
+
+# simultaneous image downloads during an import, in total and per image host
+IMPORT_DOWNLOAD_CONCURRENCY = 8
+IMPORT_DOWNLOAD_CONCURRENCY_PER_HOST = 4
+# number of image hosts keep-alive connections are pooled for
+IMPORT_HTTP_POOL_HOSTS = 10
+# images larger than this are rejected, smaller than the spool size are kept
+# in memory while downloading, larger ones are streamed to FILE_UPLOAD_TEMP_DIR
+IMPORT_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+IMPORT_IMAGE_SPOOL_SIZE = 256 * 1024
+IMPORT_IMAGE_DOWNLOAD_TIMEOUT = 30
+# retries of the downloads failed with transient errors (connection errors,
+# timeouts, 5xx), with jittered exponential backoff starting at
+# IMPORT_DOWNLOAD_RETRY_BACKOFF seconds
+IMPORT_DOWNLOAD_RETRIES = 2
+IMPORT_DOWNLOAD_RETRY_BACKOFF = 0.5
+# failed image urls are skipped for a day (404, not an image) or for ten
+# minutes (transient errors), up to IMPORT_FAILED_URLS_PER_HOST urls of a host,
+# the failing hosts for IMPORT_HOST_COOLDOWN seconds after
+# IMPORT_HOST_FAILURE_THRESHOLD transient errors within
+# IMPORT_HOST_FAILURE_WINDOW seconds
+IMPORT_DOWNLOAD_FAILURE_CACHE = 'shared'
+IMPORT_FAILED_URL_TIMEOUT = 24 * 60 * 60
+IMPORT_FAILED_URL_TRANSIENT_TIMEOUT = 10 * 60
+IMPORT_FAILED_URLS_PER_HOST = 1000
+IMPORT_HOST_FAILURE_THRESHOLD = 5
+IMPORT_HOST_FAILURE_WINDOW = 60
+IMPORT_HOST_COOLDOWN = 5 * 60
+
+# thumbnails generated for every imported image, see album_creator.thumbnails
+THUMBNAIL_ALIASES = {
+    '': {
+        'album_grid': {'size': (400, 300), 'crop': True},
+    },
+}
+# responsive renditions of every imported image: crops of this aspect ratio
+# in several widths and formats, see album_creator.renditions
+IMAGE_RENDITION_WIDTHS = (200, 400, 800)
+IMAGE_RENDITION_FORMATS = ('webp', 'jpeg')
+IMAGE_RENDITION_ASPECT_RATIO = (4, 3)
+IMAGE_RENDITION_QUALITY = 80
+# simultaneous thumbnail generations during an import
+IMPORT_THUMBNAIL_CONCURRENCY = 4
+
+# album pages sizes, the album images are loaded in chunks of this size as the
+# page is scrolled
+ALBUMS_PAGE_SIZE = 12
+ALBUM_IMAGES_PAGE_SIZE = 24
+
+# REST API pages sizes, see album_creator.api, the clients may ask for smaller
+# or larger pages with ?page_size= (up to 100)
+API_ALBUMS_PAGE_SIZE = 20
+API_ALBUM_IMAGES_PAGE_SIZE = 50
+# number of the newest images listed with every album, ?images_limit=
+API_ALBUM_IMAGES_LIMIT = 10
+API_ALBUM_IMAGES_MAX_LIMIT = 100
+
+# rendered album grids and serialized REST API pages are cached by the album
+# version, see album_creator.caching, use a cache shared by all the processes
+# in production so a page is built once after an import
+ALBUM_CACHE = 'default'
+ALBUM_CACHE_TIMEOUT = 24 * 60 * 60
+# seconds the requests wait for another one building the same page
+ALBUM_CACHE_LOCK_WAIT = 5
+ALBUM_CACHE_LOCK_TIMEOUT = 30
+
+# album exports stream the image relations in chunks of this size, see
+# album_creator.exports
+ALBUM_EXPORT_CHUNK_SIZE = 500
+
+# import notifications are sent by the send_notifications command, the
+# imports of an album within the window (seconds) are sent as a single digest,
+# failed digests are retried with exponential backoff
+IMPORT_NOTIFICATION_DIGEST_WINDOW = 300
+IMPORT_NOTIFICATION_MAX_ATTEMPTS = 5
+IMPORT_NOTIFICATION_RETRY_DELAY = 60
+IMPORT_NOTIFICATION_MAX_RETRY_DELAY = 3600
+
+# import metrics of the worker processes are pushed to this cache and exposed
+# by the /metrics view, those of the stopped workers expire after the timeout
+METRICS_CACHE = 'shared'
+METRICS_SNAPSHOT_TIMEOUT = 24 * 60 * 60
+# client addresses the /metrics view answers to, the others get 403 Forbidden
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
 
 MANAGERS = [
     ('Kyrylo Kniazev', 'test@example.com'),
@@ -65,6 +178,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    # only used with REQUEST_PROFILING, see below
+    'album_creator.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -109,6 +224,30 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+# The 'shared' cache must be visible to all the web and worker processes,
+# create its table with 'python manage.py createcachetable'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'album_creator_cache',
+    },
+}
+
+
+# Request profiling, see album_creator.profiling: the responses get the
+# Server-Timing header with the queries count and the time spent in the
+# database, the templates and the serializers, a sample of the requests is
+# logged as well
+REQUEST_PROFILING = False
+REQUEST_PROFILING_LOG_SAMPLE_RATE = 0.01
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -180,6 +319,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'album_creator.jobs': {
+            'handlers': ['import_console', 'import_file'],
+            'level': 'DEBUG',
+            'propagate': True,
+        },
 
     },
 }
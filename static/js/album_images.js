@@ -0,0 +1,31 @@
+/*
+ * Infinite scroll of the album images: when the "More photos" link comes into
+ * view the next chunk of the grid is loaded from its fragment url and the link
+ * is replaced with it. The link itself leads to the next page without javascript.
+ */
+(function ($) {
+    var loading = false;
+
+    function loadNextChunk() {
+        var $next = $('.albm-photo-creator-next');
+        if (loading || !$next.length) {
+            return;
+        }
+        // start loading a screen before the link is reached
+        if ($next.offset().top - $(window).scrollTop() > 2 * $(window).height()) {
+            return;
+        }
+        loading = true;
+        $.get($next.find('a').data('fragment-url')).done(function (html) {
+            $next.replaceWith(html);
+            loading = false;
+            loadNextChunk();
+        }).fail(function () {
+            // leave the link for the user to follow
+            $next.removeClass('albm-photo-creator-next');
+        });
+    }
+
+    $(window).on('scroll resize', loadNextChunk);
+    $(loadNextChunk);
+})(jQuery);